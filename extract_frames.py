@@ -20,13 +20,12 @@ if __name__ == '__main__':
 
     image_dir = args.images
     # Save images to image_dir in the format document_id.frame_number.png with leading zeros
-    images = []
+    # Collect frame numbers from every timeframe first, so the video is opened and read through once
+    frame_nums = []
     for timeframe in annotations:
-        frame_nums = vdh.sample_frames(timeframe.get_property('start'), timeframe.get_property('end'), 15)
-        frames = vdh.extract_frames_as_images(vd, frame_nums)
-        # Add frame_num, frame to images
-        for frame_num, frame in zip(frame_nums, frames):
-            images.append((frame_num, frame))
+        frame_nums.extend(vdh.sample_frames(timeframe.get_property('start'), timeframe.get_property('end'), 15))
+    frames = vdh.extract_frames_as_images(vd, frame_nums)
+    images = list(zip(frame_nums, frames))
 
     for frame_num, frame in images:
         frame = Image.fromarray(frame)
@@ -0,0 +1,82 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.clean_ocr import clean_ocr, clean_ocr_batch
+
+# Words OCR output is made of, plus the edge cases of clean_ocr's rules: every kind of
+# whitespace, '&', digits and numerics that are not letters ('½', '²', Roman numerals), '_'
+WORDS = ["NEWS", "Reporter", "WGBH", "Boston", "Jim", "Lehrer", "PBS", "LIVE", "Washington", "a", "I",
+         "O'Brien", "re-run", "12", "1987", "-", "|"]
+ODD = ["&", "&&", "A&", "&B", "3.5", "½", "x²", "Ⅻ", "_", "__", "a_", "--", "·", ":", "naïve", "Ça", "東京", "ß",
+       "Ωmega"]
+SPACES = [" ", "  ", "\t", "\n", "\n\n", "\r", "\r\n", "\x0b", "\x0c", "\x1c", "\x85", "\xa0", " ", "　"]
+
+
+def synthetic_text(rng: random.Random, odd: float = 0.4) -> str:
+    """
+    A short OCR-like string of words separated by spaces and newlines; with probability
+    `odd`, each word is instead an edge case, each separator other whitespace, and each
+    text may end in random characters.
+    """
+    parts = []
+    for _ in range(rng.randint(0, 12)):
+        parts.append(rng.choice(ODD if rng.random() < odd else WORDS))
+        if rng.random() < odd:
+            parts.append(rng.choice(SPACES))
+        else:
+            parts.append("\n" if rng.random() < 0.2 else " ")
+    if rng.random() < odd / 4:
+        parts.append("".join(chr(rng.randint(0x20, 0x3000)) for _ in range(rng.randint(1, 6))))
+    return "".join(parts)
+
+
+def check_parity(texts: list) -> int:
+    """Asserts clean_ocr_batch equals clean_ocr on every text; returns the number of texts checked."""
+    expected = [clean_ocr(text) for text in texts]
+    actual = clean_ocr_batch(pd.Series(texts)).tolist()
+    for text, e, a in zip(texts, expected, actual):
+        assert e == a, f"{text!r}: clean_ocr gives {e!r}, clean_ocr_batch gives {a!r}"
+    return len(texts)
+
+
+def main(rows, seed):
+    rng = random.Random(seed)
+
+    # Every code point on its own, doubled, next to a letter, and after a '&' line
+    characters = [chr(c) for c in range(sys.maxunicode + 1) if not 0xd800 <= c <= 0xdfff]
+    checked = 0
+    for template in ["{c}", "{c}{c}", "a{c}", "{c} x", "& {c}{c}", "{c}\n&"]:
+        checked += check_parity([template.format(c=c) for c in characters])
+    checked += check_parity([synthetic_text(rng) for _ in range(100000)])
+    assert clean_ocr_batch(pd.Series(["ab", None])).isna().tolist() == [False, True]
+    print(f"Parity: {checked} texts identical")
+
+    # OCR text in the batches rarely has edge cases
+    texts = pd.Series([synthetic_text(rng, odd=0.01) for _ in range(rows)])
+    start = time.perf_counter()
+    expected = texts.map(clean_ocr)
+    map_time = time.perf_counter() - start
+    start = time.perf_counter()
+    actual = clean_ocr_batch(texts)
+    batch_time = time.perf_counter() - start
+    assert expected.equals(actual)
+    print(f"{'rows':>8} {'map s':>8} {'batch s':>8} {'speedup':>8}")
+    print(f"{rows:>8} {map_time:>8.3f} {batch_time:>8.3f} {map_time / batch_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    # To check clean_ocr_batch against clean_ocr and time both, run e.g.:
+    # python benchmarks/bench_clean_ocr.py --rows 500000
+
+    parser = argparse.ArgumentParser(description="Check and benchmark the batch clean_ocr")
+    parser.add_argument("--rows", type=int, default=500000, help="Synthetic OCR texts to time")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    main(args.rows, args.seed)
@@ -0,0 +1,49 @@
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.llm_annotate import pack_jobs, run_jobs
+from utils.mock_anthropic import MockAnthropicServer
+from benchmarks.synthetic import synthetic_rows
+
+
+def main(rows, packs, concurrency, latency, token_latency, seed):
+    df = synthetic_rows(rows, random.Random(seed))
+    with MockAnthropicServer(latency=latency, token_latency=token_latency, seed=seed) as server:
+        os.environ["ANTHROPIC_BASE_URL"] = server.base_url
+        os.environ["ANTHROPIC_API_KEY"] = "mock"
+        print(f"{'pack':>5} {'requests':>9} {'input tok':>10} {'output tok':>11} {'wall s':>7} {'tok saved':>10} {'time saved':>11}")
+        baseline = None
+        for pack in packs:
+            jobs = pack_jobs(df, df.index.tolist(), pack)
+            start = time.perf_counter()
+            results = asyncio.run(run_jobs(jobs, concurrency=concurrency, requests_per_minute=10 ** 9,
+                                           tokens_per_minute=10 ** 12, max_retries=0))
+            elapsed = time.perf_counter() - start
+            tokens_in = sum(r.input_tokens for r in results.values())
+            tokens_out = sum(r.output_tokens for r in results.values())
+            if baseline is None:
+                baseline = (tokens_in + tokens_out, elapsed)
+            saved_tokens = 1 - (tokens_in + tokens_out) / baseline[0]
+            saved_time = 1 - elapsed / baseline[1]
+            print(f"{pack:>5} {len(jobs):>9} {tokens_in:>10} {tokens_out:>11} {elapsed:>7.2f} {saved_tokens:>10.0%} {saved_time:>11.0%}")
+
+
+if __name__ == "__main__":
+    # Runs against the local mock API, so no key or spend is needed; e.g.:
+    # python benchmarks/bench_llm_packing.py --rows 400 --packs 1 5 10 20
+
+    parser = argparse.ArgumentParser(description="Benchmark packing several rows per LLM request")
+    parser.add_argument("--rows", type=int, default=400, help="Synthetic rows to annotate")
+    parser.add_argument("--packs", type=int, nargs="+", default=[1, 5, 10, 20], help="Rows per request to compare (1 = no packing)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight")
+    parser.add_argument("--latency", type=float, default=0.3, help="Mock latency per request (s)")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="Mock latency per output token (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    main(args.rows, args.packs, args.concurrency, args.latency, args.token_latency, args.seed)
@@ -0,0 +1,83 @@
+import argparse
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.rfb_decoder import decode, decode_many
+from benchmarks.synthetic import synthetic_credit
+
+
+def legacy_parse(anno):
+    """The adjudicator's original parser, kept here as the baseline."""
+    try:
+        words = anno.split()
+        split = [word.split("@") for word in words]
+        phrases = []
+        current_phrase = {}
+        for word, tag in split:
+            if tag == "O": continue
+            b_i, role = tag[0], tag[1:]
+            if b_i == "B":
+                if current_phrase:
+                    phrases.append(tuple(current_phrase.items())[0])
+                    current_phrase = {}
+                current_phrase[role] = word
+            elif b_i == "I":
+                current_phrase[role] += f" {word}"
+        if current_phrase:
+            phrases.append(tuple(current_phrase.items())[0])
+
+        rfb_dict = defaultdict(list)
+        for tag, word in [phrase for phrase in phrases if "R" in phrase[0]]:
+            role_index = tag.split(":")[1]
+            fillers = [phrase[1] for phrase in phrases if phrase[0] == f"F:{role_index}"]
+            rfb_dict[word] = fillers
+        for tag, word in [phrase for phrase in phrases if "F" in phrase[0]]:
+            role_index = tag.split(":")[1]
+            if not any([word in fillers for fillers in rfb_dict.values()]):
+                rfb_dict[""].append(word)
+
+        return rfb_dict
+    except Exception as e:
+        return {"error": "Unparsable string."}
+
+
+def time_it(fn, annos):
+    start = time.perf_counter()
+    for anno in annos:
+        fn(anno)
+    return time.perf_counter() - start
+
+
+def main(rows, roles, fillers, processes, seed):
+    rng = random.Random(seed)
+    print(f"{'roles':>6} {'tokens':>7} {'legacy ms':>10} {'decode ms':>10} {'speedup':>8}")
+    for n_roles in roles:
+        annos = [synthetic_credit(n_roles, fillers, rng) for _ in range(rows)]
+        for anno in annos[:5]:
+            assert dict(legacy_parse(anno)) == decode(anno)
+        legacy = time_it(legacy_parse, annos)
+        new = time_it(decode, annos)
+        tokens = len(annos[0].split())
+        print(f"{n_roles:>6} {tokens:>7} {legacy / rows * 1000:>10.3f} {new / rows * 1000:>10.3f} {legacy / new:>7.1f}x")
+
+    annos = [synthetic_credit(roles[0], fillers, rng) for _ in range(rows * 20)]
+    for procs in (1, processes):
+        start = time.perf_counter()
+        decode_many(annos, processes=procs)
+        print(f"decode_many: {len(annos)} rows, processes={procs}: {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the BIO role-filler decoder against the legacy parser")
+    parser.add_argument("--rows", type=int, default=200, help="Annotation strings per credit-roll size")
+    parser.add_argument("--roles", type=int, nargs="+", default=[5, 20, 50, 100], help="Roles per credit roll")
+    parser.add_argument("--fillers", type=int, default=4, help="Fillers per role")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="Worker processes for the batch run")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    main(args.rows, args.roles, args.fillers, args.processes, args.seed)
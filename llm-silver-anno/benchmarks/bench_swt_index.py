@@ -0,0 +1,59 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+from mmif import Mmif
+from mmif.vocabulary.annotation_types import AnnotationTypes
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.swt_to_csv import index_annotations, resolve
+from benchmarks.synthetic import synthetic_mmif
+
+
+def scan(mmif, ref):
+    """The old lookup: every view is checked for the id, the last match wins."""
+    found = None
+    for view in mmif.views:
+        if ref in view:
+            found = view[ref]
+    return found
+
+
+def alignments(mmif):
+    return [(view, alignment) for view in mmif.views for alignment in view.get_annotations(AnnotationTypes.Alignment)]
+
+
+def main(timepoints, views, seed):
+    rng = random.Random(seed)
+    print(f"{'views':>6} {'alignments':>11} {'scan s':>8} {'index s':>8} {'speedup':>8}")
+    for n_views in views:
+        mmif = Mmif(synthetic_mmif(timepoints, n_views, rng), validate=False)
+        pairs = alignments(mmif)
+
+        start = time.perf_counter()
+        scanned = [(scan(mmif, a.properties["source"]), scan(mmif, a.properties["target"])) for _, a in pairs]
+        scan_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = index_annotations(mmif)
+        indexed = [(resolve(index, a.properties["source"], v.id), resolve(index, a.properties["target"], v.id))
+                   for v, a in pairs]
+        index_time = time.perf_counter() - start
+
+        assert [(s.id, t.id) for s, t in scanned] == [(s.id, t.id) for s, t in indexed]
+        print(f"{n_views:>6} {len(pairs):>11} {scan_time:>8.3f} {index_time:>8.3f} {scan_time / index_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    # To compare the per-alignment view scan with the id index on large MMIFs, run e.g.:
+    # python benchmarks/bench_swt_index.py --timepoints 20000 --views 2 8 32
+
+    parser = argparse.ArgumentParser(description="Benchmark resolving MMIF alignments through an id index")
+    parser.add_argument("--timepoints", type=int, default=20000, help="TimePoints (and alignments) per MMIF")
+    parser.add_argument("--views", type=int, nargs="+", default=[2, 8, 32], help="OCR views per MMIF to compare")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    main(args.timepoints, args.views, args.seed)
@@ -0,0 +1,118 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.synthetic import guid
+from utils import get_paths
+from utils.get_paths import read_cached_paths, resolve_paths, stream_paths
+from utils.mock_search_api import MockSearchServer
+
+
+def fresh_cache(directory):
+    """What a new get_paths.py process would start from, with its cache files in `directory`."""
+    get_paths.cached_paths.clear()
+    get_paths.cached_paths.update(read_cached_paths(directory))
+
+
+def expected_path(g):
+    return f"/data/video/{g}.mp4"
+
+
+def check_lookups(guids, directory):
+    """Each distinct GUID is requested once, whatever the rows repeat; missing GUIDs map to None."""
+    missing = set(guids[::10])
+    rows = [g for g in guids for _ in range(3)]
+    fresh_cache(directory)
+    with MockSearchServer(missing=missing) as server:
+        paths = resolve_paths(rows, server.base_url, cache_file=os.path.join(directory, "paths.csv"))
+    assert set(server.counts) == set(guids), "a GUID was not looked up"
+    assert all(count == 1 for count in server.counts.values()), f"repeated requests: {server.counts.most_common(3)}"
+    assert list(paths) == guids
+    for g, path in paths.items():
+        assert path == (None if g in missing else expected_path(g)), f"{g}: {path}"
+    print(f"Lookups: {len(rows)} rows, {len(guids)} requests, {len(missing)} missing GUIDs map to None")
+
+
+def check_retries(guids, directory, error_rate, seed):
+    """503s are retried until the lookup succeeds; the resolved paths are appended to paths.csv."""
+    fresh_cache(directory)
+    with MockSearchServer(error_rate=error_rate, seed=seed) as server:
+        paths = resolve_paths(guids, server.base_url, retries=20, cache_file=os.path.join(directory, "paths.csv"))
+    assert server.errors > 0, "no 503s were injected"
+    assert sum(server.counts.values()) == len(guids) + server.errors
+    assert paths == {g: expected_path(g) for g in guids}
+    saved = pd.read_csv(os.path.join(directory, "paths.csv"))
+    assert dict(zip(saved["guid"], saved["path"])) == paths
+    print(f"Retries: {server.errors} injected 503s retried, all {len(guids)} GUIDs resolved and saved")
+    return paths
+
+
+def check_failures(guids, directory, retries):
+    """GUIDs whose every attempt fails map to None after `retries` retries, and aren't saved."""
+    fresh_cache(directory)
+    with MockSearchServer(error_rate=1.0) as server:
+        paths = resolve_paths(guids, server.base_url, retries=retries, cache_file=os.path.join(directory, "paths.csv"))
+    assert paths == {g: None for g in guids}
+    assert all(count == retries + 1 for count in server.counts.values()), server.counts
+    assert not os.path.exists(os.path.join(directory, "paths.csv")) or \
+        not set(pd.read_csv(os.path.join(directory, "paths.csv"))["guid"]) & set(guids)
+    print(f"Failures: {len(guids)} GUIDs failing {retries + 1} times each map to None")
+
+
+def check_cached(paths, directory):
+    """A second run reads paths.csv and sends no requests, for resolve_paths and stream_paths alike."""
+    guids = list(paths)
+    fresh_cache(directory)
+    with MockSearchServer() as server:
+        assert resolve_paths(guids, server.base_url, cache_file=os.path.join(directory, "paths.csv")) == paths
+        frames = [pd.DataFrame({"guid": guids[i:i + 7]}) for i in range(0, len(guids), 7)]
+        streamed = pd.concat(stream_paths(iter(frames), server.base_url, cache_file=os.path.join(directory, "paths.csv")))
+    assert streamed["path"].tolist() == [paths[g] for g in guids]
+    assert not server.counts, f"{sum(server.counts.values())} requests despite the cache"
+    print(f"Cache: second run resolved {len(guids)} GUIDs from paths.csv with no requests")
+
+
+def check_stream(guids, directory):
+    """stream_paths looks each GUID up once, however many frames it appears in, and keeps frame order."""
+    fresh_cache(directory)
+    frames = [pd.DataFrame({"guid": [guids[(i + j) % len(guids)] for j in range(5)]}) for i in range(len(guids))]
+    with MockSearchServer() as server:
+        streamed = list(stream_paths(iter(frames), server.base_url, cache_file=os.path.join(directory, "paths.csv")))
+    assert all(count == 1 for count in server.counts.values()) and len(server.counts) == len(guids)
+    assert [df["guid"].tolist() for df in streamed] == [df["guid"].tolist() for df in frames]
+    assert all(df["path"].tolist() == [expected_path(g) for g in df["guid"]] for df in streamed)
+    print(f"Stream: {len(frames)} frames, {len(guids)} requests")
+
+
+def main(guids, error_rate, seed):
+    start = time.perf_counter()
+    ids = [guid(i) for i in range(guids)]
+    with tempfile.TemporaryDirectory() as directory:
+        check_lookups(ids, directory)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = check_retries(ids, directory, error_rate, seed)
+        check_cached(paths, directory)
+    with tempfile.TemporaryDirectory() as directory:
+        check_failures(ids[:4], directory, retries=2)
+    with tempfile.TemporaryDirectory() as directory:
+        check_stream(ids, directory)
+    get_paths.cached_paths.clear()
+    print(f"All checks passed ({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    # To check get_paths.py against the mock search API (no datahousing server needed), run e.g.:
+    # python benchmarks/check_get_paths.py --guids 200 --error-rate 0.2
+
+    parser = argparse.ArgumentParser(description="Check get_paths.py lookups, retries and caching against the mock search API")
+    parser.add_argument("--guids", type=int, default=100, help="Distinct GUIDs to resolve")
+    parser.add_argument("--error-rate", type=float, default=0.2, help="Share of requests the mock answers with 503")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    main(args.guids, args.error_rate, args.seed)
@@ -0,0 +1,123 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import anthropic
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.synthetic import synthetic_rows
+from utils.llm_annotate import annotate_df
+from utils.llm_batches import BatchRunner
+from utils.mock_anthropic import MockAnthropicServer, tag_text
+
+
+class Interrupted(Exception):
+    pass
+
+
+class InterruptedRunner(BatchRunner):
+    """A BatchRunner whose process is killed right after it records its first collected batch."""
+
+    def _save_state(self, state: dict):
+        super()._save_state(state)
+        if any(batch["collected"] for batch in state["batches"]):
+            raise Interrupted
+
+
+def rows_of(custom_id):
+    rows = custom_id.partition("-")[2]
+    return [int(i) for i in rows.split("-")]
+
+
+def submitted(server, batch_ids):
+    """The custom_ids of the requests in the mock's batches `batch_ids`."""
+    return [request["custom_id"] for batch_id in batch_ids for request in server.batches[batch_id]["requests"]]
+
+
+def drop_checkpointed(checkpoint, df, server, collected, outstanding):
+    """
+    Removes a row of a packed request in the `collected` batches from the checkpoint, as if its
+    answer had failed validation. The row is picked from a scene label that still has requests in
+    the `outstanding` batches, so sending it again moves rows of those into other packs unless
+    the resumed run keeps the packs that were submitted.
+    """
+    running_labels = {df.at[i, "scene_label"] for cid in submitted(server, outstanding) for i in rows_of(cid)}
+    for cid in submitted(server, collected):
+        rows = rows_of(cid)
+        if len(rows) > 1 and df.at[rows[0], "scene_label"] in running_labels:
+            with open(checkpoint) as f:
+                records = [line for line in f if json.loads(line)["row"] != rows[0]]
+            with open(checkpoint, "w") as f:
+                f.writelines(records)
+            return rows[0]
+    raise AssertionError("no packed row to drop; try other --rows or --batch-size")
+
+
+def check_resume(df, pack, batch_size, batch_delay, directory):
+    """
+    Interrupts a bulk run once its first batch is collected and resumes it: no custom_id is
+    submitted twice, rows in batches left running are not sent again, and every row is answered.
+    """
+    checkpoint = os.path.join(directory, f"pack{pack}.partial.jsonl")
+    state_path = os.path.join(directory, f"pack{pack}.batches.json")
+    options = dict(checkpoint=checkpoint, pack=pack, retries=0, lookup=None)
+    with MockAnthropicServer(batch_delay=batch_delay) as server:
+        os.environ["ANTHROPIC_BASE_URL"] = server.base_url
+        os.environ["ANTHROPIC_API_KEY"] = "mock"
+        client = anthropic.Anthropic(base_url=server.base_url, api_key="mock", max_retries=0)
+        try:
+            annotate_df(df, batch_runner=InterruptedRunner(client, state_path, batch_delay / 4, batch_size), **options)
+            raise AssertionError("the first run was not interrupted")
+        except Interrupted:
+            pass
+        with open(state_path) as f:
+            batches = json.load(f)["batches"]
+        collected = [batch["id"] for batch in batches if batch["collected"]]
+        outstanding = [batch["id"] for batch in batches if not batch["collected"]]
+        assert collected and outstanding, "nothing was left running by the interrupted run"
+        dropped = drop_checkpointed(checkpoint, df, server, collected, outstanding) if pack > 1 else None
+
+        first_run = set(server.batches)
+        annotated = annotate_df(df, batch_runner=BatchRunner(client, state_path, batch_delay / 4, batch_size), **options)
+        resumed = [batch_id for batch_id in server.batches if batch_id not in first_run]
+
+    counts = Counter(submitted(server, server.batches))
+    assert max(counts.values()) == 1, f"custom_ids submitted twice: {[cid for cid, n in counts.items() if n > 1]}"
+    in_flight = {i for cid in submitted(server, outstanding) for i in rows_of(cid)}
+    sent_again = in_flight & {i for cid in submitted(server, resumed) for i in rows_of(cid)}
+    assert not sent_again, f"rows of batches left running were sent again: {sorted(sent_again)}"
+    assert (annotated["llm_status"] == "ok").all(), annotated["llm_status"].value_counts().to_dict()
+    assert annotated["silver_standard_annotation"].tolist() == annotated["cleaned_text"].map(tag_text).tolist()
+    print(f"Pack {pack}: interrupted with {len(outstanding)} of {len(batches)} batches running"
+          f"{f' and row {dropped} not checkpointed' if dropped is not None else ''}; the resumed run submitted "
+          f"{len(submitted(server, resumed))} requests, none twice, and all {len(df)} rows were answered")
+
+
+def main(rows, packs, batch_size, batch_delay, seed):
+    start = time.perf_counter()
+    df = synthetic_rows(rows, random.Random(seed)).drop_duplicates("cleaned_text").reset_index(drop=True)
+    df["ocr_accepted"] = True
+    for pack in packs:
+        with tempfile.TemporaryDirectory() as directory:
+            check_resume(df, pack, batch_size, batch_delay, directory)
+    print(f"All checks passed ({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    # To check that --bulk runs resume without paying twice, against the mock API (no key needed), run e.g.:
+    # python benchmarks/check_llm_batches.py --rows 60 --packs 1 4 --batch-delay 0.5
+
+    parser = argparse.ArgumentParser(description="Check that interrupted Message Batches runs resume without resubmitting requests")
+    parser.add_argument("--rows", type=int, default=60, help="Rows to annotate")
+    parser.add_argument("--packs", type=int, nargs="+", default=[1, 4], help="Rows per request to check")
+    parser.add_argument("--batch-size", type=int, default=3, help="Requests per submitted batch")
+    parser.add_argument("--batch-delay", type=float, default=0.5, help="Seconds until a mock batch ends")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    main(args.rows, args.packs, args.batch_size, args.batch_delay, args.seed)
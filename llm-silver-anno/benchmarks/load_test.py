@@ -0,0 +1,340 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(BASE_DIR)
+sys.path.insert(0, BASE_DIR)
+from benchmarks.suite import git_commit
+from benchmarks.synthetic import FIRST_NAMES, ROLES, review_batch, write_frame_dir, write_videos
+from utils.batch_store import ARROW_SUFFIX, DECISIONS_SUFFIX, csv_to_arrow, prepare_batch
+
+APPS = {
+    "main": os.path.join(REPO_DIR, "main.py"),
+    "ocr_reviewer": os.path.join(BASE_DIR, "ocr_reviewer.py"),
+    "llm_adjudicator": os.path.join(BASE_DIR, "llm_adjudicator.py"),
+}
+# Sizes of the synthetic data per scale; "large" is a full frame directory (100k frames) and batch (300k rows)
+SCALES = {
+    "small": {"frame_guids": 10, "frames": 100, "rows": 10000, "videos": 10},
+    "medium": {"frame_guids": 50, "frames": 400, "rows": 100000, "videos": 50},
+    "large": {"frame_guids": 100, "frames": 1000, "rows": 300000, "videos": 100},
+}
+VIDEO_SECONDS = 120
+# How often each scripted action is picked, per app
+ACTION_WEIGHTS = {
+    "main": {"save_next": 6, "skip": 3, "jump": 1},
+    "ocr_reviewer": {"submit": 6, "reject": 1, "swap": 1, "undo": 1, "jump": 1},
+    "llm_adjudicator": {"accept": 6, "reject": 2, "undo": 1, "jump": 1},
+}
+
+
+def button(at, label):
+    return next(b for b in at.button if b.label == label)
+
+
+def selectbox(at, label):
+    return next(s for s in at.selectbox if s.label == label)
+
+
+# Each action sets widgets and yields the name of the rerun that follows; the driver runs and times it
+
+def main_save_next(at, rng):
+    at.text_input(key="role").input(rng.choice(ROLES))
+    yield "type role"
+    at.text_area(key="fillers").input(f"{rng.choice(FIRST_NAMES)}")
+    yield "type fillers"
+    at.button(key="cont_top").click()
+    yield "save and next"
+
+
+def main_skip(at, rng):
+    button(at, "Skip image").click()
+    yield "skip"
+
+
+def main_jump(at, rng):
+    # AppTest formats the value it is given with the app's format_func, so select raw values
+    videos = selectbox(at, "Select video")
+    videos.select(rng.choice(videos.options).split(" (")[0])
+    yield "pick video"
+    frames = selectbox(at, "Select frame")
+    frames.select(int(rng.choice(frames.options).split()[0]))
+    yield "pick frame"
+    button(at, "Go").click()
+    yield "jump"
+
+
+def jump_to_row(rows):
+    def jump(at, rng):
+        at.text_input(key="jump").input(str(rng.randrange(rows)))
+        yield "jump"
+    return jump
+
+
+def click(label, step=None):
+    def action(at, rng):
+        button(at, label).click()
+        yield step or label.lower()
+    return action
+
+
+def click_key(key):
+    def action(at, rng):
+        at.button(key=key).click()
+        yield key
+    return action
+
+
+def reviewer_reject(at, rng):
+    labels = [b.label for b in at.button]
+    button(at, "UN-reject" if "UN-reject" in labels else "Reject").click()
+    yield "reject"
+
+
+def actions(app, rows):
+    if app == "main":
+        return {"save_next": main_save_next, "skip": main_skip, "jump": main_jump}
+    undo = click("Oops (Undo last annotation)", "undo")
+    if app == "ocr_reviewer":
+        return {"submit": click("Submit"), "reject": reviewer_reject, "swap": click("Swap"), "undo": undo,
+                "jump": jump_to_row(rows)}
+    return {"accept": click_key("accept"), "reject": click_key("reject"), "undo": undo, "jump": jump_to_row(rows)}
+
+
+def proc_status_mb(field):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def rss_mb():
+    """Resident memory of this process (its peak where /proc isn't available)."""
+    rss = proc_status_mb("VmRSS")
+    return peak_mb() if rss is None else rss
+
+
+def peak_mb():
+    # ru_maxrss can carry over the parent's peak into a spawned process, VmHWM doesn't
+    peak = proc_status_mb("VmHWM")
+    if peak is not None:
+        return peak
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB on Linux, bytes on macOS
+    return peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+
+def run_session(app, session, setup, clicks, rows, seed, timeout):
+    """
+    One simulated annotator, in its own process: opens the app with `setup` (session state
+    and argv), then runs `clicks` actions picked by ACTION_WEIGHTS. Returns the latency of
+    every rerun and the process's memory before, after opening and at the end.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    sys.argv = setup.get("argv", [APPS[app]])
+    rng = random.Random(seed)
+    result = {"app": app, "session": session, "reruns": [], "error": None, "rss_base_mb": rss_mb()}
+    at = AppTest.from_file(APPS[app], default_timeout=timeout)
+    for key, value in setup.get("session_state", {}).items():
+        at.session_state[key] = value
+
+    def rerun(step, action=None):
+        start = time.perf_counter()
+        at.run()
+        result["reruns"].append({"step": step, "action": action, "seconds": time.perf_counter() - start})
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+
+    app_actions = actions(app, rows)
+    names, weights = zip(*ACTION_WEIGHTS[app].items())
+    try:
+        rerun("open")
+        result["rss_open_mb"] = rss_mb()
+        for _ in range(clicks):
+            action = rng.choices(names, weights)[0]
+            for step in app_actions[action](at, rng):
+                rerun(step, action)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["rss_end_mb"] = rss_mb()
+    result["peak_mb"] = peak_mb()
+    return result
+
+
+def prepare_data(data_dir, sizes, seed):
+    """Generates the frame directory, videos and batch under `data_dir`, unless an earlier run already did."""
+    paths = {
+        "image_dir": os.path.join(data_dir, "frames"),
+        "annotation_dir": os.path.join(data_dir, "frame-annotations"),
+        "video_dir": os.path.join(data_dir, "videos"),
+        "batch": os.path.join(data_dir, "batch.csv"),
+        "arrow": os.path.join(data_dir, "batch" + ARROW_SUFFIX),
+    }
+    done = os.path.join(data_dir, "generated.json")
+    if os.path.exists(done):
+        with open(done) as f:
+            if json.load(f) == {"sizes": sizes, "seed": seed}:
+                return paths
+    start = time.perf_counter()
+    write_frame_dir(paths["image_dir"], paths["annotation_dir"], sizes["frame_guids"], sizes["frames"], seed=seed)
+    write_videos(paths["video_dir"], sizes["videos"], VIDEO_SECONDS, seed=seed)
+    # A batch as it reaches the apps after llm_annotate.py, with frames from the synthetic videos
+    df = review_batch(sizes["rows"], guids=sizes["videos"], seed=seed)
+    df["path"] = [os.path.join(paths["video_dir"], f"{guid}.mp4") for guid in df["guid"]]
+    df["timePoint"] = df["timePoint"] % (VIDEO_SECONDS * 1000)
+    prepare_batch(df).to_csv(paths["batch"], index=False)
+    csv_to_arrow(paths["batch"], paths["arrow"])
+    with open(done, "w") as f:
+        json.dump({"sizes": sizes, "seed": seed}, f)
+    print(f"Generated synthetic data in {data_dir} ({time.perf_counter() - start:.1f}s)")
+    return paths
+
+
+def session_setups(app, sessions, paths, run_dir, batch_format):
+    """
+    What each session of `app` starts with. Sessions of main.py read the same images but
+    each writes to its own copy of the annotation directory (in one directory they would
+    all annotate the same frames); reviewer sessions share the Arrow batch under their own
+    annotator names, or get their own copy of the CSV.
+    """
+    setups = []
+    for i in range(sessions):
+        if app == "main":
+            annotation_dir = shutil.copytree(paths["annotation_dir"], os.path.join(run_dir, f"frame-annotations-{i}"))
+            setups.append({"argv": [APPS[app], f"{paths['image_dir']}:{annotation_dir}"]})
+        elif batch_format == "arrow":
+            setups.append({"session_state": {"csv_file": paths["arrow"], "annotator": f"{app}-{i}"}})
+        else:
+            csv_file = shutil.copy(paths["batch"], os.path.join(run_dir, f"{app}-{i}.csv"))
+            setups.append({"session_state": {"csv_file": csv_file}})
+    return setups
+
+
+def percentiles(seconds):
+    s = pd.Series(seconds) * 1000
+    return {"reruns": len(s), "p50_ms": s.quantile(0.5), "p90_ms": s.quantile(0.9), "p99_ms": s.quantile(0.99),
+            "max_ms": s.max()}
+
+
+def summarize(sessions):
+    """Rerun latency percentiles (page loads apart) and memory per session, per app and per app and step."""
+    reruns = pd.DataFrame([{"app": s["app"], **r} for s in sessions for r in s["reruns"]])
+    summary = {}
+    for app, group in reruns.groupby("app", sort=False):
+        app_sessions = [s for s in sessions if s["app"] == app]
+        clicks = group[group["step"] != "open"]
+        summary[app] = {
+            **percentiles(clicks["seconds"]),
+            "open_ms": percentiles(group.loc[group["step"] == "open", "seconds"])["max_ms"],
+            "sessions": len(app_sessions),
+            "errors": [s["error"] for s in app_sessions if s["error"]],
+            "rss_per_session_mb": max(s["rss_end_mb"] - s["rss_base_mb"] for s in app_sessions),
+            "peak_mb": max(s["peak_mb"] for s in app_sessions),
+            "steps": {step: percentiles(g["seconds"]) for step, g in clicks.groupby("step", sort=False)},
+        }
+    return summary
+
+
+def run(apps, scale, sessions, clicks, batch_format="arrow", data_dir=None, seed=0, timeout=600):
+    sizes = SCALES[scale]
+    with tempfile.TemporaryDirectory() as tmp:
+        if data_dir is None:
+            data_dir = tmp
+        else:
+            data_dir = os.path.join(data_dir, f"{scale}-{seed}")
+            os.makedirs(data_dir, exist_ok=True)
+        paths = prepare_data(data_dir, sizes, seed)
+        # Earlier runs' decisions would make the reviewers start further down the batch
+        for sidecar in os.listdir(data_dir):
+            if sidecar.endswith(DECISIONS_SUFFIX):
+                os.remove(os.path.join(data_dir, sidecar))
+        run_dir = os.path.join(tmp, "run")
+        os.makedirs(run_dir)
+        tasks = []
+        for app in apps:
+            for i, setup in enumerate(session_setups(app, sessions, paths, run_dir, batch_format)):
+                tasks.append((app, i, setup, clicks, sizes["rows"], seed * 1000 + len(tasks), timeout))
+        start = time.perf_counter()
+        # AppTest swaps Streamlit's global runtime on every run, so each session needs a process of its own
+        with multiprocessing.get_context("spawn").Pool(len(tasks)) as pool:
+            results = pool.starmap(run_session, tasks)
+        elapsed = time.perf_counter() - start
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "scale": scale,
+        "sizes": sizes,
+        "sessions": sessions,
+        "clicks": clicks,
+        "batch_format": batch_format,
+        "seed": seed,
+        "seconds": elapsed,
+        "results": summarize(results),
+        "session_results": results,
+    }
+
+
+def print_report(report):
+    print(f"{report['sessions']} sessions per app, {report['clicks']} actions each, "
+          f"{report['batch_format']} batches, {report['scale']} scale ({report['seconds']:.1f}s)")
+    columns = ["reruns", "p50_ms", "p90_ms", "p99_ms", "max_ms", "open_ms", "rss_per_session_mb", "peak_mb"]
+    table = pd.DataFrame({app: {c: result[c] for c in columns} for app, result in report["results"].items()}).T
+    steps = pd.DataFrame({(app, step): result for app, app_result in report["results"].items()
+                          for step, result in app_result["steps"].items()}).T
+    with pd.option_context("display.max_rows", None, "display.max_columns", None, "display.width", 200):
+        print(table.round(1))
+        print(steps.round(1))
+    for app, result in report["results"].items():
+        for error in result["errors"]:
+            print(f"{app}: session stopped by {error}")
+
+
+if __name__ == "__main__":
+    # To load-test the three apps with 4 annotators each on a full-size frame directory and batch, run e.g.:
+    # python benchmarks/load_test.py --scale large --sessions 4 --clicks 50 --data-dir /tmp/load-test-data
+
+    parser = argparse.ArgumentParser(description="Drive the annotation apps headlessly with simulated "
+                                                 "annotators and report rerun latency and memory per session")
+    parser.add_argument("--apps", nargs="+", choices=APPS, default=list(APPS), help="Apps to test")
+    parser.add_argument("--scale", choices=SCALES, default="small", help="Size of the synthetic data")
+    parser.add_argument("--sessions", type=int, default=2, help="Concurrent sessions per app")
+    parser.add_argument("--clicks", type=int, default=20, help="Actions per session")
+    parser.add_argument("--batch-format", choices=["arrow", "csv"], default="arrow",
+                        help="Reviewers share one Arrow batch (arrow) or each open their own CSV (csv)")
+    parser.add_argument("--data-dir", default=None, help="Keep generated data here and reuse it (default: a temporary directory)")
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds a single rerun may take")
+    parser.add_argument("--output", default=None, help="Also write the report (with every rerun's latency) as JSON")
+    parser.add_argument("--p90-budget", type=float, default=None, help="Exit with status 1 if any app's p90 rerun exceeds this many ms")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    report = run(args.apps, args.scale, args.sessions, args.clicks, args.batch_format, args.data_dir, args.seed, args.timeout)
+    print_report(report)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+    failed = any(result["errors"] for result in report["results"].values())
+    if args.p90_budget is not None:
+        failed |= any(result["p90_ms"] > args.p90_budget for result in report["results"].values())
+    sys.exit(1 if failed else 0)
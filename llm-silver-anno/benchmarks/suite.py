@@ -0,0 +1,219 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# main.py (the role/filler frame annotator) lives at the top of the repository
+REPO_DIR = os.path.dirname(BASE_DIR)
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(1, REPO_DIR)
+from benchmarks.synthetic import review_batch, write_frame_dir, write_mmif_dir
+from utils.clean_ocr import clean_ocr, clean_ocr_batch
+from utils.mock_anthropic import MockAnthropicServer
+from utils.rfb_decoder import parse_silver_standard
+from utils.swt_to_csv import dir_to_csv
+
+RESULTS_DIR = os.path.join(BASE_DIR, "benchmarks", "results")
+# Sizes of the synthetic data per scale; "large" is the size of a real batch or frame directory
+SCALES = {
+    "small": {"mmif_files": 10, "timepoints": 300, "frame_guids": 10, "frames": 50, "rows": 10000, "llm_rows": 200},
+    "medium": {"mmif_files": 50, "timepoints": 1000, "frame_guids": 50, "frames": 200, "rows": 100000, "llm_rows": 1000},
+    "large": {"mmif_files": 200, "timepoints": 2000, "frame_guids": 100, "frames": 1000, "rows": 300000, "llm_rows": 5000},
+}
+
+
+def prepare_data(data_dir, sizes, seed):
+    """Generates the synthetic inputs under `data_dir`, unless an earlier run already did."""
+    paths = {
+        "mmif_dir": os.path.join(data_dir, "mmif"),
+        "image_dir": os.path.join(data_dir, "frames"),
+        "annotation_dir": os.path.join(data_dir, "frame-annotations"),
+        "batch": os.path.join(data_dir, "batch.csv"),
+        "out": os.path.join(data_dir, "out"),
+    }
+    done = os.path.join(data_dir, "generated.json")
+    if os.path.exists(done):
+        with open(done) as f:
+            if json.load(f) == {"sizes": sizes, "seed": seed}:
+                return paths
+    start = time.perf_counter()
+    write_mmif_dir(paths["mmif_dir"], sizes["mmif_files"], sizes["timepoints"], seed=seed)
+    write_frame_dir(paths["image_dir"], paths["annotation_dir"], sizes["frame_guids"], sizes["frames"], seed=seed)
+    review_batch(sizes["rows"], seed=seed).to_csv(paths["batch"], index=False)
+    os.makedirs(paths["out"], exist_ok=True)
+    with open(done, "w") as f:
+        json.dump({"sizes": sizes, "seed": seed}, f)
+    print(f"Generated synthetic data in {data_dir} ({time.perf_counter() - start:.1f}s)")
+    return paths
+
+
+def benchmarks(paths, sizes, llm_latency, stack):
+    """
+    {name: setup}, where setup() returns (function to time, rows it processes per call).
+    Anything a setup starts is stopped when `stack` closes.
+    """
+    def swt(raw):
+        def setup():
+            out = os.path.join(paths["out"], "swt.csv")
+            return lambda: dir_to_csv(paths["mmif_dir"], out, dedupe=True, raw=raw), \
+                sizes["mmif_files"] * sizes["timepoints"]
+        return setup
+
+    def batch_column(column):
+        return pd.read_csv(paths["batch"], usecols=[column])[column]
+
+    def clean(batch):
+        def setup():
+            texts = batch_column("textdocument")
+            return (lambda: clean_ocr_batch(texts)) if batch else (lambda: texts.map(clean_ocr)), len(texts)
+        return setup
+
+    def parse():
+        annos = batch_column("silver_standard_annotation").tolist()
+        return lambda: [parse_silver_standard(anno) for anno in annos], len(annos)
+
+    def frame_annotator():
+        import main as frame_annotator
+        frame_annotator.image_dir = paths["image_dir"]
+        frame_annotator.annotation_dir = paths["annotation_dir"]
+        return frame_annotator
+
+    def main_index():
+        app = frame_annotator()
+        return lambda: app.index_images(paths["image_dir"]), sizes["frame_guids"] * sizes["frames"]
+
+    def main_progress():
+        app = frame_annotator()
+        guids, indexed_images, _ = app.index_images(paths["image_dir"])
+
+        def progress():
+            # What each rerun evaluates: the first pending image, and every GUID's progress in the video picker
+            app.first_unannotated(indexed_images)
+            return [app.get_progress_guid(guid, string=True) for guid in guids]
+        return progress, len(indexed_images)
+
+    def llm_annotate():
+        df = pd.read_csv(paths["batch"], usecols=["scene_label", "cleaned_text", "ocr_accepted"],
+                         nrows=sizes["llm_rows"])
+        server = stack.enter_context(MockAnthropicServer(latency=llm_latency, seed=0))
+        os.environ["ANTHROPIC_BASE_URL"] = server.base_url
+        os.environ.setdefault("ANTHROPIC_API_KEY", "mock")
+        from utils.llm_annotate import annotate_df
+        return lambda: annotate_df(df.copy(), requests_per_minute=10 ** 9, tokens_per_minute=10 ** 12), len(df)
+
+    return {
+        "swt_to_csv.dir_to_csv": swt(raw=False),
+        "swt_to_csv.dir_to_csv_raw": swt(raw=True),
+        "clean_ocr.map": clean(batch=False),
+        "clean_ocr.batch": clean(batch=True),
+        "llm_adjudicator.parse_silver_standard": parse,
+        "main.index_images": main_index,
+        "main.progress": main_progress,
+        "llm_annotate.annotate_df": llm_annotate,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scale, repeat, only=None, data_dir=None, llm_latency=0.01, seed=0):
+    sizes = SCALES[scale]
+    with contextlib.ExitStack() as stack:
+        if data_dir is None:
+            data_dir = stack.enter_context(tempfile.TemporaryDirectory())
+        else:
+            data_dir = os.path.join(data_dir, f"{scale}-{seed}")
+            os.makedirs(data_dir, exist_ok=True)
+        paths = prepare_data(data_dir, sizes, seed)
+        results = {}
+        for name, setup in benchmarks(paths, sizes, llm_latency, stack).items():
+            if only and not any(part in name for part in only):
+                continue
+            # The tools print progress bars and summaries, which would swamp the report
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                fn, rows = setup()
+                seconds = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    fn()
+                    seconds.append(time.perf_counter() - start)
+            median = statistics.median(seconds)
+            results[name] = {"rows": rows, "seconds": seconds, "median": median, "min": min(seconds),
+                             "rows_per_second": rows / median if median else None}
+            print(f"{name:<40} {rows:>8} rows {median:>9.3f}s median {rows / median:>12.0f} rows/s")
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "scale": scale,
+        "sizes": sizes,
+        "repeat": repeat,
+        "seed": seed,
+        "results": results,
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Prints each benchmark's median against a baseline report; returns the names that got slower than `tolerance`."""
+    slower = []
+    print(f"Against {baseline.get('commit') or 'baseline'} ({baseline['scale']} scale):")
+    for name, result in report["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        ratio = result["median"] / before["median"]
+        flag = "  SLOWER" if ratio > 1 + tolerance else ""
+        print(f"{name:<40} {before['median']:>9.3f}s -> {result['median']:>9.3f}s ({ratio:>5.2f}x){flag}")
+        if flag:
+            slower.append(name)
+    return slower
+
+
+if __name__ == "__main__":
+    # To time every batch stage on synthetic data and save the results, run e.g.:
+    # python benchmarks/suite.py --scale medium --data-dir /tmp/bench-data
+    # and to check a change against earlier results (exits with 1 if anything got slower):
+    # python benchmarks/suite.py --scale medium --data-dir /tmp/bench-data --baseline benchmarks/results/before.json
+
+    parser = argparse.ArgumentParser(description="Time the batch tools on synthetic data and write the results as JSON")
+    parser.add_argument("--scale", choices=SCALES, default="small", help="Size of the synthetic data")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark (the median is reported)")
+    parser.add_argument("--only", nargs="+", default=None, help="Only run benchmarks whose name contains one of these")
+    parser.add_argument("--data-dir", default=None, help="Keep generated data here and reuse it (default: a temporary directory)")
+    parser.add_argument("--output", default=None, help="Results file (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--baseline", default=None, help="Earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Slowdown relative to the baseline that counts as a regression")
+    parser.add_argument("--llm-latency", type=float, default=0.01, help="Seconds the mock API takes per request")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    report = run(args.scale, args.repeat, args.only, args.data_dir, args.llm_latency, args.seed)
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{(report['commit'] or 'nogit')[:8]}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {output}")
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            slower = compare(report, json.load(f), args.tolerance)
+        sys.exit(1 if slower else 0)
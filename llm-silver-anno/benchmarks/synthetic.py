@@ -0,0 +1,189 @@
+import json
+import os
+import pickle
+import random
+
+import cv2 as cv
+import numpy as np
+import pandas as pd
+
+MMIF_VERSION = "http://mmif.clams.ai/1.0.0"
+TIMEPOINT = "http://mmif.clams.ai/vocabulary/TimePoint/v1"
+TEXT_DOCUMENT = "http://mmif.clams.ai/vocabulary/TextDocument/v1"
+ALIGNMENT = "http://mmif.clams.ai/vocabulary/Alignment/v1"
+LABELS = ["I", "N", "Y", "C", "B", "S", "O"]
+
+FIRST_NAMES = ["CLARENCE", "Meena", "Stanley", "Dawit", "Kathy", "Bridget", "RUSSELL", "GARY"]
+LAST_NAMES = ["PAGE", "Bose", "Kubrick", "Giorgis", "Schwarzhoff", "Redmond", "MARHULL", "ALLEN"]
+ROLES = ["Chicago Tribune", "Military Academy", "Writer Director", "Correspondent", "Senior Producer", "Reporter"]
+ROLE_WORDS = ["PRODUCER", "DIRECTOR", "EDITOR", "CAMERA", "AUDIO", "ASSISTANT", "EXECUTIVE", "SUPERVISOR", "Crews"]
+NAME_WORDS = ["JOHN", "MARY", "SMITH", "GARY", "ALLEN", "LuAnne", "Halligan", "Kathy", "Schwarzhoff", "Ra"]
+
+
+def guid(i: int) -> str:
+    return f"cpb-aacip-{i:03d}-{i:08d}"
+
+
+def synthetic_mmif(timepoints, views, rng, guid="cpb-aacip-000-00000000"):
+    """
+    An SWT + OCR style MMIF as JSON: one view of classified TimePoints, then `views` OCR
+    views each holding TextDocuments for a share of the TimePoints with Alignments from
+    the TimePoint (in the SWT view) to the TextDocument (in its own view).
+    """
+    def view(i, app, annotations):
+        return {"id": f"v_{i}", "metadata": {"app": app, "timestamp": "2024-01-01T00:00:00", "contains": {}},
+                "annotations": annotations}
+
+    swt = [{"@type": TIMEPOINT, "properties": {
+        "id": f"v_0:tp_{t}", "timePoint": t * 1000,
+        "classification": {label: rng.random() for label in LABELS}}} for t in range(timepoints)]
+    mmif_views = [view(0, "http://apps.clams.ai/swt-detection/v4.0", swt)]
+    for v in range(1, views + 1):
+        annotations = []
+        for t in range(v - 1, timepoints, views):
+            annotations.append({"@type": TEXT_DOCUMENT, "properties": {
+                "id": f"v_{v}:td_{t}", "text": {"@value": f"OCR TEXT {t} Reporter {rng.randint(0, 10 ** 6)}"}}})
+            annotations.append({"@type": ALIGNMENT, "properties": {
+                "id": f"v_{v}:al_{t}", "source": f"v_0:tp_{t}", "target": f"v_{v}:td_{t}"}})
+        mmif_views.append(view(v, "http://apps.clams.ai/doctr-wrapper/v1.0", annotations))
+    return json.dumps({
+        "metadata": {"mmif": MMIF_VERSION},
+        "documents": [{"@type": "http://mmif.clams.ai/vocabulary/VideoDocument/v1", "properties": {
+            "id": "d1", "mime": "video", "location": f"file:///data/{guid}.mp4"}}],
+        "views": mmif_views,
+    })
+
+
+def write_mmif_dir(directory, files, timepoints, views=2, seed=0):
+    """Writes `files` synthetic MMIFs (one GUID each) for swt_to_csv.py into `directory`."""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    for i in range(files):
+        with open(os.path.join(directory, f"{guid(i)}.mmif"), "w") as f:
+            f.write(synthetic_mmif(timepoints, views, rng, guid(i)))
+    return directory
+
+
+def synthetic_credit(n_roles, fillers_per_role, rng):
+    """Builds a credit-roll annotation string with n_roles roles, each with several fillers."""
+    tokens = []
+    for i in range(1, n_roles + 1):
+        for j, word in enumerate(rng.sample(ROLE_WORDS, 2)):
+            tokens.append(f"{word}{i}@{'B' if j == 0 else 'I'}R:{i}")
+        for k in range(fillers_per_role):
+            first, last = rng.sample(NAME_WORDS, 2)
+            tokens.append(f"{first}{i}_{k}@BF:{i}")
+            tokens.append(f"{last}{i}_{k}@IF:{i}")
+        if rng.random() < 0.2:
+            tokens.append("Indianapolis@O")
+    return " ".join(tokens)
+
+
+def synthetic_rows(n, rng):
+    """Chyron and credit rows with the short OCR strings typical of a batch."""
+    rows = []
+    for _ in range(n):
+        if rng.random() < 0.7:
+            text = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(ROLES)}"
+            rows.append(("chyron", text))
+        else:
+            people = " ".join(f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}" for _ in range(rng.randint(1, 4)))
+            rows.append(("credits", f"{rng.choice(ROLES)} {people}"))
+    return pd.DataFrame(rows, columns=["scene_label", "cleaned_text"])
+
+
+def review_batch(rows, guids=100, seed=0):
+    """
+    A batch as the reviewer apps see it after llm_annotate.py: raw OCR text (with the
+    stray lines OCR produces), cleaned text, and a `silver_standard_annotation` tagging
+    every cleaned word, for a chyron (name and role) or a credit roll.
+    """
+    rng = random.Random(seed)
+    records = []
+    for i in range(rows):
+        if rng.random() < 0.7:
+            first, last, role = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), rng.choice(ROLES)
+            role_words = role.split()
+            words = [first, last] + role_words
+            silver = " ".join([f"{first}@BF:1", f"{last}@IF:1"]
+                              + [f"{w}@{'B' if j == 0 else 'I'}R:1" for j, w in enumerate(role_words)])
+            scene_label = "chyron"
+        else:
+            silver = synthetic_credit(rng.randint(1, 6), rng.randint(1, 3), rng)
+            words = [token.split("@")[0] for token in silver.split()]
+            scene_label = "credits"
+        lines = [" ".join(words[j:j + 4]) for j in range(0, len(words), 4)]
+        if rng.random() < 0.3:
+            lines.insert(rng.randrange(len(lines) + 1), rng.choice(["| 12", "-", "1987", "::"]))
+        records.append({
+            "guid": guid(i % guids),
+            "timePoint": (i // guids) * 1000,
+            "scene_label": scene_label,
+            "confidence": rng.random(),
+            "textdocument": "\n".join(lines),
+            "cleaned_text": " ".join(words),
+            "silver_standard_annotation": silver,
+            "path": f"/data/video/{guid(i % guids)}.mp4",
+            "ocr_accepted": True,
+        })
+    return pd.DataFrame(records)
+
+
+def easyocr_results(rng, boxes, width, height):
+    """EasyOCR `readtext` output: ([4 corner points], text, confidence) per box."""
+    results = []
+    for _ in range(boxes):
+        x, y = rng.randrange(width - 40), rng.randrange(height - 20)
+        w, h = rng.randint(20, 40), rng.randint(10, 20)
+        text = rng.choice(FIRST_NAMES + LAST_NAMES + ROLE_WORDS)
+        results.append(([[x, y], [x + w, y], [x + w, y + h], [x, y + h]], text, rng.random()))
+    return results
+
+
+def write_frame_dir(image_dir, annotation_dir, guids, frames, boxes=6, annotated=0.5, size=(320, 180), seed=0):
+    """
+    A directory of frames for main.py: `<guid>.<frame>.png` images with EasyOCR-style
+    result pickles in `ocr/` (as written by ocr.py), plus annotation JSON files for the
+    first `annotated` share of each GUID's frames.
+    """
+    rng = random.Random(seed)
+    width, height = size
+    os.makedirs(os.path.join(image_dir, "ocr"), exist_ok=True)
+    os.makedirs(annotation_dir, exist_ok=True)
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    for g in range(guids):
+        for f in range(frames):
+            fnum = f * 15
+            results = easyocr_results(rng, boxes, width, height)
+            image[:] = rng.randrange(256)
+            for corners, _, _ in results:
+                cv.rectangle(image, tuple(corners[0]), tuple(corners[2]), (255, 255, 255), -1)
+            # main.py looks frames up by integer frame number, so it isn't zero-padded
+            image_id = f"{guid(g)}.{fnum}"
+            cv.imwrite(os.path.join(image_dir, f"{image_id}.png"), image)
+            with open(os.path.join(image_dir, "ocr", image_id), "wb") as out:
+                pickle.dump(results, out)
+            if f < frames * annotated:
+                with open(os.path.join(annotation_dir, f"{image_id}.json"), "w") as out:
+                    json.dump({"Reporter": [results[0][1]], "_image_id": image_id}, out)
+    return image_dir, annotation_dir
+
+
+def write_videos(directory, guids, seconds, fps=5, size=(320, 180), seed=0):
+    """
+    Writes a short `<guid>.mp4` per GUID into `directory`, each frame a flat colour with
+    a white box, so the reviewer apps' frame reads hit real video files.
+    """
+    rng = random.Random(seed)
+    width, height = size
+    os.makedirs(directory, exist_ok=True)
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    for g in range(guids):
+        writer = cv.VideoWriter(os.path.join(directory, f"{guid(g)}.mp4"), cv.VideoWriter_fourcc(*"mp4v"), fps, size)
+        for _ in range(seconds * fps):
+            image[:] = rng.randrange(256)
+            x, y = rng.randrange(width - 40), rng.randrange(height - 20)
+            cv.rectangle(image, (x, y), (x + 40, y + 20), (255, 255, 255), -1)
+            writer.write(image)
+        writer.release()
+    return directory
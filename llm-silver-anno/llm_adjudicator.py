@@ -1,63 +1,90 @@
 import streamlit as st
 import pandas as pd
-import cv2
 import os
-from collections import defaultdict
-from utils.clean_ocr import clean_ocr
-import re
+from utils.batch_store import open_batch
+from utils.rfb_decoder import parse_silver_standard
+from utils.token_align import align_row, highlight_html
+from utils.review_queue import FILE_ORDER, MISMATCH_ORDER, LOCALITY_ORDER, QUEUE_COLUMNS, timepoint_column, build_queue, next_in_queue, previous_in_queue, first_pending
+from utils.frames import read_frame, default_pool
+from utils.rerun_profile import rerun_profiler
 
 st.set_page_config(page_title="LLM Adjudicator", layout="wide")
+profiler = rerun_profiler("llm_adjudicator")
 
 # -- SESSION STATE --
 
 if "csv_file" not in st.session_state:
-    uploaded_filename = st.text_input("Enter name of annotation file", placeholder="filename.csv", key="csv_filename")
+    uploaded_filename = st.text_input("Enter name of annotation file", placeholder="filename.csv or filename.arrow", key="csv_filename")
+    st.text_input("Annotator name (only needed when several people share one .arrow batch)", key="annotator")
     if uploaded_filename:
         st.session_state["csv_file"] = os.path.join("annotations/3-llm-in-progress", uploaded_filename)
         st.rerun()
+    profiler.finish()
     st.stop()
 
-if "df" not in st.session_state:
-    st.session_state["df"] = pd.read_csv(st.session_state["csv_file"])
-    # Save the name as a string for server saving
-    if not isinstance(st.session_state["csv_file"], str):
-        st.session_state["csv_file"] = st.session_state["csv_file"].name
-df = st.session_state["df"].dropna()
-
-if "cleaned_text" not in df.columns:
-    df["cleaned_text"] = df["textdocument"].map(clean_ocr)
-
-output_fields = ["adjudicated", "accepted"]
-for field in output_fields:
-    if field not in df.columns:
-        df[field] = False
+# Alignment columns are computed once, on load, for files annotated before they were precomputed
+if "batch" not in st.session_state:
+    st.session_state["batch"] = open_batch(st.session_state["csv_file"], {"adjudicated": False, "accepted": False},
+                                           st.session_state.get("annotator", ""))
+batch = st.session_state["batch"]
+profiler.lap("open batch")
 
 def submit_final_annotations():
-    df = st.session_state["df"]
+    df = batch.to_frame()
     df = df[df["accepted"] == True]
+    df = df[["guid", timepoint_column(df.columns), "scene_label", "cleaned_text", "silver_standard_annotation"]]
     df.dropna(inplace=True)
-    df = df[["guid", "timePoint", "scene_label", "cleaned_text", "silver_standard_annotation"]]
-    df = df.rename(columns = {"silver_standard_annotation": "labels"})
-    next_step_path = os.path.join("annotations/4-llm-complete", os.path.basename(st.session_state["csv_file"]))
+    df = df.rename(columns = {"timepoint": "timePoint", "silver_standard_annotation": "labels"})
+    next_step_path = os.path.join("annotations/4-llm-complete", batch.output_name)
     df.to_csv(next_step_path, index=False)
-    os.remove(st.session_state["csv_file"])
+    batch.remove()
     st.write("Annotations completed and submitted!")
     st.balloons()
     st.stop()
 
+# Rows the LLM never annotated can't be adjudicated, and rows with rejected OCR are labelled already
+skipped = batch.column("silver_standard_annotation").isna().to_numpy()
+if "ocr_accepted" in batch.columns:
+    skipped |= (batch.column("ocr_accepted") == False).to_numpy()
+queue = build_queue(pd.DataFrame({c: batch.column(c) for c in QUEUE_COLUMNS if c in batch.columns}),
+                    st.session_state.get("queue_order", FILE_ORDER), st.session_state.get("min_mismatch", 0),
+                    exclude=skipped)
+profiler.lap("build queue")
+
+# Rendered before the row so the filter can still be changed once its queue is done
+sidebar = st.sidebar
+with sidebar:
+    st.selectbox("Order rows by", [FILE_ORDER, MISMATCH_ORDER, LOCALITY_ORDER], key="queue_order")
+    st.number_input("Only rows with at least this many mismatched tokens", min_value=0, step=1, key="min_mismatch")
+    st.divider()
+
 try:
-    if st.session_state.get("jump") and int(st.session_state.get("jump")) < len(df) and int(st.session_state.get("jump")) >= 0:
+    if st.session_state.get("jump") and int(st.session_state.get("jump")) < len(batch) and int(st.session_state.get("jump")) >= 0:
         index = int(st.session_state.get("jump"))
+    elif st.session_state.get("index", len(batch)) < len(batch):
+        index = st.session_state["index"]
     else:
-        index = st.session_state.get("index", df.loc[df['adjudicated'] == False].index[0])
+        index = first_pending(queue, batch.column("adjudicated"))
+        if index is None:
+            index = len(batch)
     st.session_state["index"] = index
-    row = df.iloc[index]
+    row = batch.row(index)
 except IndexError:
+    # Rows hidden by the mismatch filter may still be pending; submitting would drop them
+    if (~batch.column("adjudicated").to_numpy(dtype=bool) & ~skipped).any():
+        st.header("No rows left in the current queue.")
+        st.info("Rows with fewer mismatched tokens than the filter in the sidebar still need adjudication. "
+                "Lower the filter to review them.")
+        st.text_input("Jump to row", key="jump", placeholder="Enter row index")
+        profiler.finish()
+        st.stop()
     st.header("All images adjudicated.")
     st.warning("Warning: submitted annotation files cannot be re-annotated. If you need to make changes before submitting, use 'Jump to Row' button below.")
     st.button("Submit Annotations", on_click=submit_final_annotations)
     st.text_input("Jump to row", key="jump", placeholder="Enter row index")
-    st.write(df)
+    st.write(batch.preview(len(batch)))
+    profiler.lap("preview")
+    profiler.finish()
     st.stop()
 
 label_adjusted = st.session_state.get("label_adjusted", False)
@@ -67,27 +94,26 @@ ocr_rejected = st.session_state.get("ocr_rejected", False)
 st.session_state["ocr_rejected"] = ocr_rejected
 
 if "scene_label" not in st.session_state:
-    st.session_state["scene_label"] = df["scene_label"].iloc[index]
+    st.session_state["scene_label"] = row["scene_label"]
 
 # ----------------------
 
-st.header(f"Claude Adjudicator ({index}/{len(df)})", divider='gray')
-
-sidebar = st.sidebar
+st.header(f"Claude Adjudicator ({index}/{len(batch)})", divider='gray')
+profiler.lap("row and sidebar")
 
 # Skip instances where OCR was rejected (label already assigned)
 if row.get("ocr_accepted", True) == False:
-    st.session_state["index"] += 1
+    next_index = next_in_queue(queue, index, batch.column("adjudicated"))
+    st.session_state["index"] = next_index if next_index is not None else len(batch)
     st.rerun()
 
 fpath = row["path"]
-timepoint = row["timePoint"]
+timepoint = row[timepoint_column(row.index)]
 formatted_text = row["cleaned_text"]
 
 # Get frame image from video
-frame = cv2.VideoCapture(fpath)
-frame.set(cv2.CAP_PROP_POS_MSEC, timepoint)
-success, image = frame.read()
+success, image = read_frame(fpath, timepoint)
+profiler.lap("read frame")
 
 # Set styles for annotation panel
 st.markdown("""
@@ -98,66 +124,35 @@ st.markdown("""
 .rejected {
     color: rgb(255, 75, 75);
 }
+.dropped {
+    color: rgb(255, 75, 75);
+    text-decoration: line-through;
+}
+.altered {
+    color: rgb(255, 75, 75);
+}
+.added {
+    color: rgb(33, 195, 84);
+}
 </style>
 """, unsafe_allow_html=True)
 
-def parse_silver_standard(anno):
-    try:
-        words = anno.split()
-        split = [word.split("@") for word in words]
-        phrases = []
-        current_phrase = {}
-        for word, tag in split:
-            if tag == "O": continue
-            b_i, role = tag[0], tag[1:]
-            if b_i == "B":
-                if current_phrase:
-                    phrases.append(tuple(current_phrase.items())[0])
-                    current_phrase = {}
-                current_phrase[role] = word
-            elif b_i == "I":
-                current_phrase[role] += f" {word}"
-        if current_phrase:
-            phrases.append(tuple(current_phrase.items())[0])
-
-        # Construct rfb dict
-        rfb_dict = defaultdict(list)
-        for tag, word in [phrase for phrase in phrases if "R" in phrase[0]]:
-            role_index = tag.split(":")[1]
-            fillers = [phrase[1] for phrase in phrases if phrase[0] == f"F:{role_index}"]
-            rfb_dict[word] = fillers
-        # Get leftover fillers
-        for tag, word in [phrase for phrase in phrases if "F" in phrase[0]]:
-            role_index = tag.split(":")[1]
-            if not any([word in fillers for fillers in rfb_dict.values()]):
-                rfb_dict[""].append(word)
-
-        return rfb_dict
-    except Exception as e:
-        return {"error": "Unparsable string."}
-
 def reject_callback():
-    global df
-    df.loc[index, "accepted"] = False
-    st.session_state["df"] = df
+    batch.set(index, "accepted", False)
     next_example()
 
 def accept_callback():
-    global df
-    df.loc[index, "accepted"] = True
-    st.session_state["df"] = df
+    batch.set(index, "accepted", True)
     next_example()
 
 def edit_callback():
-    global df
-    df.loc[index, "silver_standard_annotation"] = st.session_state["silver_standard"]
-    st.session_state["df"] = df
+    batch.set(index, "silver_standard_annotation", st.session_state["silver_standard"])
+    for column, value in align_row(batch.get(index, "cleaned_text"), st.session_state["silver_standard"]).items():
+        batch.set(index, column, value)
     refresh_all()
 
 
 silver_standard = row["silver_standard_annotation"]
-silver_standard_tokenized = re.sub("@.*? |@.*$", " ", silver_standard).split()
-formatted_text_tokenized = formatted_text.split()
 
 if success:
     col1, col2 = st.columns(2)
@@ -165,54 +160,73 @@ if success:
         # Image panel
         st.image(image, channels="BGR")
         with col1.container(border=True):
-            if silver_standard_tokenized != formatted_text_tokenized:
-                st.write(f"#### :red[{formatted_text}]")
+            if row["mismatch_count"] > 0:
+                with profiler.section("highlight"):
+                    highlighted = highlight_html(formatted_text, silver_standard, row["alignment"])
+                st.markdown(f'<p class="big-font">{highlighted}</p>', unsafe_allow_html=True)
+                st.caption(f"LLM output differs from OCR text: {row['tokens_dropped']} dropped, "
+                           f"{row['tokens_added']} added, {row['tokens_altered']} altered")
             else:
                 st.write(f"#### {formatted_text}")
     with col2:
         with col2.container(border=True):
-            jsonified = parse_silver_standard(silver_standard)
-            st.text_input("Silver standard:", silver_standard, on_change=edit_callback, key="silver_standard")
+            with profiler.section("parse silver standard"):
+                jsonified = parse_silver_standard(silver_standard)
+            st.text_input("Silver standard:", silver_standard, on_change=profiler.timed("edit callback", edit_callback), key="silver_standard")
             st.write(jsonified)
             # OCR text panel
         subcol1, subcol2 = st.columns(2)
         with subcol1:
-            st.button("👎", key="reject", on_click=reject_callback, use_container_width=True)
+            st.button("👎", key="reject", on_click=profiler.timed("reject callback", reject_callback), use_container_width=True)
         with subcol2:
-            st.button("👍", key="accept", on_click=accept_callback, use_container_width=True)
+            st.button("👍", key="accept", on_click=profiler.timed("accept callback", accept_callback), use_container_width=True)
 
 else:
     st.write("Failed to retrieve frame from the specified timepoint.")
+profiler.lap("frame and annotation panels")
 
 
 def next_example():
-    global df, index
-    df.loc[index, "adjudicated"] = True
-    # df.loc[index, "ocr_accepted"] = not st.session_state["ocr_rejected"]
-    df.to_csv(st.session_state["csv_file"], index=False)
-    st.session_state["index"] = index = index + 1
+    global index
+    batch.set(index, "adjudicated", True)
+    # batch.set(index, "ocr_accepted", not st.session_state["ocr_rejected"])
+    with profiler.section("save batch"):
+        batch.save()
+    next_index = next_in_queue(queue, index, batch.column("adjudicated"))
+    if next_index is None:
+        st.session_state["index"] = len(batch)
+        st.session_state["jump"] = None
+        return
+    st.session_state["index"] = index = next_index
     refresh_all()
 
 def refresh_all():
-    global df, index
-    df.loc[index, "accepted"] = False
-    df.loc[index, "adjudicated"] = False
+    global index
+    batch.set(index, "accepted", False)
+    batch.set(index, "adjudicated", False)
     st.session_state["jump"] = None
 
 def undo():
-    global df, index
-    if index > 0:
+    global index
+    previous_index = previous_in_queue(queue, index)
+    if previous_index is not None:
         refresh_all()
-        st.session_state["index"] = index = index - 1
-        df.loc[st.session_state["index"], "adjudicated"] = False
+        st.session_state["index"] = index = previous_index
+        batch.set(st.session_state["index"], "adjudicated", False)
         refresh_all()
-        df.to_csv(st.session_state["csv_file"], index=False)
+        with profiler.section("save batch"):
+            batch.save()
 
 
 with sidebar:
-    st.button("Oops (Undo last annotation)", on_click=undo)
+    st.button("Oops (Undo last annotation)", on_click=profiler.timed("undo callback", undo))
+    with st.expander("Video capture pool"):
+        st.write(default_pool.stats())
+profiler.lap("buttons")
 
 st.divider()
 
 st.text_input("Jump to row", key="jump", placeholder="Enter row index")
-st.write(df)
\ No newline at end of file
+st.write(batch.preview(index))
+profiler.lap("preview")
+profiler.finish()
\ No newline at end of file
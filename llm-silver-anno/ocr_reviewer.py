@@ -1,86 +1,94 @@
 import streamlit as st
 import pandas as pd
-import cv2
 from streamlit_extras.tags import tagger_component
 from streamlit_shortcuts import add_keyboard_shortcuts
 import os
-from utils.clean_ocr import clean_ocr
+from utils.batch_store import open_batch
+from utils.review_queue import FILE_ORDER, LOCALITY_ORDER, QUEUE_COLUMNS, timepoint_column, build_queue, next_in_queue, previous_in_queue, first_pending
+from utils.frames import read_frame, default_pool
+from utils.rerun_profile import rerun_profiler
 
 st.set_page_config(page_title="SWT OCR Annotator", layout="wide")
+profiler = rerun_profiler("ocr_reviewer")
 
 # -- SESSION STATE --
 
 if "csv_file" not in st.session_state:
     uploaded_file = st.file_uploader("Upload CSV file", type=["csv"], key="filepath")
-    uploaded_filename = st.text_input("Or, enter name of already uploaded annotation file", placeholder="filename.csv", key="csv_filename")
+    uploaded_filename = st.text_input("Or, enter name of already uploaded annotation file", placeholder="filename.csv or filename.arrow", key="csv_filename")
+    st.text_input("Annotator name (only needed when several people share one .arrow batch)", key="annotator")
     if uploaded_filename:
         st.session_state["csv_file"] = os.path.join("annotations/1-ocr-in-progress", uploaded_filename)
         st.rerun()
     elif uploaded_file is not None:
-        if os.path.exists(os.path.join("annotations/1-ocr-in-progress", uploaded_file.name)):
-            st.session_state["csv_file"] = os.path.join("annotations/1-ocr-in-progress", uploaded_file.name)
-        else:
-            st.session_state["csv_file"] = uploaded_file
+        st.session_state["csv_file"] = os.path.join("annotations/1-ocr-in-progress", uploaded_file.name)
+        # Keep a server-side copy of new uploads to save annotations into
+        if not os.path.exists(st.session_state["csv_file"]):
+            with open(st.session_state["csv_file"], "wb") as f:
+                f.write(uploaded_file.getvalue())
         st.rerun()
+    profiler.finish()
     st.stop()
 
 if "jump" not in st.session_state:
     st.session_state["jump"] = None
-    
-if "df" not in st.session_state:
-    st.session_state["df"] = pd.read_csv(st.session_state["csv_file"])
-    # Save the name as a string for server saving
-    if not isinstance(st.session_state["csv_file"], str):
-        st.session_state["csv_file"] = os.path.join("annotations/1-ocr-in-progress", st.session_state["csv_file"].name)
-
-df = st.session_state["df"]
 
 # Add annotation fields if not already present
-annotation_fields = ["ocr_accepted", "deleted", "label_adjusted", "annotated"]
-for field in annotation_fields:
-    if field not in df.columns:
-        df[field] = False
-if "cleaned_text" not in df.columns:
-    df["cleaned_text"] = df["textdocument"].apply(clean_ocr)
+if "batch" not in st.session_state:
+    st.session_state["batch"] = open_batch(st.session_state["csv_file"],
+                                           {"ocr_accepted": False, "deleted": False, "label_adjusted": False, "annotated": False},
+                                           st.session_state.get("annotator", ""))
+batch = st.session_state["batch"]
+profiler.lap("open batch")
 
 def submit_final_annotations():
-    df = st.session_state["df"]
+    df = batch.to_frame()
     df = df[df["deleted"] == False]
     df = df.drop(columns=["annotated", "label_adjusted", "deleted", "confidence"], inplace=False)
     df = df.dropna(inplace=False)
-    next_step_path = os.path.join("annotations/2-ocr-complete", os.path.basename(st.session_state["csv_file"]))
+    next_step_path = os.path.join("annotations/2-ocr-complete", batch.output_name)
     df.to_csv(next_step_path, index=False)
-    os.remove(st.session_state["csv_file"])
+    batch.remove()
     st.write("Annnotations completed and submitted!")
     st.balloons()
     st.stop()
 
 def refresh_all():
-    global df, index
-    # df.loc[index, "deleted"] = False
-    # df.loc[index, "label_adjusted"] = False
-    # df.loc[index, "ocr_accepted"] = False
-    st.session_state["ocr_rejected"] = df.loc[index, "annotated"] and not df.loc[index, "ocr_accepted"]
-    st.session_state["scene_label"] = df["scene_label"].iloc[st.session_state["index"]]
-    st.session_state["label_adjusted"] = df.loc[st.session_state["index"], "label_adjusted"]
+    global index
+    # batch.set(index, "deleted", False)
+    # batch.set(index, "label_adjusted", False)
+    # batch.set(index, "ocr_accepted", False)
+    st.session_state["ocr_rejected"] = batch.get(index, "annotated") and not batch.get(index, "ocr_accepted")
+    st.session_state["scene_label"] = batch.get(st.session_state["index"], "scene_label")
+    st.session_state["label_adjusted"] = batch.get(st.session_state["index"], "label_adjusted")
     st.session_state["jump"] = None
 
+queue = build_queue(pd.DataFrame({c: batch.column(c) for c in QUEUE_COLUMNS if c in batch.columns}),
+                    st.session_state.get("queue_order", FILE_ORDER))
+profiler.lap("build queue")
+
 try:
-    if st.session_state.get("jump") and int(st.session_state.get("jump")) < len(df) and int(st.session_state.get("jump")) >= 0:
+    if st.session_state.get("jump") and int(st.session_state.get("jump")) < len(batch) and int(st.session_state.get("jump")) >= 0:
         index = int(st.session_state.get("jump"))
         refresh_all()
         st.write(f"rejected: {st.session_state['ocr_rejected']}, label_adjusted: {st.session_state['label_adjusted']}"
                  f"index: {index}, jump: {st.session_state.get('jump')}")
+    elif "index" in st.session_state:
+        index = st.session_state["index"]
     else:
-        index = st.session_state.get("index", df.loc[df['annotated'] == False].index[0])
+        index = first_pending(queue, batch.column("annotated"))
+    if index is None or index >= len(batch):
+        raise IndexError
     st.session_state["index"] = index
 except IndexError:
-    st.session_state["index"] = len(df)
+    st.session_state["index"] = len(batch)
     st.header("All images annotated.")
     st.warning("Warning: submitted annotation files cannot be re-annotated. If you need to make changes before submitting, use 'Jump to Row' button below.")
     st.button("Submit Annotations", on_click=submit_final_annotations)
     st.text_input("Jump to row", key="jump", placeholder="Enter row index")
-    st.write(df)
+    st.write(batch.preview(len(batch)))
+    profiler.lap("preview")
+    profiler.finish()
     st.stop()
 
 label_adjusted = st.session_state.get("label_adjusted", False)
@@ -90,11 +98,11 @@ ocr_rejected = st.session_state.get("ocr_rejected", False)
 st.session_state["ocr_rejected"] = ocr_rejected
 
 if "scene_label" not in st.session_state:
-    st.session_state["scene_label"] = df["scene_label"].iloc[index]
+    st.session_state["scene_label"] = batch.get(index, "scene_label")
 
 # ----------------------
 
-st.header(f"SWT OCR Annotator ({index}/{len(df)})", divider='gray')
+st.header(f"SWT OCR Annotator ({index}/{len(batch)})", divider='gray')
 
 sidebar = st.sidebar
 with sidebar:
@@ -103,6 +111,8 @@ with sidebar:
     swap_key = st.text_input("Swap Key", key="swap", value="s")
     delete_key = st.text_input("Delete Key", key="delete", value="Ctrl+Shift+X")
     st.divider()
+    st.selectbox("Order rows by", [FILE_ORDER, LOCALITY_ORDER], key="queue_order")
+    st.divider()
 
 
 # Shortcuts for key logging
@@ -118,17 +128,19 @@ add_keyboard_shortcuts({
     swap_key: 'Swap',
     delete_key: 'Delete'
 })
+profiler.lap("sidebar and shortcuts")
 
-row = df.iloc[index]
+row = batch.row(index)
 fpath = row["path"]
-timepoint = row["timepoint"]
+timepoint = row[timepoint_column(row.index)]
 scene_label = row["scene_label"]
 formatted_text = str(row["cleaned_text"]).replace("\n", "<br>")
 
+profiler.lap("row")
+
 # Get frame image from video
-frame = cv2.VideoCapture(fpath)
-frame.set(cv2.CAP_PROP_POS_MSEC, timepoint)
-success, image = frame.read()
+success, image = read_frame(fpath, timepoint)
+profiler.lap("read frame")
 
 # Set styles for annotation panel
 st.markdown("""
@@ -163,10 +175,10 @@ if success:
 
 else:
     st.write("Failed to retrieve frame from the specified timepoint.")
+profiler.lap("frame and text panels")
 
 def submit_callback():
-    global df
-    df.loc[index, "ocr_accepted"] = not st.session_state["ocr_rejected"]
+    batch.set(index, "ocr_accepted", not st.session_state["ocr_rejected"])
     next_example()
 
 def reject_callback():
@@ -174,34 +186,40 @@ def reject_callback():
     st.session_state["ocr_rejected"] = ocr_rejected
 
 def swap_callback():
-    global df
     new_scene_label = "credits" if st.session_state["scene_label"] == "chyron" else "chyron"
-    df.loc[index, "scene_label"] = new_scene_label
-    df.loc[index, "label_adjusted"] = not st.session_state["label_adjusted"]
+    batch.set(index, "scene_label", new_scene_label)
+    batch.set(index, "label_adjusted", not st.session_state["label_adjusted"])
     st.session_state["scene_label"] = new_scene_label
     st.session_state["label_adjusted"] = not st.session_state["label_adjusted"]
 
 def delete_callback():
-    global df
-    df.loc[index, "deleted"] = not df.loc[index, "deleted"]
+    batch.set(index, "deleted", not batch.get(index, "deleted"))
     next_example()
 
 def next_example():
-    global df, index
-    df.loc[index, "annotated"] = True
-    df.loc[index, "ocr_accepted"] = not st.session_state["ocr_rejected"]
-    df.to_csv(st.session_state["csv_file"], index=False)
-    st.session_state["index"] = index = index + 1
+    global index
+    batch.set(index, "annotated", True)
+    batch.set(index, "ocr_accepted", not st.session_state["ocr_rejected"])
+    with profiler.section("save batch"):
+        batch.save()
+    next_index = next_in_queue(queue, index, batch.column("annotated"))
+    if next_index is None:
+        st.session_state["index"] = len(batch)
+        st.session_state["jump"] = None
+        return
+    st.session_state["index"] = index = next_index
     refresh_all()
 
 def undo():
-    global df, index
-    if index > 0:
+    global index
+    previous_index = previous_in_queue(queue, index)
+    if previous_index is not None:
         refresh_all()
-        st.session_state["index"] = index = index - 1
-        df.loc[st.session_state["index"], "annotated"] = False
+        st.session_state["index"] = index = previous_index
+        batch.set(st.session_state["index"], "annotated", False)
         refresh_all()
-        df.to_csv(st.session_state["csv_file"], index=False)
+        with profiler.section("save batch"):
+            batch.save()
 
 # Custom CSS to improve alignment issues
 st.markdown("""
@@ -220,18 +238,23 @@ st.markdown("""
 
 button_col1, button_col2, button_col3, button_col4 = st.columns(4)
 with button_col1:
-    st.button("Submit", on_click=submit_callback)
+    st.button("Submit", on_click=profiler.timed("submit callback", submit_callback))
 with button_col2:
-    st.button("UN-reject" if st.session_state['ocr_rejected'] else "Reject", on_click=reject_callback)
+    st.button("UN-reject" if st.session_state['ocr_rejected'] else "Reject", on_click=profiler.timed("reject callback", reject_callback))
 with button_col3:
-    st.button("Swap", on_click=swap_callback)
+    st.button("Swap", on_click=profiler.timed("swap callback", swap_callback))
 with button_col4:
-    st.button("UN-delete-and-submit" if row['deleted'] else "Delete-and-submit", on_click=delete_callback)
+    st.button("UN-delete-and-submit" if row['deleted'] else "Delete-and-submit", on_click=profiler.timed("delete callback", delete_callback))
 
 with sidebar:
-    st.button("Oops (Undo last annotation)", on_click=undo)
+    st.button("Oops (Undo last annotation)", on_click=profiler.timed("undo callback", undo))
+    with st.expander("Video capture pool"):
+        st.write(default_pool.stats())
+profiler.lap("buttons")
 
 st.divider()
 
 st.text_input("Jump to row", key="jump", placeholder="Enter row index")
-st.write(df)
+st.write(batch.preview(index))
+profiler.lap("preview")
+profiler.finish()
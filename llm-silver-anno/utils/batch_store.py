@@ -0,0 +1,310 @@
+import argparse
+import glob
+import os
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc
+
+# Allow `python utils/batch_store.py` as well as `import utils.batch_store`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.clean_ocr import clean_ocr_batch
+from utils.token_align import add_alignment_columns
+
+ARROW_SUFFIX = ".arrow"
+DECISIONS_SUFFIX = ".decisions.csv"
+
+# Process-level cache of memory-mapped tables, shared by every Streamlit session
+_shared_tables = {}
+_shared_columns = {}
+_shared_lock = threading.Lock()
+
+
+def prepare_batch(df: pd.DataFrame) -> pd.DataFrame:
+    """Adds the derived columns the reviewer apps need, if they are missing."""
+    if "cleaned_text" not in df.columns and "textdocument" in df.columns:
+        df["cleaned_text"] = clean_ocr_batch(df["textdocument"])
+    if "silver_standard_annotation" in df.columns and "mismatch_count" not in df.columns:
+        df = add_alignment_columns(df)
+    return df
+
+
+def csv_to_arrow(csv_path: str, arrow_path: str = None) -> str:
+    """
+    Converts a batch CSV to an uncompressed Arrow IPC file, which can be memory-mapped
+    without copying. Returns the path of the Arrow file.
+    """
+    if arrow_path is None:
+        arrow_path = os.path.splitext(csv_path)[0] + ARROW_SUFFIX
+    df = prepare_batch(pd.read_csv(csv_path))
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp_path = f"{arrow_path}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, arrow_path)
+    return arrow_path
+
+
+def arrow_to_csv(arrow_path: str, csv_path: str, annotator: str = "") -> None:
+    """
+    Writes an Arrow batch, merged with an annotator's decisions if any, back to CSV.
+    Decision columns not in the batch default to False, as they do in the reviewer apps.
+    """
+    fields = {}
+    sidecar = decisions_path(arrow_path, annotator)
+    if os.path.exists(sidecar):
+        table_columns = set(shared_table(arrow_path).column_names)
+        fields = {c: False for c in pd.read_csv(sidecar, nrows=0).columns.drop("row") if c not in table_columns}
+    ArrowBatch(arrow_path, fields, annotator).to_frame().to_csv(csv_path, index=False)
+
+
+def shared_table(path: str) -> pa.Table:
+    """Returns the memory-mapped table for `path`, opening it once per process and file version."""
+    return _shared_table(_table_key(path))
+
+
+def _table_key(path: str) -> tuple:
+    path = os.path.abspath(path)
+    return path, os.stat(path).st_mtime_ns
+
+
+def _shared_table(key: tuple) -> pa.Table:
+    with _shared_lock:
+        table = _shared_tables.get(key)
+        if table is None:
+            # Forget older versions of the same file
+            for stale in [k for k in _shared_tables if k[0] == key[0]]:
+                del _shared_tables[stale]
+            for stale in [k for k in _shared_columns if k[0] == key[0]]:
+                del _shared_columns[stale]
+            with pa.memory_map(key[0], "r") as source:
+                table = pa.ipc.open_file(source).read_all()
+            _shared_tables[key] = table
+    return table
+
+
+def shared_column(path: str, name: str) -> pd.Series:
+    """Returns a column of a shared table as a (process-wide, read-only) pandas Series."""
+    table_key = _table_key(path)
+    table = _shared_table(table_key)
+    key = (*table_key, name)
+    with _shared_lock:
+        column = _shared_columns.get(key)
+        if column is None:
+            column = table.column(name).to_pandas()
+            _shared_columns[key] = column
+    return column
+
+
+def decisions_path(arrow_path: str, annotator: str = "") -> str:
+    stem = os.path.splitext(arrow_path)[0]
+    return f"{stem}.{annotator}{DECISIONS_SUFFIX}" if annotator else f"{stem}{DECISIONS_SUFFIX}"
+
+
+def open_batch(path: str, fields: dict, annotator: str = ""):
+    """Opens a batch for review: `.arrow` files are shared across sessions, CSVs are not."""
+    if path.endswith(ARROW_SUFFIX):
+        return ArrowBatch(path, fields, annotator)
+    return CsvBatch(path, fields)
+
+
+class CsvBatch:
+    """
+    A batch loaded from CSV into this session's own DataFrame. Decisions are stored as
+    columns of the frame, and saving rewrites the whole CSV.
+    """
+
+    def __init__(self, path: str, fields: dict):
+        self.path = path
+        self.frame = prepare_batch(pd.read_csv(path))
+        for field, default in fields.items():
+            if field not in self.frame.columns:
+                self.frame[field] = default
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def columns(self):
+        return list(self.frame.columns)
+
+    @property
+    def output_name(self):
+        return os.path.basename(self.path)
+
+    def row(self, i: int) -> pd.Series:
+        return self.frame.iloc[i]
+
+    def get(self, i: int, column: str):
+        return self.frame[column].iloc[i]
+
+    def set(self, i: int, column: str, value):
+        self.frame.loc[self.frame.index[i], column] = value
+
+    def column(self, name: str) -> pd.Series:
+        return self.frame[name]
+
+    def window(self, start: int, stop: int) -> pd.DataFrame:
+        return self.frame.iloc[max(start, 0):stop]
+
+    def preview(self, around: int) -> pd.DataFrame:
+        """The rows shown under the annotation panel: the whole file, as it always was."""
+        return self.frame
+
+    def to_frame(self) -> pd.DataFrame:
+        return self.frame.copy()
+
+    def save(self):
+        self.frame.to_csv(self.path, index=False)
+
+    def remove(self):
+        os.remove(self.path)
+
+
+class ArrowBatch:
+    """
+    A batch backed by a memory-mapped Arrow file shared by every session in the process.
+    Only this annotator's decisions live in the session: the `fields` columns, plus
+    overrides of shared columns the annotator edited. Saving writes the touched rows to a
+    small `<batch>[.<annotator>].decisions.csv` sidecar.
+    """
+
+    def __init__(self, path: str, fields: dict, annotator: str = ""):
+        self.path = path
+        self.annotator = annotator
+        self.table = shared_table(path)
+        self.decisions_path = decisions_path(path, annotator)
+        n_rows = self.table.num_rows
+        self.decisions = pd.DataFrame(index=pd.RangeIndex(n_rows))
+        for field, default in fields.items():
+            if field in self.table.column_names:
+                self.decisions[field] = self.table.column(field).to_pandas()
+            else:
+                self.decisions[field] = np.full(n_rows, default)
+        self.overrides = {}
+        self.touched = set()
+        if os.path.exists(self.decisions_path):
+            self._load_decisions()
+
+    def _load_decisions(self):
+        saved = pd.read_csv(self.decisions_path)
+        for column in saved.columns.drop("row"):
+            values = saved[["row", column]].dropna()
+            if column in self.table.column_names and pa.types.is_integer(self.table.schema.field(column).type):
+                values[column] = values[column].astype(int)
+            if column in self.decisions.columns:
+                self.decisions.loc[values["row"].to_numpy(), column] = values[column].to_numpy()
+            else:
+                self.overrides[column] = dict(zip(values["row"], values[column]))
+        self.touched.update(saved["row"].tolist())
+
+    def __len__(self):
+        return self.table.num_rows
+
+    @property
+    def columns(self):
+        return self.table.column_names + [c for c in self.decisions.columns if c not in self.table.column_names]
+
+    @property
+    def output_name(self):
+        stem = os.path.splitext(os.path.basename(self.path))[0]
+        return f"{stem}.{self.annotator}.csv" if self.annotator else f"{stem}.csv"
+
+    def row(self, i: int) -> pd.Series:
+        values = self.table.slice(i, 1).to_pylist()[0]
+        values.update(self.decisions.iloc[i].to_dict())
+        for column, edits in self.overrides.items():
+            if i in edits:
+                values[column] = edits[i]
+        return pd.Series(values, name=i)
+
+    def get(self, i: int, column: str):
+        if column in self.decisions.columns:
+            return self.decisions[column].iat[i]
+        if i in self.overrides.get(column, {}):
+            return self.overrides[column][i]
+        return self.table.column(column)[i].as_py()
+
+    def set(self, i: int, column: str, value):
+        if column in self.decisions.columns:
+            self.decisions.loc[i, column] = value
+        else:
+            self.overrides.setdefault(column, {})[i] = value
+        self.touched.add(i)
+
+    def column(self, name: str) -> pd.Series:
+        if name in self.decisions.columns:
+            return self.decisions[name]
+        column = shared_column(self.path, name)
+        edits = self.overrides.get(name)
+        if edits:
+            column = column.copy()
+            column.iloc[list(edits)] = list(edits.values())
+        return column
+
+    def _merge(self, frame: pd.DataFrame, start: int = 0) -> pd.DataFrame:
+        for field in self.decisions.columns:
+            frame[field] = self.decisions[field].iloc[start:start + len(frame)].to_numpy()
+        for column, edits in self.overrides.items():
+            rows = np.fromiter(edits.keys(), dtype=int, count=len(edits))
+            values = pd.Series(list(edits.values()), dtype=object).infer_objects().to_numpy()
+            in_window = (rows >= start) & (rows < start + len(frame))
+            if column not in frame.columns:
+                frame[column] = None
+            frame.loc[rows[in_window] - start, column] = values[in_window]
+        frame.index = pd.RangeIndex(start, start + len(frame))
+        return frame
+
+    def window(self, start: int, stop: int) -> pd.DataFrame:
+        start, stop = max(start, 0), min(stop, len(self))
+        return self._merge(self.table.slice(start, stop - start).to_pandas(), start)
+
+    def preview(self, around: int, rows: int = 100) -> pd.DataFrame:
+        """The rows shown under the annotation panel, limited to a window around the cursor."""
+        return self.window(around - rows // 2, around + rows // 2)
+
+    def to_frame(self) -> pd.DataFrame:
+        return self._merge(self.table.to_pandas())
+
+    def save(self):
+        rows = sorted(self.touched)
+        saved = self.decisions.loc[rows].copy()
+        for column, edits in self.overrides.items():
+            saved[column] = [edits.get(i) for i in rows]
+        saved.insert(0, "row", rows)
+        tmp_path = f"{self.decisions_path}.tmp"
+        saved.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, self.decisions_path)
+
+    def remove(self):
+        """Removes this annotator's decisions, and the shared batch once nobody else has any."""
+        if os.path.exists(self.decisions_path):
+            os.remove(self.decisions_path)
+        stem = os.path.splitext(self.path)[0]
+        if not glob.glob(f"{glob.escape(stem)}*{DECISIONS_SUFFIX}"):
+            os.remove(self.path)
+
+
+if __name__ == "__main__":
+    # To convert a batch for shared review, and back, run e.g.:
+    # python utils/batch_store.py to-arrow annotations/1-ocr-in-progress/anno.csv
+    # python utils/batch_store.py to-csv annotations/1-ocr-in-progress/anno.arrow anno.csv --annotator alice
+
+    parser = argparse.ArgumentParser(description="Convert review batches between CSV and memory-mapped Arrow files")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    to_arrow = subparsers.add_parser("to-arrow", help="Convert a batch CSV to an Arrow file")
+    to_arrow.add_argument("input_file", help="Input CSV file path")
+    to_arrow.add_argument("output_file", nargs="?", default=None, help="Output Arrow file path (default: alongside the CSV)")
+    to_csv = subparsers.add_parser("to-csv", help="Convert an Arrow batch (with an annotator's decisions) to CSV")
+    to_csv.add_argument("input_file", help="Input Arrow file path")
+    to_csv.add_argument("output_file", help="Output CSV file path")
+    to_csv.add_argument("--annotator", default="", help="Merge this annotator's decisions into the output")
+    args = parser.parse_args()
+
+    if args.command == "to-arrow":
+        print(f"Wrote {csv_to_arrow(args.input_file, args.output_file)}")
+    else:
+        arrow_to_csv(args.input_file, args.output_file, args.annotator)
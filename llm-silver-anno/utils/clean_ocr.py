@@ -1,6 +1,12 @@
+import re
+from multiprocessing import Pool
+
 import pandas as pd
 import argparse
 
+# Rows per chunk when the CLI streams a CSV through worker processes
+CHUNKSIZE = 100000
+
 
 def has_alnum(string: str) -> bool:
     """Returns True if any character in the string is an alphanumeric."""
@@ -25,19 +31,62 @@ def clean_ocr(text_document: str) -> list[str]:
     return " ".join(cleaned)
 
 
-def main(input_file, output_file):
-    df = pd.read_csv(input_file, usecols=['textdocument'])
-    df['cleaned'] = df['textdocument'].map(clean_ocr)
-    df.to_csv(output_file, index=True)
+# A token clean_ocr keeps: whitespace-separated (`\s` is exactly str.isspace), at least two
+# characters long and containing a letter (`[^\W\d_]`, which also admits some numerics)
+TOKEN = re.compile(r"(?<!\S)(?=\S*?[^\W\d_])\S{2,}")
+
+
+def clean_ocr_fast(text_document: str) -> str:
+    """
+    clean_ocr through one compiled regex instead of per-character Python loops, with
+    identical output: non-ASCII tokens are checked with has_alpha, since TOKEN also takes
+    numerics like '½' for letters, and texts with a '&' (kept on its own only on lines
+    that have a letter) go through clean_ocr itself.
+    """
+    if "&" in text_document:
+        return clean_ocr(text_document)
+    tokens = TOKEN.findall(text_document)
+    if not text_document.isascii():
+        tokens = [token for token in tokens if token.isascii() or has_alpha(token)]
+    return " ".join(tokens)
+
+
+def clean_ocr_batch(texts: pd.Series) -> pd.Series:
+    """clean_ocr for a whole column, with identical output. Missing values stay missing."""
+    texts = pd.Series(texts)
+    return pd.Series([clean_ocr_fast(text) if isinstance(text, str) else text for text in texts],
+                     index=texts.index, dtype=object)
+
+
+def clean_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    chunk['cleaned'] = clean_ocr_batch(chunk['textdocument'])
+    return chunk
+
+
+def main(input_file, output_file, processes=1, chunksize=CHUNKSIZE):
+    chunks = pd.read_csv(input_file, usecols=['textdocument'], chunksize=chunksize)
+    pool = Pool(processes) if processes != 1 else None
+    try:
+        cleaned = pool.imap(clean_chunk, chunks) if pool is not None else map(clean_chunk, chunks)
+        for i, chunk in enumerate(cleaned):
+            chunk.to_csv(output_file, index=True, mode='w' if i == 0 else 'a', header=i == 0)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
 
 
 if __name__ == '__main__':
     # To run standalone on a CSV file, run e.g.:
     # python clean_ocr.py input.csv output.csv
-    
+    # or, for a large file, with one worker process per CPU:
+    # python clean_ocr.py input.csv output.csv --processes 0
+
     parser = argparse.ArgumentParser(description='Clean OCR text')
     parser.add_argument('input_file', type=str, help='Input CSV file path')
     parser.add_argument('output_file', type=str, help='Output CSV file path')
+    parser.add_argument('--processes', type=int, default=1, help='Worker processes (0: one per CPU)')
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE, help='Rows read and cleaned at a time')
     args = parser.parse_args()
 
-    main(args.input_file, args.output_file)
\ No newline at end of file
+    main(args.input_file, args.output_file, args.processes or None, args.chunksize)
@@ -0,0 +1,128 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import cv2
+
+# How many videos may stay open at once; override with the CAPTURE_POOL_SIZE environment variable
+DEFAULT_MAX_OPEN = int(os.environ.get("CAPTURE_POOL_SIZE", 8))
+
+
+class _PooledCapture:
+    def __init__(self, capture):
+        self.capture = capture
+        self.lock = threading.Lock()
+        self.in_use = 0
+
+
+class CapturePool:
+    """
+    Process-wide pool of open cv2.VideoCapture handles keyed by video path. Opening a
+    container (header parse, index build) is paid once per video instead of once per frame,
+    the least recently used idle handles are released once more than `max_open` are open,
+    and a handle is only ever used by one thread at a time.
+    """
+
+    def __init__(self, max_open: int = DEFAULT_MAX_OPEN):
+        self.max_open = max_open
+        self._captures = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.open_seconds = 0.0
+
+    @contextmanager
+    def checkout(self, path: str):
+        """Yields an open capture for `path` (or None if the video cannot be opened)."""
+        entry = self._acquire(path)
+        if entry is None:
+            yield None
+            return
+        try:
+            with entry.lock:
+                yield entry.capture
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+
+    def _acquire(self, path: str):
+        with self._lock:
+            entry = self._captures.get(path)
+            if entry is not None:
+                self.hits += 1
+                entry.in_use += 1
+                self._captures.move_to_end(path)
+                return entry
+            self.misses += 1
+
+        # Open outside the pool lock so one slow container doesn't block other videos
+        start = time.perf_counter()
+        capture = cv2.VideoCapture(path)
+        elapsed = time.perf_counter() - start
+        if not capture.isOpened():
+            capture.release()
+            with self._lock:
+                self.open_seconds += elapsed
+            return None
+
+        with self._lock:
+            self.open_seconds += elapsed
+            entry = self._captures.get(path)
+            if entry is None:
+                entry = self._captures[path] = _PooledCapture(capture)
+                capture = None
+            entry.in_use += 1
+            self._captures.move_to_end(path)
+            evicted = self._evict()
+        # Another thread opened the same video first; keep theirs
+        if capture is not None:
+            capture.release()
+        for stale in evicted:
+            stale.release()
+        return entry
+
+    def _evict(self) -> list:
+        """Removes least recently used idle handles above max_open. Call with the pool lock held."""
+        evicted = []
+        for path in list(self._captures):
+            if len(self._captures) <= self.max_open:
+                break
+            if self._captures[path].in_use == 0:
+                evicted.append(self._captures.pop(path).capture)
+                self.evictions += 1
+        return evicted
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "open": len(self._captures),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "open_seconds": self.open_seconds,
+            }
+
+    def close_all(self):
+        with self._lock:
+            captures = [entry.capture for entry in self._captures.values() if entry.in_use == 0]
+            self._captures = OrderedDict((p, e) for p, e in self._captures.items() if e.in_use > 0)
+        for capture in captures:
+            capture.release()
+
+
+# Shared by every Streamlit session (and thread) in the process
+default_pool = CapturePool()
+
+
+def read_frame(path: str, timepoint: float, pool: CapturePool = default_pool) -> tuple[bool, object]:
+    """Reads the frame at `timepoint` (ms) from the video at `path` using a pooled capture."""
+    with pool.checkout(path) as capture:
+        if capture is None:
+            return False, None
+        capture.set(cv2.CAP_PROP_POS_MSEC, timepoint)
+        return capture.read()
@@ -1,29 +1,141 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+import csv
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from tqdm import tqdm
 import argparse
 
-cached_paths = {}
-for prev_csv in Path(__file__).parent.parent.glob("*paths.csv"):
-    df = pd.read_csv(prev_csv)
-    cached_paths.update(pd.Series(df.path.values, index=df.guid).to_dict())
+# New lookups are appended here; every *paths.csv next to it is read back as the cache
+CACHE_FILE = Path(__file__).parent.parent / "paths.csv"
+CONCURRENCY = 8
+RETRIES = 3
+TIMEOUT = 30
 
 
-def get_full_path(guid, url):
+def read_cached_paths(directory=CACHE_FILE.parent) -> dict:
+    """{guid: path} from every *paths.csv in `directory`."""
+    paths = {}
+    for prev_csv in Path(directory).glob("*paths.csv"):
+        df = pd.read_csv(prev_csv)
+        paths.update(pd.Series(df.path.values, index=df.guid).to_dict())
+    return paths
+
+
+cached_paths = read_cached_paths()
+
+
+def make_session(concurrency=CONCURRENCY, retries=RETRIES):
+    """A session whose connection pool fits `concurrency` threads, retrying failed requests with backoff."""
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                  allowed_methods=["GET"])
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_full_path(guid, url, session=None):
     if guid in cached_paths:
         return cached_paths[guid]
     full_url = f"{url}/searchapi?file=video&guid={guid}"
-    response = requests.get(full_url)
+    response = (session or requests).get(full_url, timeout=TIMEOUT)
+    response.raise_for_status()
     data = response.json()
+    if not data:
+        raise LookupError(f"no video found for {guid}")
     return data[0]
 
 
-def process_data(input_file, output_file, url):
-    tqdm.pandas()
+def resolve_paths(guids, url, concurrency=CONCURRENCY, retries=RETRIES, cache_file=CACHE_FILE) -> dict:
+    """
+    Returns {guid: path} for the distinct GUIDs given, looking up each uncached GUID once,
+    `concurrency` at a time over one pooled session. New paths are appended to
+    `cache_file` as they arrive, so later runs (and an interrupted one) don't ask again.
+    GUIDs that still fail after `retries` retries map to None.
+    """
+    guids = list(dict.fromkeys(guids))
+    todo = [guid for guid in guids if guid not in cached_paths]
+    failures = {}
+    if todo:
+        new_file = not Path(cache_file).exists()
+        with make_session(concurrency, retries) as session, ThreadPoolExecutor(concurrency) as pool, \
+                open(cache_file, "a", newline="") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(["guid", "path"])
+            futures = {pool.submit(get_full_path, guid, url, session): guid for guid in todo}
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                guid = futures[future]
+                try:
+                    path = future.result()
+                except Exception as e:
+                    failures[guid] = e
+                    continue
+                cached_paths[guid] = path
+                writer.writerow([guid, path])
+                f.flush()
+    print(f"{len(guids)} GUIDs: {len(guids) - len(todo)} cached, {len(todo) - len(failures)} looked up, "
+          f"{len(failures)} failed")
+    for guid, error in list(failures.items())[:5]:
+        print(f"  {guid}: {error}")
+    return {guid: cached_paths.get(guid) for guid in guids}
+
+
+def stream_paths(frames, url, concurrency=CONCURRENCY, retries=RETRIES, cache_file=CACHE_FILE):
+    """
+    `resolve_paths` for a stream of DataFrames (e.g. one per MMIF file): each uncached
+    GUID is looked up as soon as its first rows arrive, and each DataFrame is yielded in
+    order, with a `path` column, once its GUIDs are resolved. At most `concurrency`
+    DataFrames wait on lookups at a time.
+    """
+    new_file = not Path(cache_file).exists()
+    lookups = {}
+    failures = {}
+    waiting = deque()
+    with make_session(concurrency, retries) as session, ThreadPoolExecutor(concurrency) as pool, \
+            open(cache_file, "a", newline="") as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(["guid", "path"])
+
+        def finish(df):
+            for guid in df["guid"].unique():
+                if guid in cached_paths or guid in failures:
+                    continue
+                try:
+                    cached_paths[guid] = lookups[guid].result()
+                except Exception as e:
+                    failures[guid] = e
+                    continue
+                writer.writerow([guid, cached_paths[guid]])
+            f.flush()
+            df["path"] = df["guid"].map(cached_paths)
+            return df
+
+        for df in frames:
+            for guid in df["guid"].unique():
+                if guid not in cached_paths and guid not in lookups:
+                    lookups[guid] = pool.submit(get_full_path, guid, url, session)
+            waiting.append(df)
+            while waiting and (len(waiting) > concurrency
+                               or all(lookups[guid].done() for guid in waiting[0]["guid"].unique() if guid in lookups)):
+                yield finish(waiting.popleft())
+        while waiting:
+            yield finish(waiting.popleft())
+    print(f"{len(lookups)} GUIDs looked up, {len(failures)} failed")
+    for guid, error in list(failures.items())[:5]:
+        print(f"  {guid}: {error}")
+
 
+def process_data(input_file, output_file, url, concurrency=CONCURRENCY, retries=RETRIES):
     df = pd.read_csv(input_file)
-    df["path"] = df["guid"].progress_apply(get_full_path, args=(url,))
+    paths = resolve_paths(df["guid"], url, concurrency, retries)
+    df["path"] = df["guid"].map(paths)
     df.to_csv(output_file, index=False)
 
 
@@ -32,6 +144,8 @@ if __name__ == "__main__":
     parser.add_argument("--input", required=True, help="Input CSV file path")
     parser.add_argument("--output", required=True, help="Output CSV file path")
     parser.add_argument("--url", required=True, help="URL (including port) for the search API")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Lookups in flight")
+    parser.add_argument("--retries", type=int, default=RETRIES, help="Retries per lookup before giving up")
     args = parser.parse_args()
 
-    process_data(args.input, args.output, args.url)
+    process_data(args.input, args.output, args.url, args.concurrency, args.retries)
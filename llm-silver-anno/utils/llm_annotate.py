@@ -1,20 +1,47 @@
 import anthropic
 from dotenv import load_dotenv
 import os
+import sys
+import asyncio
+import json
+import re
 import pandas as pd
 from tqdm import tqdm
 import time
 import argparse
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Allow `python utils/llm_annotate.py` as well as `import utils.llm_annotate`
+sys.path.insert(0, BASE_DIR)
+from utils.token_align import add_alignment_columns
+from utils.llm_validate import validation_error
+from utils.llm_engine import AnnotationEngine, Job, estimate_input_tokens
+from utils.llm_cache import ResponseCache
+from utils.llm_batches import BatchRunner, POLL_INTERVAL
+from utils.llm_metrics import MetricsLog
+from utils.llm_prepass import load_completed, rule_annotation
+
 load_dotenv(dotenv_path=os.path.join(BASE_DIR, ".env"))
 client = anthropic.Anthropic()
 
-tqdm.pandas()
+MODEL = "claude-3-haiku-20240307"
+# max_tokens is sized from the input (see max_tokens_for), between these bounds
+MAX_TOKENS = 100
+MAX_OUTPUT_TOKENS = 4096
+# Rough output tokens for one "@BF:12"-style tag
+TAG_TOKENS = 4
+# Extra rounds for rows whose annotation fails validation
+VALIDATION_RETRIES = 1
 
-def annotate_chyron(cleaned_ocr):
+# Defaults for the async engine; keep them under the account's rate limits
+CONCURRENCY = 8
+REQUESTS_PER_MINUTE = 50
+TOKENS_PER_MINUTE = 50000
+MAX_RETRIES = 5
+
+CACHE_FILE = os.path.join(BASE_DIR, ".llm_cache.sqlite")
 
-    system_message = """
+CHYRON_SYSTEM_MESSAGE = """
     INSTRUCTIONS: Your job is to match roles and fillers (names) in the following OCR text, which represents a screenshot taken from a public broadcast video. The frame type is CHYRON, meaning the names will typically -- but not always -- appear before their role. Also, typically -- but not always -- there will only be a single name, though it may be attached to multiple roles. Do NOT correct any misspellings. There may be text in the input that does not fit as either a role or filler - in those cases, tag them with O.
     In most cases, every role should correspond with at least one filler, and vice versa. However, there may be some roles that do not have a corresponding filler, or some fillers without a corresponding role.
 
@@ -47,22 +74,7 @@ def annotate_chyron(cleaned_ocr):
     The most important thing to remember: THE OUTPUT SHOULD BE IDENTICAL TO THE INPUT, VERBATIM, WITH THE ROLE-FILLER TAGS APPENDED TO THE END OF EACH WORD! Do not alter the input text in any other way.
     """
 
-    message = client.messages.create(
-        model="claude-3-haiku-20240307",
-        max_tokens=100,
-        temperature=0.0,
-        system=system_message,
-            messages=[
-            {"role": "user", "content": cleaned_ocr}
-        ]
-    )
-
-    return message.content[0].text
-
-
-def annotate_credit(cleaned_ocr):
-
-    system_message = """
+CREDIT_SYSTEM_MESSAGE = """
     INSTRUCTIONS: Your job is to match roles and fillers (names) in the following OCR text, which represents a screenshot taken from a public broadcast video. The frame type is CREDIT, meaning the names will typically -- but not always -- appear AFTER their role. There may be multiple names corresponding with a given role. Do NOT correct any misspellings. There may be text in the input that does not fit as either a role or filler - in those cases, tag them with O.
     In most cases, every role should correspond with at least one filler, and vice versa. However, there may be some roles that do not have a corresponding filler, or some fillers without a corresponding role.
 
@@ -92,61 +104,485 @@ def annotate_credit(cleaned_ocr):
 
     The most important thing to remember: THE OUTPUT SHOULD BE IDENTICAL TO THE INPUT, VERBATIM, WITH THE ROLE-FILLER TAGS APPENDED TO THE END OF EACH WORD! Do not alter the input text in any other way.    """
 
-    message = client.messages.create(
-        model="claude-3-haiku-20240307",
-        max_tokens=100,
+SYSTEM_MESSAGES = {"chyron": CHYRON_SYSTEM_MESSAGE, "credits": CREDIT_SYSTEM_MESSAGE}
+
+# Appended to the system message when several rows are packed into one request
+PACKED_INSTRUCTIONS = """
+    PACKED INPUT: The input contains several OCR strings, one per line, each prefixed with its number and a colon (for example "1: Stanley Kubrick Writer"). Annotate each string on its own, following the instructions above, and output exactly one line per input string, prefixed with the same number and a colon, in the same order (for example "1: Stanley@BF:1 Kubrick@IF:1 Writer@BR:1"). Output nothing else.
+    """
+
+PACKED_LINE = re.compile(r"^\s*(\d+)\s*:\s*(.*?)\s*$")
+
+
+def max_tokens_for(cleaned_ocr):
+    """Room for the OCR text with a tag on every word, plus a 50% margin."""
+    needed = len(cleaned_ocr) / 3 + len(cleaned_ocr.split()) * TAG_TOKENS
+    return int(min(MAX_OUTPUT_TOKENS, max(MAX_TOKENS, needed * 1.5)))
+
+
+def build_request(scene_label, cleaned_ocr, max_tokens=None):
+    """The keyword arguments for `messages.create` to annotate one row."""
+    return dict(
+        model=MODEL,
+        max_tokens=max_tokens or max_tokens_for(cleaned_ocr),
         temperature=0.0,
-        system=system_message,
-            messages=[
+        system=SYSTEM_MESSAGES[scene_label],
+        messages=[
             {"role": "user", "content": cleaned_ocr}
         ]
     )
 
+
+def build_packed_request(scene_label, cleaned_ocrs):
+    """The keyword arguments for `messages.create` to annotate several rows of one scene label at once."""
+    request = build_request(scene_label, "\n".join(f"{n}: {text}" for n, text in enumerate(cleaned_ocrs, 1)))
+    request["system"] = SYSTEM_MESSAGES[scene_label] + PACKED_INSTRUCTIONS
+    request["max_tokens"] = min(MAX_OUTPUT_TOKENS, sum(max_tokens_for(text) for text in cleaned_ocrs))
+    return request
+
+
+def build_retry_request(scene_label, cleaned_ocr, previous, problem, stop_reason):
+    """
+    The keyword arguments for `messages.create` to re-annotate a row whose annotation failed
+    validation: truncated rows get twice the room, and other invalid answers are shown back
+    to the model with what was wrong with them.
+    """
+    if stop_reason == "max_tokens":
+        return build_request(scene_label, cleaned_ocr, min(MAX_OUTPUT_TOKENS, 2 * max_tokens_for(cleaned_ocr)))
+    request = build_request(scene_label, cleaned_ocr)
+    if previous:
+        request["messages"] += [
+            {"role": "assistant", "content": previous},
+            {"role": "user", "content": f"That annotation is invalid ({problem}). Annotate the OCR string again: "
+                                        f"output it verbatim, with a tag appended to every word, and nothing else."},
+        ]
+    return request
+
+
+def split_packed(text, n):
+    """Splits a packed response into its n per-row annotations (None for rows missing from it)."""
+    annotations = {}
+    for line in text.splitlines():
+        match = PACKED_LINE.match(line)
+        if match:
+            annotations.setdefault(int(match.group(1)), match.group(2))
+    return [annotations.get(k) for k in range(1, n + 1)]
+
+
+def annotate_chyron(cleaned_ocr):
+    message = client.messages.create(**build_request("chyron", cleaned_ocr))
+    return message.content[0].text
+
+
+def annotate_credit(cleaned_ocr):
+    message = client.messages.create(**build_request("credits", cleaned_ocr))
     return message.content[0].text
 
 
-def annotate_row(row):
-    if row["ocr_accepted"] == False:
-        words = row["cleaned_text"].split()
-        return " ".join([f"{word}@O" for word in words])
-    while True:
-        try:
-            if row["scene_label"] == "chyron":
-                return annotate_chyron(row["cleaned_text"])
-            elif row["scene_label"] == "credits":
-                return annotate_credit(row["cleaned_text"])
-        except Exception as e:
-            print(e)
-            time.sleep(30)
-            continue    
-
-
-def annotate_df(df):
-    df = df.dropna(subset=["cleaned_text"])
-    df["silver_standard_annotation"] = df.progress_apply(annotate_row, axis=1)
-    return df
- 
+def reject_annotation(cleaned_ocr):
+    """Rows whose OCR was rejected are tagged all-O without asking the LLM."""
+    return " ".join([f"{word}@O" for word in cleaned_ocr.split()])
+
+
+def make_client():
+    # Retries are handled by the engine, so the SDK's own retry loop is disabled
+    return anthropic.AsyncAnthropic(max_retries=0)
+
+
+async def run_jobs(jobs, on_result=None, **engine_options):
+    """Runs annotation jobs through a new async engine with a progress bar; returns {key: Result}."""
+    def finished(result):
+        progress.update()
+        if on_result is not None:
+            on_result(result)
+
+    async with make_client() as async_client:
+        engine = AnnotationEngine(async_client, **engine_options)
+        with tqdm(total=len(jobs)) as progress:
+            return await engine.run(jobs, on_result=finished)
+
+
+def load_checkpoint(path, df):
+    """
+    Returns {row: record} for the annotations saved in a checkpoint file by an earlier,
+    interrupted run. Records whose text no longer matches the row are ignored, as is a
+    line torn by a crash mid-write.
+    """
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            i = record["row"]
+            if i in df.index and df.at[i, "cleaned_text"] == record["cleaned_text"]:
+                done[i] = record
+    return done
+
+
+def job_for(df, key):
+    """The job annotating a row, or a tuple of rows of one scene label packed into one request."""
+    if isinstance(key, tuple):
+        label = df.at[key[0], "scene_label"]
+        return Job(key, build_packed_request(label, df.loc[list(key), "cleaned_text"].tolist()), label)
+    label = df.at[key, "scene_label"]
+    return Job(key, build_request(label, df.at[key, "cleaned_text"]), label)
+
+
+def pack_jobs(df, rows, size):
+    """Groups rows by scene label (in file order) into jobs of up to `size` rows each."""
+    jobs = []
+    labels = df.loc[rows, "scene_label"]
+    for label, group in labels.groupby(labels, sort=False):
+        group_rows = group.index.tolist()
+        for start in range(0, len(group_rows), size):
+            chunk = tuple(group_rows[start:start + size])
+            jobs.append(job_for(df, chunk if len(chunk) > 1 else chunk[0]))
+    return jobs
+
+
+def submitted_jobs(df, pending, batch_runner):
+    """
+    The jobs of requests an earlier run submitted in message batches it never collected,
+    rebuilt with the same keys (and so the same custom_ids) for as long as any of their rows
+    is still pending, so their answers are matched back instead of the rows being packed
+    differently and paid for again.
+    """
+    waiting = set(pending)
+    jobs = []
+    for key in batch_runner.outstanding():
+        rows = key if isinstance(key, tuple) else (key,)
+        if waiting.intersection(rows) and all(i in df.index for i in rows):
+            jobs.append(job_for(df, key))
+            waiting.difference_update(rows)
+    return jobs
+
+
+def annotate_df(df, cache=None, checkpoint=None, batch_runner=None, pack=1, retries=VALIDATION_RETRIES, lookup=None,
+                **engine_options):
+    """Annotates a DataFrame with a new engine; see `annotate_df_async` for the options."""
+    async def annotate():
+        async with make_client() as async_client:
+            engine = AnnotationEngine(async_client, **engine_options)
+            return await annotate_df_async(df, engine, cache, checkpoint, batch_runner, pack, retries, lookup)
+
+    return asyncio.run(annotate())
+
+
+async def annotate_df_async(df, engine, cache=None, checkpoint=None, batch_runner=None, pack=1,
+                            retries=VALIDATION_RETRIES, lookup=None, name=None, position=None):
+    """
+    Annotates every row with cleaned text. Requests run concurrently through the async
+    `engine`, which may be shared with other files (`name` identifies this file's stream
+    and progress bar, `position` places the bar); rows that still fail after the retry cap are left unannotated with
+    `llm_status` "failed" (and the error in `llm_error`) instead of stalling the run.
+    With a `ResponseCache`, previously seen rows are answered from the cache. With a
+    `checkpoint` path, each annotation is appended to that file as it arrives, and rows
+    already in it (from an interrupted run) are not requested again. With a `BatchRunner`,
+    requests go through the Message Batches API instead.
+
+    Trivial rows are tagged by rule (see `rule_annotation`), rows whose text is in the
+    `lookup` of completed annotations (see `load_completed`) reuse that annotation, and
+    repeated rows share a single request.
+
+    With `pack` > 1, up to that many rows of the same scene label share one request.
+
+    Every answer is validated (see `validation_error`). Only the rows that fail are sent
+    again, for up to `retries` more rounds (at least one when packing, for rows missing
+    from a packed answer); rows still invalid keep their last annotation with
+    `llm_status` "invalid" and the problem in `llm_error`.
+    """
+    df = df.dropna(subset=["cleaned_text"]).copy()
+    df["silver_standard_annotation"] = None
+    df["llm_status"] = None
+    df["llm_error"] = None
+
+    rejected = df["ocr_accepted"] == False
+    df.loc[rejected, "silver_standard_annotation"] = df.loc[rejected, "cleaned_text"].map(reject_annotation)
+    df.loc[rejected, "llm_status"] = "rejected"
+
+    prefix = f"{name}: " if name else ""
+    resumed = load_checkpoint(checkpoint, df) if checkpoint is not None else {}
+    if resumed:
+        print(f"{prefix}Resuming: {len(resumed)} rows already annotated in {checkpoint}")
+    for i, record in resumed.items():
+        df.loc[i, ["silver_standard_annotation", "llm_status"]] = [record["annotation"], record["status"]]
+
+    pending = []
+    # Rows resolved without an API call: tagged by rule, adjudicated before, or repeated in this file
+    prepass = {"rule": 0, "lookup": 0}
+    duplicates = {}  # row -> the row whose answer it shares
+    first_seen = {(df.at[i, "scene_label"], df.at[i, "cleaned_text"]): i for i in resumed}
+    for i, label, text in zip(df.index[~rejected], df["scene_label"][~rejected], df["cleaned_text"][~rejected]):
+        if label not in SYSTEM_MESSAGES or i in resumed:
+            continue
+        annotation = rule_annotation(text)
+        if annotation is not None:
+            df.loc[i, ["silver_standard_annotation", "llm_status"]] = [annotation, "rule"]
+            prepass["rule"] += 1
+            continue
+        if lookup is not None and (label, text) in lookup:
+            df.loc[i, ["silver_standard_annotation", "llm_status"]] = [lookup[(label, text)], "lookup"]
+            prepass["lookup"] += 1
+            continue
+        cached = cache.get(MODEL, SYSTEM_MESSAGES[label], label, text) if cache is not None else None
+        if cached is not None and validation_error(text, cached) is None:
+            df.loc[i, ["silver_standard_annotation", "llm_status"]] = [cached, "cached"]
+        elif (label, text) in first_seen:
+            duplicates[i] = first_seen[(label, text)]
+        else:
+            first_seen[(label, text)] = i
+            pending.append(i)
+
+    checkpoint_file = open(checkpoint, "a") if checkpoint is not None else None
+    successes = {"first_pass": 0, "retried": 0}
+    # Rows to send again: row -> (problem, previous annotation, stop reason)
+    invalid = {}
+    current_round = 0
+
+    def save(i, annotation):
+        text = df.at[i, "cleaned_text"]
+        df.loc[i, ["silver_standard_annotation", "llm_status", "llm_error"]] = [annotation, "ok", None]
+        successes["retried" if current_round else "first_pass"] += 1
+        if checkpoint_file is not None:
+            record = {"row": int(i), "cleaned_text": text, "annotation": annotation, "status": "ok"}
+            checkpoint_file.write(json.dumps(record) + "\n")
+            checkpoint_file.flush()
+        if cache is not None:
+            label = df.at[i, "scene_label"]
+            cache.put(MODEL, SYSTEM_MESSAGES[label], label, text, annotation)
+
+    def check(i, annotation, stop_reason):
+        problem = validation_error(df.at[i, "cleaned_text"], annotation, stop_reason)
+        if problem is None:
+            save(i, annotation)
+        else:
+            invalid[i] = (problem, annotation, stop_reason)
+
+    expected = set(pending)
+
+    def store(result):
+        if isinstance(result.key, tuple):
+            # Packs submitted by an earlier run may hold rows that have been resolved since
+            if result.status != "ok":
+                invalid.update((i, (result.error, None, None)) for i in result.key if i in expected)
+                return
+            for i, annotation in zip(result.key, split_packed(result.text, len(result.key))):
+                if i not in expected:
+                    continue
+                if annotation is None:
+                    invalid[i] = ("missing from packed answer", None, None)
+                else:
+                    check(i, annotation, None)
+        elif result.status == "ok":
+            check(result.key, result.text, result.stop_reason)
+        else:
+            df.loc[result.key, ["llm_status", "llm_error"]] = ["failed", result.error]
+
+    async def run(jobs):
+        if batch_runner is not None:
+            # Polling blocks, so it gets a thread of its own
+            return await asyncio.to_thread(batch_runner.run, jobs, store)
+        with tqdm(total=len(jobs), desc=name, position=position) as progress:
+            def finished(result):
+                progress.update()
+                store(result)
+            return await engine.run(jobs, on_result=finished, stream=name)
+
+    start = time.perf_counter()
+    try:
+        jobs = submitted_jobs(df, pending, batch_runner) if batch_runner is not None else []
+        submitted = {i for job in jobs for i in (job.key if isinstance(job.key, tuple) else (job.key,))}
+        rows = [i for i in pending if i not in submitted]
+        if pack > 1:
+            jobs += pack_jobs(df, rows, pack)
+        else:
+            jobs += [job_for(df, i) for i in rows]
+        results = await run(jobs)
+        # Packs with no result are sent row by row
+        for job in jobs:
+            if isinstance(job.key, tuple) and job.key not in results:
+                invalid.update((i, ("no answer", None, None)) for i in job.key if i in expected)
+
+        rounds = max(retries, 1) if pack > 1 else retries
+        for current_round in range(1, rounds + 1):
+            if not invalid:
+                break
+            requeue = dict(invalid)
+            invalid.clear()
+            retry_jobs = [Job(i, build_retry_request(df.at[i, "scene_label"], df.at[i, "cleaned_text"], previous, problem, stop_reason),
+                              df.at[i, "scene_label"])
+                          for i, (problem, previous, stop_reason) in requeue.items()]
+            await run(retry_jobs)
+            jobs += retry_jobs
+    finally:
+        if checkpoint_file is not None:
+            checkpoint_file.close()
+
+    for i, (problem, annotation, _) in invalid.items():
+        df.loc[i, ["silver_standard_annotation", "llm_status", "llm_error"]] = [annotation, "invalid", problem]
+    for i, source in duplicates.items():
+        annotation, status, error = df.loc[source, ["silver_standard_annotation", "llm_status", "llm_error"]]
+        df.loc[i, ["silver_standard_annotation", "llm_status", "llm_error"]] = [
+            annotation, "duplicate" if status == "ok" else status, error]
+
+    saved = prepass["rule"] + prepass["lookup"] + len(duplicates)
+    if saved:
+        print(f"{prefix}Pre-pass: {saved} rows resolved without an API call ({prepass['rule']} tagged by rule, "
+              f"{prepass['lookup']} from completed annotations, {len(duplicates)} duplicates of other rows)")
+    if pending:
+        print(f"{prefix}Validation: {successes['first_pass']} rows valid on the first pass, {successes['retried']} after a retry, "
+              f"{len(invalid)} still invalid (marked llm_status=invalid)")
+    if pack > 1 and pending:
+        single_tokens = sum(estimate_input_tokens(build_request(df.at[i, "scene_label"], df.at[i, "cleaned_text"]))
+                            for i in pending)
+        packed_tokens = sum(estimate_input_tokens(job.request) for job in jobs)
+        print(f"{prefix}Packing: {len(jobs)} requests instead of {len(pending)} in {time.perf_counter() - start:.1f}s; "
+              f"~{packed_tokens} input tokens instead of ~{single_tokens} ({1 - packed_tokens / single_tokens:.0%} saved)")
+    failed = (df["llm_status"] == "failed").sum()
+    if failed:
+        print(f"{prefix}{failed} rows failed; they are marked llm_status=failed")
+    # Precompute the OCR/LLM token diff so the adjudicator doesn't have to
+    return add_alignment_columns(df)
+
+
+async def annotate_file_async(input_file, output_file, engine, cache=None, bulk=False, poll_interval=POLL_INTERVAL,
+                              position=None, **annotate_options):
+    """
+    Annotates a CSV file, checkpointing to `<output_file>.partial.jsonl` so an interrupted
+    run picks up where it left off. The output only appears once it is complete: it is
+    written to a temporary file and atomically renamed into place, and only then is the
+    checkpoint removed and the input file marked as annotated. In `bulk` mode, submitted
+    message batches are tracked in `<output_file>.batches.json` until they are collected.
+
+    A file with rows that ended up "failed" or "invalid" is not finished: no output is
+    written, and the checkpoint and input are left in place, so running it again only
+    sends those rows. Returns the number of such rows (0 once the file is finished).
+    """
+    checkpoint = f"{output_file}.partial.jsonl"
+    batch_state = f"{output_file}.batches.json"
+    batch_runner = BatchRunner(client, batch_state, poll_interval, metrics=engine.metrics) if bulk else None
+    annotated_df = await annotate_df_async(pd.read_csv(input_file), engine, cache, checkpoint, batch_runner,
+                                           name=os.path.basename(input_file), position=position, **annotate_options)
+    unfinished = int(annotated_df["llm_status"].isin(["failed", "invalid"]).sum())
+    if unfinished:
+        return unfinished
+    tmp_file = f"{output_file}.tmp"
+    annotated_df.to_csv(tmp_file, index=False)
+    os.replace(tmp_file, output_file)
+    os.remove(checkpoint)
+    if os.path.exists(batch_state):
+        os.remove(batch_state)
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    os.rename(input_file, f'{input_file}.{timestamp}.llm-annotated')
+    return 0
+
+
+def report_unfinished(input_file, unfinished):
+    print(f"{os.path.basename(input_file)} was left in place: {unfinished} rows failed or are still invalid. "
+          f"Run it again to send only those rows.")
+
+
+def annotate_files(files, cache=None, bulk=False, poll_interval=POLL_INTERVAL, pack=1, retries=VALIDATION_RETRIES,
+                   lookup=None, **engine_options):
+    """
+    Annotates (input_file, output_file) pairs concurrently through one shared engine, so
+    every file draws on the same global concurrency and rate-limit budget while slots are
+    shared round-robin between files. Each file is finished (written, renamed) as soon as
+    its own rows are done; a file that fails, or is left with failed or invalid rows, is
+    reported without stopping the others. Returns each file's outcome: the number of rows
+    left unfinished (see `annotate_file_async`), or the exception it failed with.
+    """
+    async def annotate():
+        async with make_client() as async_client:
+            engine = AnnotationEngine(async_client, **engine_options)
+            return await asyncio.gather(
+                *(annotate_file_async(input_file, output_file, engine, cache, bulk, poll_interval, position,
+                                      pack=pack, retries=retries, lookup=lookup)
+                  for position, (input_file, output_file) in enumerate(files)),
+                return_exceptions=True,
+            )
+
+    outcomes = asyncio.run(annotate())
+    for (input_file, _), outcome in zip(files, outcomes):
+        if isinstance(outcome, Exception):
+            print(f"{os.path.basename(input_file)} failed and was left in place: {type(outcome).__name__}: {outcome}")
+        elif outcome:
+            report_unfinished(input_file, outcome)
+    return outcomes
+
+
+def annotate_file(input_file, output_file, cache=None, bulk=False, poll_interval=POLL_INTERVAL, pack=1,
+                  retries=VALIDATION_RETRIES, lookup=None, **engine_options):
+    """Annotates one file with a new engine; see `annotate_file_async`."""
+    async def annotate():
+        async with make_client() as async_client:
+            engine = AnnotationEngine(async_client, **engine_options)
+            return await annotate_file_async(input_file, output_file, engine, cache, bulk, poll_interval,
+                                             pack=pack, retries=retries, lookup=lookup)
+
+    unfinished = asyncio.run(annotate())
+    if unfinished:
+        report_unfinished(input_file, unfinished)
+    return unfinished
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Process data")
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument("--input_file", help="Input CSV file path", default=None)
     group.add_argument("-a", "--all", action="store_true", help="Process all files in the 2-ocr-complete directory")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Maximum requests in flight")
+    parser.add_argument("--rpm", type=float, default=REQUESTS_PER_MINUTE, help="Requests per minute limit")
+    parser.add_argument("--tpm", type=float, default=TOKENS_PER_MINUTE, help="Tokens per minute limit (estimated)")
+    parser.add_argument("--max-retries", type=int, default=MAX_RETRIES, help="Retries before a row is marked failed")
+    parser.add_argument("--cache", default=CACHE_FILE, help="Response cache file path")
+    parser.add_argument("--no-cache", action="store_true", help="Don't read or write the response cache")
+    parser.add_argument("--retries", type=int, default=VALIDATION_RETRIES, help="Rounds of re-sending rows that fail validation")
+    parser.add_argument("--pack", type=int, default=1, help="Annotate up to this many rows of a scene label per request")
+    parser.add_argument("--bulk", action="store_true", help="Submit rows through the Message Batches API (slower, cheaper)")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL, help="Seconds between batch status checks in --bulk mode")
+    parser.add_argument("--no-lookup", action="store_true", help="Don't reuse annotations from 4-llm-complete")
+    parser.add_argument("--metrics", default=None, help="Append per-request metrics to this JSONL file")
     args = parser.parse_args()
+    metrics = MetricsLog(args.metrics)
+    annotate_options = dict(pack=args.pack, retries=args.retries, concurrency=args.concurrency,
+                            requests_per_minute=args.rpm, tokens_per_minute=args.tpm, max_retries=args.max_retries,
+                            metrics=metrics)
+    if not args.no_lookup:
+        annotate_options["lookup"] = load_completed(os.path.join(BASE_DIR, "annotations/4-llm-complete"))
+
+    cache = None
+    if not args.no_cache:
+        cache = ResponseCache(args.cache)
+        # Answers to an older prompt or model would never be looked up again
+        stale = cache.invalidate(MODEL, SYSTEM_MESSAGES.values())
+        if stale:
+            print(f"Dropped {stale} cached responses from an older prompt or model")
 
     output_dir = os.path.join(BASE_DIR, "annotations/3-llm-in-progress")
 
-    timestamp = time.strftime("%Y%m%d-%H%M%S")
     if args.input_file is not None:
         output_file = os.path.join(output_dir, os.path.basename(args.input_file))
-        annotated_df = annotate_df(pd.read_csv(args.input_file))
-        annotated_df.to_csv(output_file, index=False)
-        os.rename(args.input_file, f'{args.input_file}.{timestamp}.llm-annotated')
+        annotate_file(args.input_file, output_file, cache, args.bulk, args.poll_interval, **annotate_options)
 
     elif args.all:
+        files = []
         for file in os.listdir(os.path.join(BASE_DIR, "annotations/2-ocr-complete")):
             if file.endswith(".llm-annotated") or file.startswith("."):
                 continue
             full_path = os.path.join(BASE_DIR, "annotations/2-ocr-complete", file)
-            annotated_df = annotate_df(pd.read_csv(full_path))
-            annotated_df.to_csv(os.path.join(output_dir, file), index=False)
-            os.rename(full_path, f'{full_path}.{timestamp}.llm-annotated')
+            files.append((full_path, os.path.join(output_dir, file)))
+        # All files share one scheduler and budget, and each is finished as soon as it is done
+        annotate_files(files, cache, args.bulk, args.poll_interval, **annotate_options)
+
+    print(metrics.report())
+    metrics.close()
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Response cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate']:.0%} hit rate), {stats['entries']} entries")
+        cache.close()
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import sys
+import time
+
+# Allow running from utils/ as well as `import utils.llm_batches`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.llm_engine import Result
+
+# Requests per submitted batch (the API allows up to 100,000 requests or 256 MB per batch)
+BATCH_SIZE = 10000
+POLL_INTERVAL = 60
+
+
+def custom_id(key) -> str:
+    """The batch custom_id for a job key: a row, or a tuple of rows packed into one request."""
+    if isinstance(key, tuple):
+        rows = "-".join(map(str, key))
+        # custom_ids are limited to 64 characters
+        return f"rows-{rows}" if len(rows) <= 59 else f"rows-{hashlib.sha1(rows.encode()).hexdigest()}"
+    return f"row-{key}"
+
+
+def batch_result(key, result) -> Result:
+    """Converts one entry of a batch's results into an engine Result."""
+    if result.type == "succeeded":
+        message = result.message
+        return Result(key, message.content[0].text, "ok", 1, None, message.stop_reason,
+                      message.usage.input_tokens, message.usage.output_tokens)
+    if result.type == "errored":
+        error = result.error.error
+        return Result(key, None, "failed", 1, f"{error.type}: {error.message}", None, 0, 0)
+    # canceled or expired: never processed
+    return Result(key, None, "failed", 0, f"batch request {result.type}", None, 0, 0)
+
+
+class BatchRunner:
+    """
+    Runs jobs through the Message Batches API instead of one request per row: pending jobs
+    are submitted in batches of `batch_size`, which are polled until they end, and their
+    results are handed back by row as they are collected.
+
+    Submitted batch ids and the keys of their jobs are recorded in a JSON state file before
+    polling starts, so a run that is killed while waiting picks up the same batches on
+    restart instead of paying for them again: the caller rebuilds the jobs of `outstanding()`
+    keys, whose results are then matched back by custom_id. Batches whose results were
+    already collected are not fetched again.
+    Given a `metrics` log, each collected result is recorded (without a per-request latency).
+    """
+
+    def __init__(self, client, state_path: str, poll_interval: float = POLL_INTERVAL, batch_size: int = BATCH_SIZE,
+                 metrics=None):
+        self.client = client
+        self.metrics = metrics
+        self.state_path = state_path
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+
+    def _load_state(self) -> dict:
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                return json.load(f)
+        return {"batches": []}
+
+    def _save_state(self, state: dict):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def outstanding(self) -> list:
+        """Keys of the jobs in batches submitted but not yet collected (tuples for packed rows)."""
+        return [tuple(key) if isinstance(key, list) else key
+                for batch in self._load_state()["batches"] if not batch["collected"] for key in batch.get("keys", [])]
+
+    def _record(self, job, result: Result, result_type: str):
+        error = None
+        if result.status != "ok":
+            error = result.error.split(":")[0] if result_type == "errored" else result_type
+        self.metrics.record(
+            stream=None, key=job.key, label=job.label, model=job.request.get("model"), mode="batch",
+            attempt=result.attempts, final=True, outcome=result.status if result.status == "ok" else "error",
+            error=error, status_code=None, wait=None, latency=None, input_tokens=result.input_tokens,
+            output_tokens=result.output_tokens, stop_reason=result.stop_reason,
+        )
+
+    def run(self, jobs, on_result=None) -> dict:
+        """Runs all jobs and returns {key: Result}. `on_result(result)` is called as each result is collected."""
+        state = self._load_state()
+        keys = {custom_id(job.key): job.key for job in jobs}
+        jobs_by_key = {job.key: job for job in jobs}
+        # Rows in batches still running are not submitted again
+        submitted = {cid for batch in state["batches"] if not batch["collected"] for cid in batch["custom_ids"]}
+        if submitted:
+            print(f"Resuming {sum(not b['collected'] for b in state['batches'])} submitted batches")
+        new_jobs = [job for job in jobs if custom_id(job.key) not in submitted]
+
+        for start in range(0, len(new_jobs), self.batch_size):
+            chunk = new_jobs[start:start + self.batch_size]
+            requests = [{"custom_id": custom_id(job.key), "params": job.request} for job in chunk]
+            batch = self.client.messages.batches.create(requests=requests)
+            state["batches"].append({"id": batch.id, "custom_ids": [r["custom_id"] for r in requests],
+                                     "keys": [list(job.key) if isinstance(job.key, tuple) else job.key for job in chunk],
+                                     "collected": False})
+            self._save_state(state)
+            print(f"Submitted batch {batch.id} with {len(chunk)} requests")
+
+        results = {}
+        pending = [batch for batch in state["batches"] if not batch["collected"]]
+        while pending:
+            for entry in list(pending):
+                batch = self.client.messages.batches.retrieve(entry["id"])
+                counts = batch.request_counts
+                if batch.processing_status != "ended":
+                    print(f"Batch {entry['id']}: {counts.processing} processing, {batch.processing_status}")
+                    continue
+                for response in self.client.messages.batches.results(entry["id"]):
+                    key = keys.get(response.custom_id)
+                    # Jobs whose rows were all saved by an earlier run are not rebuilt
+                    if key is None:
+                        continue
+                    result = batch_result(key, response.result)
+                    results[key] = result
+                    if self.metrics is not None:
+                        self._record(jobs_by_key[key], result, response.result.type)
+                    if on_result is not None:
+                        on_result(result)
+                print(f"Batch {entry['id']} ended: {counts.succeeded} succeeded, {counts.errored} errored, "
+                      f"{counts.canceled} canceled, {counts.expired} expired")
+                entry["collected"] = True
+                self._save_state(state)
+                pending.remove(entry)
+            if pending:
+                time.sleep(self.poll_interval)
+        return results
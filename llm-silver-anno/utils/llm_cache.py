@@ -0,0 +1,98 @@
+import argparse
+import hashlib
+import sqlite3
+import threading
+import time
+
+
+def prompt_hash(system: str) -> str:
+    return hashlib.sha256(system.encode()).hexdigest()[:16]
+
+
+class ResponseCache:
+    """
+    On-disk cache of LLM annotations keyed by model, system-prompt hash, scene label and
+    cleaned text, so re-runs and overlapping batches don't pay for the same request twice.
+    Entries made with another model or prompt never match; `invalidate` deletes them.
+    Safe to share between threads (bulk mode collects several files' batches at once).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " model TEXT, prompt_hash TEXT, scene_label TEXT, cleaned_text TEXT,"
+            " response TEXT, created REAL,"
+            " PRIMARY KEY (model, prompt_hash, scene_label, cleaned_text))"
+        )
+        self.db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model: str, system: str, scene_label: str, cleaned_text: str):
+        """Returns the cached annotation, or None."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT response FROM responses WHERE model=? AND prompt_hash=? AND scene_label=? AND cleaned_text=?",
+                (model, prompt_hash(system), scene_label, cleaned_text),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, model: str, system: str, scene_label: str, cleaned_text: str, response: str):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (model, prompt_hash(system), scene_label, cleaned_text, response, time.time()),
+            )
+            self.db.commit()
+
+    def invalidate(self, model: str, systems) -> int:
+        """Deletes entries made with any other model or system prompt. Returns how many were deleted."""
+        hashes = [prompt_hash(system) for system in systems]
+        placeholders = ", ".join("?" * len(hashes))
+        deleted = self.db.execute(
+            f"DELETE FROM responses WHERE model != ? OR prompt_hash NOT IN ({placeholders})",
+            (model, *hashes),
+        ).rowcount
+        self.db.commit()
+        return deleted
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"entries": len(self), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+    def close(self):
+        self.db.close()
+
+
+if __name__ == "__main__":
+    # To inspect or clear the cache, run e.g.:
+    # python utils/llm_cache.py .llm_cache.sqlite
+    # python utils/llm_cache.py .llm_cache.sqlite --clear
+
+    parser = argparse.ArgumentParser(description="Inspect the LLM response cache")
+    parser.add_argument("cache_file", help="Cache file path")
+    parser.add_argument("--clear", action="store_true", help="Delete every cached response")
+    args = parser.parse_args()
+
+    cache = ResponseCache(args.cache_file)
+    if args.clear:
+        cache.db.execute("DELETE FROM responses")
+        cache.db.commit()
+    for model, scene_label, count in cache.db.execute(
+            "SELECT model, scene_label, COUNT(*) FROM responses GROUP BY model, scene_label"):
+        print(f"{model}\t{scene_label}\t{count}")
+    print(f"{len(cache)} cached responses")
+    cache.close()
@@ -0,0 +1,223 @@
+import asyncio
+import random
+import time
+from collections import OrderedDict, deque, namedtuple
+
+import anthropic
+
+# A request to send: `key` identifies the row(s) it belongs to, `request` holds the
+# keyword arguments for `client.messages.create` and `label` is its scene label, for metrics
+Job = namedtuple("Job", ["key", "request", "label"], defaults=[None])
+
+# The outcome of a job. `status` is "ok" or "failed"; `attempts` counts API calls made.
+Result = namedtuple("Result", ["key", "text", "status", "attempts", "error", "stop_reason",
+                               "input_tokens", "output_tokens"])
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits and server-side errors
+RETRYABLE_STATUSES = {408, 409, 429}
+
+
+class TokenBucket:
+    """
+    Async token bucket refilled continuously at `per_minute` tokens per minute, holding at
+    most `capacity` tokens (default: one minute's worth). Waiters are served in order.
+    """
+
+    def __init__(self, per_minute: float, capacity: float = None):
+        self.rate = per_minute / 60
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1):
+        # A request bigger than the bucket can still go through once the bucket is full
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+
+class FairSlots:
+    """
+    Concurrency slots shared by several streams of jobs (e.g. one per input file). While
+    slots are scarce they are handed out round-robin across the waiting streams rather
+    than first come, first served, so one large stream cannot starve the others.
+    """
+
+    def __init__(self, slots: int):
+        self.free = slots
+        self._waiting = OrderedDict()  # stream -> deque of futures
+
+    async def acquire(self, stream=None):
+        if self.free > 0 and not self._waiting:
+            self.free -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(stream, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Pass on a slot that was handed over just as this waiter was cancelled
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiting:
+            stream, queue = next(iter(self._waiting.items()))
+            future = queue.popleft()
+            if queue:
+                self._waiting.move_to_end(stream)
+            else:
+                del self._waiting[stream]
+            if not future.done():
+                future.set_result(None)
+                return
+        self.free += 1
+
+
+def estimate_input_tokens(request: dict) -> int:
+    """Rough input token count of a request, at ~4 characters per token."""
+    characters = len(request.get("system", ""))
+    for message in request["messages"]:
+        characters += len(message["content"]) if isinstance(message["content"], str) else len(str(message["content"]))
+    return characters // 4
+
+
+def estimate_tokens(request: dict) -> int:
+    """Rough token count of a request: its input plus max_tokens of output."""
+    return estimate_input_tokens(request) + request.get("max_tokens", 0)
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, anthropic.APIConnectionError):
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code in RETRYABLE_STATUSES or error.status_code >= 500
+    return False
+
+
+def retry_after_seconds(error: Exception):
+    """Returns the server's requested wait (retry-after-ms or retry-after header) in seconds, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0, retry_after: float = None) -> float:
+    """
+    Exponential backoff with full jitter for the given (0-based) retry attempt. A server
+    retry-after is treated as a lower bound, with a little jitter so waiters don't stampede.
+    """
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after + random.uniform(0, base))
+    return delay
+
+
+class AnnotationEngine:
+    """
+    Sends jobs to the Messages API concurrently: at most `concurrency` requests in flight,
+    throttled by token buckets for requests and (estimated) tokens per minute. Retryable
+    errors are retried with jittered exponential backoff up to `max_retries` times, after
+    which the job is reported as failed instead of blocking the run.
+
+    One engine can serve several concurrent `run` calls (e.g. one per file) within an event
+    loop; they share its budget, and slots are shared fairly between their `stream`s.
+
+    Given a `metrics` log (see utils/llm_metrics.py), every API call is recorded with its
+    latency, queueing time, tokens and outcome.
+    """
+
+    def __init__(self, client, concurrency: int = 8, requests_per_minute: float = 50,
+                 tokens_per_minute: float = 50000, max_retries: int = 5, base_delay: float = 1.0,
+                 max_delay: float = 60.0, metrics=None):
+        self.client = client
+        self.concurrency = concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.metrics = metrics
+        self._slots = None
+
+    def _start(self):
+        # Created on first use so they belong to the running event loop
+        if self._slots is None:
+            self._slots = FairSlots(self.concurrency)
+            self._request_bucket = TokenBucket(self.requests_per_minute)
+            self._token_bucket = TokenBucket(self.tokens_per_minute)
+
+    async def run(self, jobs, on_result=None, stream=None) -> dict:
+        """Runs all jobs and returns {key: Result}. `on_result(result)` is called as each job finishes."""
+        self._start()
+        results = {}
+
+        async def run_one(job):
+            result = await self._run_job(job, stream)
+            results[job.key] = result
+            if on_result is not None:
+                on_result(result)
+
+        await asyncio.gather(*(run_one(job) for job in jobs))
+        return results
+
+    def _record(self, job: Job, stream, attempt: int, wait: float, latency: float, result: Result = None,
+                error: Exception = None, final: bool = True):
+        if self.metrics is None:
+            return
+        self.metrics.record(
+            stream=stream, key=job.key, label=job.label, model=job.request.get("model"), mode="realtime",
+            attempt=attempt + 1, final=final, outcome="ok" if error is None else "error",
+            error=type(error).__name__ if error is not None else None,
+            status_code=getattr(error, "status_code", None), wait=round(wait, 4), latency=round(latency, 4),
+            input_tokens=result.input_tokens if result else 0, output_tokens=result.output_tokens if result else 0,
+            stop_reason=result.stop_reason if result else None,
+        )
+
+    async def _run_job(self, job: Job, stream=None) -> Result:
+        attempt = 0
+        while True:
+            queued = time.perf_counter()
+            await self._slots.acquire(stream)
+            sent = None
+            try:
+                await self._request_bucket.acquire()
+                await self._token_bucket.acquire(estimate_tokens(job.request))
+                sent = time.perf_counter()
+                message = await self.client.messages.create(**job.request)
+                result = Result(job.key, message.content[0].text, "ok", attempt + 1, None, message.stop_reason,
+                                message.usage.input_tokens, message.usage.output_tokens)
+                self._record(job, stream, attempt, sent - queued, time.perf_counter() - sent, result)
+                return result
+            except Exception as e:
+                error = e
+            finally:
+                self._slots.release()
+            final = not is_retryable(error) or attempt >= self.max_retries
+            if sent is not None:
+                self._record(job, stream, attempt, sent - queued, time.perf_counter() - sent, error=error, final=final)
+            if final:
+                return Result(job.key, None, "failed", attempt + 1, f"{type(error).__name__}: {error}", None, 0, 0)
+            # Sleep without holding a slot so other jobs can use it meanwhile
+            await asyncio.sleep(backoff_delay(attempt, self.base_delay, self.max_delay, retry_after_seconds(error)))
+            attempt += 1
@@ -0,0 +1,103 @@
+import argparse
+import json
+import threading
+import time
+
+import pandas as pd
+
+# USD per million (input, output) tokens; Message Batches are billed at half price
+PRICES = {
+    "claude-3-haiku-20240307": (0.25, 1.25),
+}
+BATCH_DISCOUNT = 0.5
+
+
+class MetricsLog:
+    """
+    One record per API request made by the LLM stage (latency, tokens, outcome, error
+    class, ...), kept for the end-of-run report and, given a path, appended to a JSONL
+    file as it happens.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.records = []
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.file = open(path, "a") if path else None
+
+    def record(self, **fields):
+        fields["time"] = time.time()
+        with self.lock:
+            self.records.append(fields)
+            if self.file is not None:
+                self.file.write(json.dumps(fields, default=str) + "\n")
+                self.file.flush()
+
+    def report(self) -> str:
+        return report(self.records, time.time() - self.started)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def estimate_cost(model: str, input_tokens, output_tokens, batch=False):
+    """Estimated USD cost of the given token counts, or NaN for a model without known prices."""
+    if model not in PRICES:
+        return float("nan")
+    input_price, output_price = PRICES[model]
+    cost = (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+    return cost * BATCH_DISCOUNT if batch else cost
+
+
+def report(records: list[dict], elapsed: float = None) -> str:
+    """Summarizes request records: latency percentiles, throughput, tokens and cost per scene label, errors."""
+    if not records:
+        return "LLM requests: none"
+    df = pd.DataFrame(records)
+    if elapsed is None:
+        # From the first request sent to the last one finished
+        elapsed = df["time"].max() - (df["time"] - df["latency"].fillna(0)).min()
+    ok = df["outcome"] == "ok"
+    final = df["final"].astype(bool)
+    df["label"] = df["label"].fillna("(none)")
+    df["cost"] = [estimate_cost(m, i, o, mode == "batch")
+                  for m, i, o, mode in zip(df["model"], df["input_tokens"], df["output_tokens"], df["mode"])]
+    tokens = df["input_tokens"].sum() + df["output_tokens"].sum()
+
+    lines = [
+        f"LLM requests: {len(df)} ({ok.sum()} ok, {(~ok).sum()} errors; {final.sum()} jobs, "
+        f"{(final & ~ok).sum()} failed after retries) in {elapsed:.1f}s: "
+        f"{len(df) / elapsed:.2f} requests/s, {tokens / elapsed:.0f} tokens/s"
+    ]
+    latency = df.loc[ok, "latency"].dropna()
+    if len(latency):
+        lines.append(f"Latency (ok requests): p50 {latency.quantile(0.5):.2f}s, p95 {latency.quantile(0.95):.2f}s, "
+                     f"max {latency.max():.2f}s")
+    by_label = df.groupby("label").agg(requests=("outcome", "size"), input_tokens=("input_tokens", "sum"),
+                                       output_tokens=("output_tokens", "sum"), cost=("cost", "sum"))
+    lines.append("Per scene label:")
+    for row in by_label.itertuples():
+        lines.append(f"  {row.Index:<10} {row.requests:>6} requests {row.input_tokens:>10} in {row.output_tokens:>9} out"
+                     f"  ${row.cost:.4f}")
+    lines.append(f"  {'total':<10} {len(df):>6} requests {df['input_tokens'].sum():>10} in {df['output_tokens'].sum():>9} out"
+                 f"  ${df['cost'].sum():.4f} (estimated)")
+    errors = df.loc[~ok, "error"].value_counts()
+    if len(errors):
+        retried = (~ok & ~final).sum()
+        lines.append(f"Errors: {retried} retried, {(final & ~ok).sum()} final; "
+                     + ", ".join(f"{error} {count}" for error, count in errors.items()))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # To summarize the metrics of earlier runs, run e.g.:
+    # python utils/llm_metrics.py llm_metrics.jsonl
+
+    parser = argparse.ArgumentParser(description="Report on LLM request metrics")
+    parser.add_argument("metrics_file", help="JSONL metrics file written by llm_annotate.py --metrics")
+    args = parser.parse_args()
+
+    with open(args.metrics_file) as f:
+        print(report([json.loads(line) for line in f if line.strip()]))
@@ -0,0 +1,78 @@
+import argparse
+import os
+import re
+import sys
+from collections import Counter, defaultdict
+
+import pandas as pd
+
+# Allow `python utils/llm_prepass.py` as well as `import utils.llm_prepass`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.llm_validate import validation_error
+
+COMPLETED_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "annotations/4-llm-complete")
+
+# Rows up to this many tokens are tagged by rule when none of their tokens look like a word
+TRIVIAL_MAX_TOKENS = 2
+WORDLIKE = re.compile(r"[^\W\d_]{2}")
+
+
+def rule_annotation(cleaned_text: str):
+    """
+    Tags trivial rows without the LLM: one- or two-token strings with no word in them
+    (stray letters, digits, punctuation, OCR noise) can only be O. Returns None otherwise.
+    """
+    tokens = cleaned_text.split()
+    if not tokens or len(tokens) > TRIVIAL_MAX_TOKENS:
+        return None
+    if any(WORDLIKE.search(token) for token in tokens):
+        return None
+    return " ".join(f"{token}@O" for token in tokens)
+
+
+def load_completed(directory: str = COMPLETED_DIR) -> dict:
+    """
+    Builds {(scene_label, cleaned_text): annotation} from the adjudicated files in
+    `directory`. When the same text was adjudicated differently, the most common
+    annotation wins; annotations that no longer validate against their text are skipped.
+    """
+    seen = defaultdict(Counter)
+    if not os.path.isdir(directory):
+        return {}
+    for file in sorted(os.listdir(directory)):
+        if not file.endswith(".csv"):
+            continue
+        df = pd.read_csv(os.path.join(directory, file), usecols=["scene_label", "cleaned_text", "labels"])
+        for label, text, annotation in df.dropna().itertuples(index=False):
+            seen[(label, text)][annotation] += 1
+    lookup = {}
+    for (label, text), annotations in seen.items():
+        annotation = annotations.most_common(1)[0][0]
+        if validation_error(text, annotation) is None:
+            lookup[(label, text)] = annotation
+    return lookup
+
+
+def main(input_file, completed_dir):
+    df = pd.read_csv(input_file).dropna(subset=["cleaned_text"])
+    if "ocr_accepted" in df.columns:
+        df = df[df["ocr_accepted"] != False]
+    lookup = load_completed(completed_dir)
+    keys = list(zip(df["scene_label"], df["cleaned_text"]))
+    unruled = [key for key in keys if rule_annotation(key[1]) is None]
+    remaining = [key for key in unruled if key not in lookup]
+    print(f"{len(keys)} rows to annotate: {len(keys) - len(unruled)} by rule, "
+          f"{len(unruled) - len(remaining)} from {len(lookup)} completed annotations, "
+          f"{len(remaining) - len(set(remaining))} duplicates; {len(set(remaining))} need the LLM")
+
+
+if __name__ == "__main__":
+    # To see how many rows of a file the pre-pass would resolve without the LLM, run e.g.:
+    # python utils/llm_prepass.py annotations/2-ocr-complete/batch.csv
+
+    parser = argparse.ArgumentParser(description="Count rows resolved without the LLM")
+    parser.add_argument("input_file", type=str, help="Input CSV file path")
+    parser.add_argument("--completed-dir", default=COMPLETED_DIR, help="Directory of adjudicated annotations")
+    args = parser.parse_args()
+
+    main(args.input_file, args.completed_dir)
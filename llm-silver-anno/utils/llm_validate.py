@@ -0,0 +1,56 @@
+import argparse
+import os
+import sys
+
+import pandas as pd
+
+# Allow `python utils/llm_validate.py` as well as `import utils.llm_validate`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.rfb_decoder import RFBParseError, decode_phrases
+from utils.token_align import align_tokens, llm_tokens, mismatch_counts
+
+
+def validation_error(cleaned_text: str, annotation, stop_reason: str = None):
+    """
+    Checks an LLM annotation before it is accepted: it must not be cut off by max_tokens,
+    every word must carry a well-formed, well-ordered BIO role-filler tag, and the words
+    must be the OCR text verbatim. Returns a description of the first problem, or None.
+    """
+    if not isinstance(annotation, str) or not annotation.strip():
+        return "empty annotation"
+    if stop_reason == "max_tokens":
+        return "truncated at max_tokens"
+    try:
+        decode_phrases(annotation)
+    except RFBParseError as e:
+        return f"bad tags: {e}"
+    ocr_tokens = cleaned_text.split()
+    annotated_tokens = llm_tokens(annotation)
+    if annotated_tokens != ocr_tokens:
+        counts = mismatch_counts(align_tokens(ocr_tokens, annotated_tokens))
+        return (f"not verbatim: {counts['tokens_dropped']} dropped, {counts['tokens_added']} added, "
+                f"{counts['tokens_altered']} altered tokens")
+    return None
+
+
+def main(input_file, text_col, anno_col):
+    df = pd.read_csv(input_file)
+    errors = [validation_error(text, anno) if isinstance(text, str) else None
+              for text, anno in zip(df[text_col], df[anno_col])]
+    problems = pd.Series([e.split(":")[0] for e in errors if e is not None], dtype=object)
+    print(f"{len(problems)}/{len(df)} rows fail validation")
+    for problem, count in problems.value_counts().items():
+        print(f"  {problem}: {count}")
+
+
+if __name__ == "__main__":
+    # To check an annotated file, run e.g.:
+    # python utils/llm_validate.py annotations/3-llm-in-progress/anno.csv
+
+    parser = argparse.ArgumentParser(description="Validate LLM annotations against their OCR text")
+    parser.add_argument("input_file", type=str, help="Input CSV file path")
+    parser.add_argument("--text-column", default="cleaned_text", help="Column with the OCR text")
+    parser.add_argument("--column", default="silver_standard_annotation", help="Column with the annotations")
+    args = parser.parse_args()
+
+    main(args.input_file, args.text_column, args.column)
@@ -0,0 +1,244 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+NUMBERED_LINE = re.compile(r"^(\d+): (.*)$")
+
+
+def tag_text(text: str) -> str:
+    """
+    A stand-in annotation: the input verbatim, with every word tagged O. Packed input
+    ("1: ...", one row per line) is answered line by line, keeping the numbers.
+    """
+    lines = text.splitlines()
+    if lines and all(NUMBERED_LINE.match(line) for line in lines):
+        return "\n".join(f"{n}: {tag_text(words)}" for n, words in (NUMBERED_LINE.match(line).groups() for line in lines))
+    return " ".join(f"{word}@O" for word in text.split())
+
+
+def content_text(content) -> str:
+    if isinstance(content, str):
+        return content
+    return " ".join(block.get("text", "") for block in content)
+
+
+class MockAnthropicServer:
+    """
+    A local stand-in for the Messages API, for exercising the annotation pipeline without
+    an API key or spend. Point the SDK at it with ANTHROPIC_BASE_URL=<server.base_url>.
+
+    `rate_limit_rate` and `error_rate` inject 429s (with a retry-after header) and 500s
+    on that fraction of requests; `latency` adds a fixed delay to each response, plus
+    `token_latency` per output token, as generation time would. Output
+    longer than the request's max_tokens is cut off with stop_reason "max_tokens".
+
+    Message Batches are supported too: a batch ends `batch_delay` seconds after it is
+    created, and `error_rate` of its requests come back errored.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 rate_limit_rate: float = 0.0, error_rate: float = 0.0, retry_after: float = 1.0,
+                 batch_delay: float = 2.0, token_latency: float = 0.0, seed: int = None):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.batch_delay = batch_delay
+        self.batches = {}
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "ok": 0, "rate_limited": 0, "errors": 0, "batches": 0, "batch_requests": 0}
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def _draw(self) -> float:
+        with self.lock:
+            return self.random.random()
+
+    def message(self, request: dict) -> dict:
+        """Builds the response body for a messages.create request."""
+        # The OCR text is the first user turn; later turns are corrections
+        text = tag_text(content_text(request["messages"][0]["content"]))
+        stop_reason = "end_turn"
+        # Approximate tokens as 4 characters, like the engine's estimate
+        if len(text) // 4 > request.get("max_tokens", 4096):
+            text = text[:request["max_tokens"] * 4]
+            stop_reason = "max_tokens"
+        input_characters = len(request.get("system", "")) + sum(len(content_text(m["content"])) for m in request["messages"])
+        return {
+            "id": f"msg_mock_{self.counts['requests']}",
+            "type": "message",
+            "role": "assistant",
+            "model": request.get("model", "mock"),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": stop_reason,
+            "stop_sequence": None,
+            "usage": {"input_tokens": max(1, input_characters // 4), "output_tokens": max(1, len(text) // 4)},
+        }
+
+    def create_batch(self, requests: list) -> dict:
+        with self.lock:
+            batch_id = f"msgbatch_mock_{len(self.batches)}"
+            self.batches[batch_id] = {"created": time.time(), "requests": requests, "results": None}
+            self.counts["batches"] += 1
+            self.counts["batch_requests"] += len(requests)
+        return self.batch(batch_id)
+
+    def batch_results(self, batch_id: str) -> list:
+        """Processes a batch's requests the first time its results are needed."""
+        batch = self.batches[batch_id]
+        with self.lock:
+            if batch["results"] is None:
+                batch["results"] = []
+                for request in batch["requests"]:
+                    if self.random.random() < self.error_rate:
+                        result = {"type": "errored", "error": {"type": "error", "error": {"type": "api_error", "message": "Mock server error"}}}
+                    else:
+                        result = {"type": "succeeded", "message": self.message(request["params"])}
+                    batch["results"].append({"custom_id": request["custom_id"], "result": result})
+        return batch["results"]
+
+    def batch(self, batch_id: str) -> dict:
+        """Builds the MessageBatch object for a batch."""
+        batch = self.batches[batch_id]
+        created = datetime.fromtimestamp(batch["created"], timezone.utc)
+        ended = time.time() >= batch["created"] + self.batch_delay
+        counts = {"processing": len(batch["requests"]), "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}
+        if ended:
+            counts["processing"] = 0
+            for entry in self.batch_results(batch_id):
+                counts[entry["result"]["type"]] += 1
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": counts,
+            "created_at": created.isoformat(),
+            "expires_at": (created + timedelta(hours=24)).isoformat(),
+            "ended_at": (created + timedelta(seconds=self.batch_delay)).isoformat() if ended else None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": f"{self.base_url}/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status: int, body: dict, headers: dict = None):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def send_error_json(self, status: int, kind: str, message: str, headers: dict = None):
+                self.send_json(status, {"type": "error", "error": {"type": kind, "message": message}}, headers)
+
+            def read_json(self) -> dict:
+                length = int(self.headers.get("content-length", 0))
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_GET(self):
+                parts = self.path.split("?")[0].strip("/").split("/")
+                if parts[:3] != ["v1", "messages", "batches"] or len(parts) < 4 or parts[3] not in mock.batches:
+                    return self.send_error_json(404, "not_found_error", f"No route for {self.path}")
+                if len(parts) == 4:
+                    return self.send_json(200, mock.batch(parts[3]))
+                if parts[4:] == ["results"] and mock.batch(parts[3])["processing_status"] == "ended":
+                    payload = "".join(json.dumps(entry) + "\n" for entry in mock.batch_results(parts[3])).encode()
+                    self.send_response(200)
+                    self.send_header("content-type", "application/binary")
+                    self.send_header("content-length", str(len(payload)))
+                    self.end_headers()
+                    return self.wfile.write(payload)
+                self.send_error_json(404, "not_found_error", f"No results for {parts[3]}")
+
+            def do_POST(self):
+                path = self.path.split("?")[0]
+                if path == "/v1/messages/batches":
+                    return self.send_json(200, mock.create_batch(self.read_json()["requests"]))
+                if path != "/v1/messages":
+                    return self.send_error_json(404, "not_found_error", f"No route for {path}")
+                request = self.read_json()
+                mock._count("requests")
+                if mock.latency:
+                    time.sleep(mock.latency)
+                draw = mock._draw()
+                if draw < mock.rate_limit_rate:
+                    mock._count("rate_limited")
+                    return self.send_error_json(429, "rate_limit_error", "Mock rate limit",
+                                                {"retry-after": str(mock.retry_after)})
+                if draw < mock.rate_limit_rate + mock.error_rate:
+                    mock._count("errors")
+                    return self.send_error_json(500, "api_error", "Mock server error")
+                mock._count("ok")
+                message = mock.message(request)
+                if mock.token_latency:
+                    time.sleep(mock.token_latency * message["usage"]["output_tokens"])
+                self.send_json(200, message)
+
+        return Handler
+
+
+if __name__ == "__main__":
+    # To annotate against the mock instead of the API, run e.g.:
+    # python utils/mock_anthropic.py --port 8765 --rate-limit-rate 0.1
+    # ANTHROPIC_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=mock python utils/llm_annotate.py --input_file ...
+
+    parser = argparse.ArgumentParser(description="Serve a local mock of the Anthropic Messages API")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to bind")
+    parser.add_argument("--port", type=int, default=8765, help="Port to bind")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each response")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="retry-after header sent with 429s")
+    parser.add_argument("--batch-delay", type=float, default=2.0, help="Seconds until a message batch ends")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Extra seconds per output token")
+    args = parser.parse_args()
+
+    server = MockAnthropicServer(args.host, args.port, args.latency, args.rate_limit_rate, args.error_rate,
+                                 args.retry_after, args.batch_delay, args.token_latency)
+    print(f"Mock Anthropic API listening on {server.base_url}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,101 @@
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class MockSearchServer:
+    """
+    A local stand-in for the AAPB datahousing search API used by get_paths.py: each
+    GUID resolves to "/data/video/<guid>.mp4", except GUIDs in `missing`, which get an
+    empty list. `latency` delays every response and `error_rate` answers that fraction
+    of requests with a 503. Requests per GUID are counted in `counts`.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, error_rate: float = 0.0,
+                 missing=(), seed: int = None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.missing = set(missing)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        self.errors = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status: int, body):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                guid = parse_qs(url.query).get("guid", [None])[0]
+                if url.path != "/searchapi" or guid is None:
+                    return self.send_json(404, {"error": f"No route for {self.path}"})
+                time.sleep(mock.latency)
+                with mock.lock:
+                    mock.counts[guid] += 1
+                    failed = mock.random.random() < mock.error_rate
+                    mock.errors += failed
+                if failed:
+                    return self.send_json(503, {"error": "injected failure"})
+                self.send_json(200, [] if guid in mock.missing else [f"/data/video/{guid}.mp4"])
+
+        return Handler
+
+
+if __name__ == "__main__":
+    # To resolve paths against the mock instead of a datahousing server, run e.g.:
+    # python utils/mock_search_api.py --port 8800 --error-rate 0.1
+    # python utils/get_paths.py --input examples/ex.csv --output anno.csv --url http://127.0.0.1:8800
+
+    parser = argparse.ArgumentParser(description="Serve a local mock of the AAPB datahousing search API")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to bind")
+    parser.add_argument("--port", type=int, default=8800, help="Port to bind")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    args = parser.parse_args()
+
+    server = MockSearchServer(args.host, args.port, args.latency, args.error_rate)
+    print(f"Mock search API listening on {server.base_url}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
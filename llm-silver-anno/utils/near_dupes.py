@@ -0,0 +1,152 @@
+import argparse
+import difflib
+import zlib
+from collections import Counter, defaultdict
+
+import numpy as np
+import pandas as pd
+
+# Character shingles: one OCR error changes at most this many of a string's shingles.
+# Chyrons are short, so a couple of errors already costs a lot of 3-shingle overlap.
+SHINGLE_SIZE = 2
+NUM_PERM = 128
+# 32 bands of 4 signature rows: pairs whose shingles have a Jaccard similarity of ~0.6 or
+# more are almost always candidates, and pairs below ~0.3 rarely are
+BANDS = 32
+# A text is compared with at most this many of the latest clusters in a bucket, which bounds
+# the work when many merely similar strings (e.g. one show's chyrons) share buckets
+MAX_REPRESENTATIVES = 16
+# Candidates sharing fewer shingles than this are rejected without comparing characters
+MIN_JACCARD = 0.5
+# Candidates whose character similarity (difflib ratio) reaches this are near duplicates
+THRESHOLD = 0.85
+GROUP_COLUMNS = ["guid", "scene_label"]
+
+MERSENNE = np.uint64((1 << 61) - 1)
+_rng = np.random.default_rng(0)
+PERM_A = _rng.integers(1, (1 << 61) - 1, NUM_PERM, dtype=np.uint64)
+PERM_B = _rng.integers(0, (1 << 61) - 1, NUM_PERM, dtype=np.uint64)
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set[str]:
+    text = " ".join(text.lower().split())
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def minhash(shingle_set: set[str]) -> np.ndarray:
+    """The MinHash signature of a shingle set: its minimum under each of NUM_PERM hash functions."""
+    hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingle_set), dtype=np.uint64, count=len(shingle_set))
+    # uint64 overflow just wraps, which is fine for hashing
+    return ((np.outer(hashes, PERM_A) + PERM_B) % MERSENNE).min(axis=0)
+
+
+def similar(a: str, b: str, threshold: float = THRESHOLD) -> bool:
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    # The quick ratios are cheap upper bounds of ratio()
+    return (matcher.real_quick_ratio() >= threshold and matcher.quick_ratio() >= threshold
+            and matcher.ratio() >= threshold)
+
+
+def cluster(texts: list[str], threshold: float = THRESHOLD, bands: int = BANDS) -> list[int]:
+    """
+    Clusters near-identical strings: MinHash/LSH over character shingles finds candidate
+    pairs without comparing every pair, and candidates whose character similarity reaches
+    `threshold` are joined (transitively). Returns each text's cluster id (the position
+    of the cluster's first text). Identical texts are hashed once.
+    """
+    first = {}
+    unique = []
+    for text in texts:
+        if text not in first:
+            first[text] = len(unique)
+            unique.append(text)
+    sets = [shingles(text) for text in unique]
+    parent = list(range(len(unique)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    rows = NUM_PERM // bands
+    buckets = defaultdict(list)
+    if len(unique) > 1:
+        for i, shingle_set in enumerate(sets):
+            signature = minhash(shingle_set)
+            for band in range(bands):
+                buckets[(band, signature[band * rows:(band + 1) * rows].tobytes())].append(i)
+    checked = set()
+    for members in buckets.values():
+        # Each text is compared with one text per recent cluster in the bucket, not with every member
+        representatives = []
+        for j in members:
+            for i in reversed(representatives[-MAX_REPRESENTATIVES:]):
+                root_i, root_j = find(i), find(j)
+                if root_i == root_j:
+                    break
+                # Two texts are compared at most once, however many buckets they share
+                if (i, j) in checked:
+                    continue
+                checked.add((i, j))
+                if (len(sets[i] & sets[j]) >= MIN_JACCARD * len(sets[i] | sets[j])
+                        and similar(unique[i], unique[j], threshold)):
+                    parent[max(root_i, root_j)] = min(root_i, root_j)
+                    break
+            else:
+                representatives.append(j)
+
+    # Map unique-text roots back to positions in `texts`
+    first_position = {}
+    for position, text in enumerate(texts):
+        first_position.setdefault(first[text], position)
+    return [first_position[find(first[text])] for text in texts]
+
+
+def collapse(df: pd.DataFrame, column: str = "textdocument", threshold: float = THRESHOLD) -> pd.DataFrame:
+    """
+    Keeps one row per cluster of near-identical `column` values within each guid and
+    scene label, with the cluster's size in `near_duplicates`. The representative is
+    the row with the cluster's most common text (the first such row on a tie).
+    """
+    keep = []
+    counts = []
+    for _, group in df.groupby(GROUP_COLUMNS, sort=False):
+        texts = group[column].astype(str).tolist()
+        members = defaultdict(list)
+        for position, cluster_id in enumerate(cluster(texts, threshold)):
+            members[cluster_id].append(position)
+        for positions in members.values():
+            text_counts = Counter(texts[p] for p in positions)
+            representative = max(positions, key=lambda p: (text_counts[texts[p]], -p))
+            keep.append(group.index[representative])
+            counts.append(len(positions))
+    result = df.loc[keep].copy()
+    result["near_duplicates"] = counts
+    return result.sort_index()
+
+
+def main(input_file, output_file, column, threshold):
+    df = pd.read_csv(input_file)
+    collapsed = collapse(df.dropna(subset=[column]), column, threshold)
+    collapsed.to_csv(output_file, index=False)
+    for scene_label, before in df["scene_label"].value_counts().items():
+        after = (collapsed["scene_label"] == scene_label).sum()
+        print(f"{scene_label}: {before} -> {after} rows ({1 - after / before:.0%} fewer)")
+    print(f"Total: {len(df)} -> {len(collapsed)} rows ({1 - len(collapsed) / max(len(df), 1):.0%} fewer)")
+
+
+if __name__ == "__main__":
+    # To collapse near-duplicate OCR text in a batch built by swt_to_csv.py, run e.g.:
+    # python utils/near_dupes.py batch.csv batch-collapsed.csv --threshold 0.85
+
+    parser = argparse.ArgumentParser(description="Collapse near-duplicate OCR text per GUID and scene label")
+    parser.add_argument("input_file", type=str, help="Input CSV file path")
+    parser.add_argument("output_file", type=str, help="Output CSV file path")
+    parser.add_argument("--column", default="textdocument", help="Column with the OCR text")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="Minimum character similarity (0-1) of near duplicates")
+    args = parser.parse_args()
+
+    main(args.input_file, args.output_file, args.column, args.threshold)
@@ -0,0 +1,340 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Allow `python utils/pipeline.py` as well as `import utils.pipeline`
+sys.path.insert(0, BASE_DIR)
+from utils.swt_to_csv import COLUMNS, convert_files
+from utils.near_dupes import THRESHOLD, collapse
+from utils.get_paths import CONCURRENCY as PATH_CONCURRENCY, RETRIES as PATH_RETRIES, stream_paths
+from utils.llm_prepass import load_completed
+
+# Stage outputs, named by the digest of everything that went into them
+CACHE_DIR = os.path.join(BASE_DIR, ".pipeline_cache")
+# Content digests of input files, reused while a file's size and mtime don't change
+DIGESTS_FILE = "digests.json"
+OCR_IN_PROGRESS = os.path.join(BASE_DIR, "annotations/1-ocr-in-progress")
+OCR_COMPLETE = os.path.join(BASE_DIR, "annotations/2-ocr-complete")
+LLM_IN_PROGRESS = os.path.join(BASE_DIR, "annotations/3-llm-in-progress")
+LLM_COMPLETE = os.path.join(BASE_DIR, "annotations/4-llm-complete")
+
+
+def digest(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class StageCache:
+    """Stage outputs in `directory`, each a CSV named `<stage>-<key>.csv` with its row count and timing alongside."""
+
+    def __init__(self, directory: str = CACHE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.digests_path = os.path.join(directory, DIGESTS_FILE)
+        self.digests = {}
+        if os.path.exists(self.digests_path):
+            with open(self.digests_path) as f:
+                self.digests = json.load(f)
+
+    def file_digest(self, path: str) -> str:
+        """The SHA-256 of a file's content, only read again once its size or mtime changes."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        known = self.digests.get(path)
+        if known is not None and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return known[2]
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        self.digests[path] = [stat.st_size, stat.st_mtime_ns, sha.hexdigest()]
+        return sha.hexdigest()
+
+    def save_digests(self):
+        tmp_path = f"{self.digests_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.digests, f)
+        os.replace(tmp_path, self.digests_path)
+
+    def path(self, stage: str, key: str) -> str:
+        return os.path.join(self.directory, f"{stage}-{key}.csv")
+
+    def info(self, stage: str, key: str):
+        """{"rows", "seconds"} of a cached output, or None if there is none."""
+        path = self.path(stage, key)
+        if not os.path.exists(path) or not os.path.exists(f"{path}.json"):
+            return None
+        with open(f"{path}.json") as f:
+            return json.load(f)
+
+    def store(self, stage: str, key: str, source: str, rows: int, seconds: float):
+        """Copies a finished output into the cache; the info file goes last, marking it complete."""
+        path = self.path(stage, key)
+        shutil.copyfile(source, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+        with open(f"{path}.json", "w") as f:
+            json.dump({"stage": stage, "rows": rows, "seconds": seconds}, f)
+
+
+class Meter:
+    """Wraps a stream of DataFrames, counting their rows and the time spent waiting for each."""
+
+    def __init__(self, frames):
+        self.frames = iter(frames)
+        self.rows = 0
+        self.seconds = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            df = next(self.frames)
+        finally:
+            self.seconds += time.perf_counter() - start
+        self.rows += len(df)
+        return df
+
+
+def guid_runs(frames):
+    """
+    Regroups a stream of DataFrames into one DataFrame per run of consecutive rows with
+    the same GUID, so stages see the same groups whether rows come from MMIF files or
+    from a cached CSV.
+    """
+    pending = []
+    for df in frames:
+        if df.empty:
+            continue
+        run_ids = (df["guid"] != df["guid"].shift()).cumsum()
+        for _, run in df.groupby(run_ids, sort=False):
+            if pending and pending[-1]["guid"].iat[0] != run["guid"].iat[0]:
+                yield pd.concat(pending, ignore_index=True)
+                pending = []
+            pending.append(run)
+    if pending:
+        yield pd.concat(pending, ignore_index=True)
+
+
+def mmif_frames(paths, dedupe=False, processes=1, raw=False):
+    for _, _, rows in convert_files(paths, dedupe, processes, raw):
+        yield pd.DataFrame(rows, columns=COLUMNS)
+
+
+def csv_frames(path, chunksize=100000):
+    """Reads a cached stage output back exactly as it was written: text as text, floats to the last digit."""
+    yield from pd.read_csv(path, chunksize=chunksize, dtype={"guid": str, "textdocument": str}, keep_default_na=False,
+                           float_precision="round_trip")
+
+
+def write_csv(frames, path, columns):
+    """Streams DataFrames to a CSV (written as a temporary file, renamed when complete) and passes them on."""
+    tmp_path = f"{path}.tmp"
+    wrote = False
+    for df in frames:
+        df.to_csv(tmp_path, index=False, mode="a" if wrote else "w", header=not wrote)
+        wrote = True
+        yield df
+    if not wrote:
+        pd.DataFrame(columns=columns).to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def report(stages, total):
+    print(f"{'stage':<12} {'status':<7} {'rows in':>9} {'rows out':>9} {'seconds':>9}")
+    for stage in stages:
+        rows_in = "-" if stage.get("rows_in") is None else stage["rows_in"]
+        print(f"{stage['stage']:<12} {stage['status']:<7} {rows_in:>9} {stage['rows']:>9} {stage['seconds']:>9.2f}")
+    print(f"Total: {total:.2f}s (cached stages show the time they took when they ran)")
+
+
+def prepare(mmif_dir, name, dedupe=False, raw=False, processes=1, near_dupes=False, threshold=THRESHOLD, url=None,
+            concurrency=PATH_CONCURRENCY, retries=PATH_RETRIES, cache_dir=CACHE_DIR, output_dir=OCR_IN_PROGRESS):
+    """
+    Builds a batch for the OCR reviewer from a directory of SWT/OCR MMIF files: converts
+    them (swt_to_csv), optionally collapses near duplicates (near_dupes, per run of a
+    GUID's rows) and looks up video paths (get_paths, when a search API `url` is given).
+    Rows stream through the stages one MMIF file at a time, so path lookups overlap with
+    parsing. Each stage's output is cached under the digest of its inputs (the MMIF
+    contents, then the previous stage's digest and its own options), so unchanged
+    stages are skipped and a run starts from the latest cached output. Writes
+    `<output_dir>/<name>.csv` and returns its path.
+    """
+    start = time.perf_counter()
+    cache = StageCache(cache_dir)
+    paths = sorted(os.path.join(mmif_dir, file) for file in os.listdir(mmif_dir))
+    key = digest("swt", dedupe, [(os.path.basename(path), cache.file_digest(path)) for path in paths])
+    cache.save_digests()
+
+    # (stage, key, output columns, function from a stream of DataFrames to another)
+    stages = [("swt", key, COLUMNS, None)]
+    columns = COLUMNS
+    if near_dupes:
+        key = digest("near_dupes", threshold, key)
+        columns = columns + ["near_duplicates"]
+        stages.append(("near_dupes", key, columns,
+                        lambda frames: (collapse(df, threshold=threshold) for df in frames)))
+    if url is not None:
+        key = digest("paths", url, key)
+        columns = columns + ["path"]
+        stages.append(("paths", key, columns,
+                       lambda frames: stream_paths(frames, url, concurrency, retries)))
+
+    cached = [cache.info(stage, stage_key) for stage, stage_key, _, _ in stages]
+    first = len(stages)
+    while first > 0 and cached[first - 1] is None:
+        first -= 1
+    results = [{"stage": stage, "status": "cached", "rows_in": cached[i - 1]["rows"] if i else None,
+                "rows": cached[i]["rows"], "seconds": cached[i]["seconds"]} for i, (stage, _, _, _) in enumerate(stages[:first])]
+
+    if first < len(stages):
+        if first == 0:
+            source = Meter(mmif_frames(paths, dedupe, processes, raw))
+        else:
+            source = Meter(csv_frames(cache.path(*stages[first - 1][:2])))
+        frames = source
+        meters = []
+        for stage, stage_key, stage_columns, apply in stages[first:]:
+            upstream = frames
+            if apply is not None:
+                frames = apply(guid_runs(frames))
+            frames = Meter(write_csv(frames, f"{cache.path(stage, stage_key)}.run", stage_columns))
+            meters.append((stage, stage_key, upstream, frames))
+        for _ in frames:
+            pass
+        for stage, stage_key, upstream, meter in meters:
+            # Time spent in this stage, not waiting on the one before it
+            seconds = meter.seconds - (0 if stage == "swt" else upstream.seconds)
+            run_path = f"{cache.path(stage, stage_key)}.run"
+            # Failed lookups are tried again next time rather than cached
+            if stage != "paths" or not pd.read_csv(run_path, usecols=["path"])["path"].isna().any():
+                cache.store(stage, stage_key, run_path, meter.rows, seconds)
+            results.append({"stage": stage, "status": "ran", "rows_in": None if stage == "swt" else upstream.rows,
+                            "rows": meter.rows, "seconds": seconds})
+
+    output_file = os.path.join(output_dir, f"{name}.csv")
+    final = cache.path(*stages[-1][:2])
+    if os.path.exists(f"{final}.run"):
+        os.replace(f"{final}.run", output_file)
+    else:
+        shutil.copyfile(final, output_file)
+    for stage, stage_key, _, _ in stages:
+        if os.path.exists(f"{cache.path(stage, stage_key)}.run"):
+            os.remove(f"{cache.path(stage, stage_key)}.run")
+    report(results, time.perf_counter() - start)
+    print(f"Wrote {output_file}")
+    return output_file
+
+
+def annotate(files, pack=1, retries=None, bulk=False, lookup=True, use_cache=True, cache_dir=CACHE_DIR,
+             output_dir=LLM_IN_PROGRESS, **engine_options):
+    """
+    Annotates reviewed batches with the LLM (llm_annotate), skipping files whose content,
+    prompts, model and options match an earlier run: their cached output is copied to
+    `output_dir` instead. Like llm_annotate.py, each input is renamed once its output is
+    written. A file left with failed or invalid rows gets no output and keeps its input
+    and checkpoint, so it is reported as partial, not cached, and running it again only
+    sends those rows.
+    """
+    # Imported here: building the API client needs ANTHROPIC_API_KEY, which `prepare` doesn't
+    from utils.llm_annotate import (MODEL, SYSTEM_MESSAGES, VALIDATION_RETRIES, CACHE_FILE, ResponseCache,
+                                    annotate_files)
+    start = time.perf_counter()
+    retries = VALIDATION_RETRIES if retries is None else retries
+    cache = StageCache(cache_dir)
+    completed = load_completed(LLM_COMPLETE) if lookup else None
+    options = digest(MODEL, SYSTEM_MESSAGES, pack, retries, sorted(completed.items()) if completed else None)
+
+    results = []
+    todo = []
+    for input_file in files:
+        key = digest("llm", cache.file_digest(input_file), options)
+        output_file = os.path.join(output_dir, os.path.basename(input_file))
+        info = cache.info("llm", key)
+        if info is None:
+            todo.append((input_file, output_file, key))
+            continue
+        shutil.copyfile(cache.path("llm", key), output_file)
+        os.rename(input_file, f"{input_file}.{time.strftime('%Y%m%d-%H%M%S')}.llm-annotated")
+        results.append({"stage": f"llm {os.path.basename(input_file)}", "status": "cached", "rows": info["rows"],
+                        "seconds": info["seconds"]})
+    cache.save_digests()
+
+    if todo:
+        response_cache = ResponseCache(CACHE_FILE) if use_cache else None
+        rows_in = {input_file: len(pd.read_csv(input_file)) for input_file, _, _ in todo}
+        run_start = time.perf_counter()
+        outcomes = annotate_files([(input_file, output_file) for input_file, output_file, _ in todo], response_cache,
+                                  bulk, pack=pack, retries=retries, lookup=completed, **engine_options)
+        # Files share one engine, so each is credited with the whole run's time
+        seconds = time.perf_counter() - run_start
+        for (input_file, output_file, key), outcome in zip(todo, outcomes):
+            stage = f"llm {os.path.basename(input_file)}"
+            # Only a finished file has its input renamed and its output written
+            if os.path.exists(input_file) or not os.path.exists(output_file):
+                status = "failed" if isinstance(outcome, Exception) or not outcome else "partial"
+                results.append({"stage": stage, "status": status, "rows_in": rows_in[input_file], "rows": 0,
+                                "seconds": seconds})
+                continue
+            df = pd.read_csv(output_file)
+            cache.store("llm", key, output_file, len(df), seconds)
+            results.append({"stage": stage, "status": "ran", "rows_in": rows_in[input_file], "rows": len(df),
+                            "seconds": seconds})
+    report(results, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    # To build a batch for the OCR reviewer from MMIF files, collapsing near duplicates and
+    # looking up video paths, run e.g.:
+    # python utils/pipeline.py prepare --mmif mmif/ --name batch-01 --dedupe --raw --near-dupes --url http://example.com:12345
+    # and, once reviewed batches are in 2-ocr-complete, to annotate them with the LLM:
+    # python utils/pipeline.py annotate --all --pack 10
+
+    parser = argparse.ArgumentParser(description="Run the non-interactive steps of the annotation pipeline")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    prepare_parser = subparsers.add_parser("prepare", help="MMIF files -> batch in 1-ocr-in-progress")
+    prepare_parser.add_argument("--mmif", required=True, help="Directory of SWT/OCR MMIF files")
+    prepare_parser.add_argument("--name", required=True, help="Batch name; writes 1-ocr-in-progress/<name>.csv")
+    prepare_parser.add_argument("--dedupe", action="store_true", help="Drop repeated text per GUID and scene label")
+    prepare_parser.add_argument("--raw", action="store_true", help="Read the MMIF JSON directly (faster)")
+    prepare_parser.add_argument("--processes", type=int, default=1, help="Worker processes parsing MMIF files (0: one per CPU)")
+    prepare_parser.add_argument("--near-dupes", action="store_true", help="Collapse near-duplicate OCR text")
+    prepare_parser.add_argument("--threshold", type=float, default=THRESHOLD, help="Minimum character similarity of near duplicates")
+    prepare_parser.add_argument("--url", default=None, help="Search API URL to look up video paths (skipped if not given)")
+    prepare_parser.add_argument("--path-concurrency", type=int, default=PATH_CONCURRENCY, help="Path lookups in flight")
+
+    annotate_parser = subparsers.add_parser("annotate", help="Reviewed batches -> LLM annotations in 3-llm-in-progress")
+    group = annotate_parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--input_file", default=None, help="Input CSV file path")
+    group.add_argument("-a", "--all", action="store_true", help="Annotate every file in 2-ocr-complete")
+    annotate_parser.add_argument("--pack", type=int, default=1, help="Annotate up to this many rows of a scene label per request")
+    annotate_parser.add_argument("--retries", type=int, default=None, help="Rounds of re-sending rows that fail validation")
+    annotate_parser.add_argument("--bulk", action="store_true", help="Submit rows through the Message Batches API")
+    annotate_parser.add_argument("--concurrency", type=int, default=None, help="Maximum requests in flight")
+    annotate_parser.add_argument("--no-lookup", action="store_true", help="Don't reuse annotations from 4-llm-complete")
+    annotate_parser.add_argument("--no-cache", action="store_true", help="Don't use the LLM response cache")
+
+    for subparser in (prepare_parser, annotate_parser):
+        subparser.add_argument("--cache-dir", default=CACHE_DIR, help="Directory of cached stage outputs")
+    args = parser.parse_args()
+
+    if args.command == "prepare":
+        prepare(args.mmif, args.name, args.dedupe, args.raw, args.processes or None, args.near_dupes, args.threshold,
+                args.url, args.path_concurrency, cache_dir=args.cache_dir)
+    else:
+        if args.input_file is not None:
+            files = [args.input_file]
+        else:
+            files = [os.path.join(OCR_COMPLETE, file) for file in sorted(os.listdir(OCR_COMPLETE))
+                     if not file.endswith(".llm-annotated") and not file.startswith(".")]
+        engine_options = {} if args.concurrency is None else {"concurrency": args.concurrency}
+        annotate(files, args.pack, args.retries, args.bulk, not args.no_lookup, not args.no_cache, args.cache_dir,
+                 **engine_options)
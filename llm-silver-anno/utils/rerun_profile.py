@@ -0,0 +1,163 @@
+import argparse
+import csv
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import wraps
+
+import pandas as pd
+import streamlit as st
+
+# Set RERUN_PROFILE to a log file path (e.g. RERUN_PROFILE=rerun_profile.csv streamlit run ...) to time every rerun
+PROFILE_LOG = os.environ.get("RERUN_PROFILE")
+LOG_COLUMNS = ["time", "app", "session", "rerun", "section", "ms"]
+# Every session of a Streamlit server runs in the same process
+_log_lock = threading.Lock()
+
+
+class RerunProfiler:
+    """
+    Times named sections of one session's reruns. `lap(name)` records the time since the
+    previous lap, so laps split the script body into consecutive sections; `section(name)`
+    and `timed(name, fn)` time a block or a widget callback (callbacks run at the start of
+    the next rerun, before the script body). `finish()` adds a "total" (wall time of the
+    rerun, callbacks included), shows the breakdown in a sidebar expander and appends one
+    record per section to the log. A rerun cut short by st.stop() or st.rerun() is logged
+    when the next one begins. With no log file every method does nothing.
+    """
+
+    def __init__(self, app: str, log_file: str = PROFILE_LOG):
+        self.app = app
+        self.log_file = log_file
+        self.enabled = log_file is not None
+        self.session = uuid.uuid4().hex[:8]
+        self.rerun = 0
+        self.running = False
+        self.started = None
+        self.lap_start = None
+        self.last_end = None
+        self.sections = {}
+        # {section: [reruns, total ms]} over the session, for the mean column
+        self.history = {}
+
+    def begin(self):
+        if not self.enabled:
+            return self
+        if self.running:
+            self._flush(self.last_end)
+        now = time.perf_counter()
+        self.rerun += 1
+        self.running = True
+        if self.started is None:
+            self.started = now
+        self.lap_start = self.last_end = now
+        return self
+
+    def _record(self, name: str, start: float):
+        end = time.perf_counter()
+        if self.started is None:
+            self.started = start
+        self.sections[name] = self.sections.get(name, 0.0) + (end - start) * 1000
+        self.last_end = end
+
+    def lap(self, name: str):
+        if not self.running:
+            return
+        self._record(name, self.lap_start)
+        self.lap_start = self.last_end
+
+    @contextmanager
+    def section(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, start)
+
+    def timed(self, name: str, fn):
+        """`fn` wrapped in a section, for on_click/on_change callbacks."""
+        if not self.enabled:
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with self.section(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    def _flush(self, end: float) -> dict:
+        sections = self.sections
+        sections["total"] = (end - self.started) * 1000
+        for name, ms in sections.items():
+            reruns, total = self.history.get(name, (0, 0.0))
+            self.history[name] = (reruns + 1, total + ms)
+        self.write_log(sections)
+        self.sections = {}
+        self.running = False
+        self.started = None
+        return sections
+
+    def write_log(self, sections: dict):
+        now = time.strftime("%Y-%m-%dT%H:%M:%S")
+        with _log_lock, open(self.log_file, "a", newline="") as f:
+            writer = csv.writer(f)
+            if f.tell() == 0:
+                writer.writerow(LOG_COLUMNS)
+            writer.writerows([now, self.app, self.session, self.rerun, name, round(ms, 3)]
+                             for name, ms in sections.items())
+
+    def finish(self):
+        """Ends the rerun; call it last in the script (and before st.stop())."""
+        if not self.running:
+            return
+        sections = self._flush(time.perf_counter())
+        with st.sidebar.expander(f"Rerun timings (rerun {self.rerun})"):
+            st.dataframe(pd.DataFrame({
+                "ms": sections,
+                "session mean ms": {name: self.history[name][1] / self.history[name][0] for name in sections},
+            }).round(1), use_container_width=True)
+            st.caption(f"Session {self.session}, logged to {self.log_file}")
+
+
+_disabled = RerunProfiler("", log_file=None)
+
+
+def rerun_profiler(app: str) -> RerunProfiler:
+    """The session's profiler, begun for this rerun (one that does nothing unless RERUN_PROFILE is set)."""
+    if PROFILE_LOG is None:
+        return _disabled
+    if "rerun_profiler" not in st.session_state:
+        st.session_state["rerun_profiler"] = RerunProfiler(app)
+    return st.session_state["rerun_profiler"].begin()
+
+
+def summarize(log_file: str) -> pd.DataFrame:
+    """Per app and section: reruns, mean, median, p90, p99 and max ms."""
+    log = pd.read_csv(log_file)
+    grouped = log.groupby(["app", "section"], sort=False)["ms"]
+    summary = grouped.describe(percentiles=[0.5, 0.9, 0.99])[["count", "mean", "50%", "90%", "99%", "max"]]
+    summary = summary.rename(columns={"count": "reruns", "50%": "p50", "90%": "p90", "99%": "p99"}).round(1)
+    return summary.astype({"reruns": int})
+
+
+if __name__ == "__main__":
+    # To see where the apps spend their reruns, start one with profiling on, e.g.:
+    # RERUN_PROFILE=rerun_profile.csv streamlit run ocr_reviewer.py
+    # and after a while summarize the log with:
+    # python utils/rerun_profile.py rerun_profile.csv
+
+    parser = argparse.ArgumentParser(description="Summarize a rerun timing log written by the annotation apps")
+    parser.add_argument("log_file", help="Log file (the RERUN_PROFILE path)")
+    parser.add_argument("--app", default=None, help="Only this app (main, ocr_reviewer or llm_adjudicator)")
+    args = parser.parse_args()
+
+    summary = summarize(args.log_file)
+    if args.app is not None:
+        summary = summary.loc[[args.app]]
+    with pd.option_context("display.max_rows", None, "display.max_columns", None, "display.width", 200):
+        print(summary)
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+# Queue orderings offered by the reviewer apps
+FILE_ORDER = "File order"
+MISMATCH_ORDER = "Most mismatched first"
+LOCALITY_ORDER = "Group by video"
+
+# Columns `build_queue` may look at
+QUEUE_COLUMNS = ["path", "guid", "timePoint", "timepoint", "mismatch_count"]
+
+
+def timepoint_column(columns) -> str:
+    """SWT batches name the column `timepoint`, older batches `timePoint`."""
+    return "timePoint" if "timePoint" in columns else "timepoint"
+
+
+def locality_order(df: pd.DataFrame) -> np.ndarray:
+    """
+    Returns row positions grouped by video (`path`, or `guid` if paths are not resolved yet),
+    in order of each video's first appearance, and sorted by timepoint within a video, so
+    consecutive rows read forward through one open video file.
+    """
+    video = df["path"] if "path" in df.columns else df["guid"]
+    video_codes, _ = pd.factorize(video)
+    timepoints = df[timepoint_column(df.columns)].to_numpy()
+    # lexsort sorts by the last key first and is stable
+    return np.lexsort((timepoints, video_codes))
+
+
+def build_queue(df: pd.DataFrame, order: str = FILE_ORDER, min_mismatch: int = 0, exclude=None) -> list[int]:
+    """
+    Returns the row positions of `df` in the order they should be reviewed, leaving out
+    positions where the boolean array `exclude` is True. Rows are never reordered in the
+    frame itself, so saved files keep their original row order.
+    """
+    positions = np.arange(len(df))
+    if order == LOCALITY_ORDER:
+        positions = locality_order(df)
+    if "mismatch_count" in df.columns:
+        mismatches = df["mismatch_count"].to_numpy()
+        if order == MISMATCH_ORDER:
+            # Stable sort so rows with equal severity stay in file order
+            positions = np.argsort(-mismatches, kind="stable")
+        if min_mismatch > 0:
+            positions = positions[mismatches[positions] >= min_mismatch]
+    if exclude is not None:
+        positions = positions[~np.asarray(exclude, dtype=bool)[positions]]
+    return positions.tolist()
+
+
+def next_in_queue(queue: list[int], current: int, done: pd.Series):
+    """
+    Returns the first row after `current` in the queue that is not yet done, wrapping
+    around to the start of the queue. Returns None once every row in the queue is done.
+    """
+    try:
+        i = queue.index(current) + 1
+    except ValueError:
+        # Current row was jumped to or is filtered out
+        i = 0
+    following = first_pending(queue[i:], done)
+    return following if following is not None else first_pending(queue[:i], done)
+
+
+def previous_in_queue(queue: list[int], current: int):
+    """Returns the position reviewed before `current`, or None at the start of the queue."""
+    try:
+        i = queue.index(current) - 1
+    except ValueError:
+        return None
+    return queue[i] if i >= 0 else None
+
+
+def first_pending(queue: list[int], done: pd.Series):
+    """Returns the first position in the queue whose `done` flag is False, or None."""
+    queue = np.asarray(queue, dtype=int)
+    pending = queue[~done.to_numpy(dtype=bool)[queue]]
+    return int(pending[0]) if len(pending) else None
@@ -0,0 +1,163 @@
+import argparse
+import json
+import re
+from collections import defaultdict
+from multiprocessing import Pool
+
+import pandas as pd
+
+# Tags look like "O", or B/I + R/F + ":" + index, e.g. "BR:1", "IF:12"
+TAG_PATTERN = re.compile(r"^(?:O|([BI])([RF]):(\d+))$")
+
+# Below this many rows, spinning up worker processes costs more than it saves
+PARALLEL_THRESHOLD = 20000
+
+
+class RFBParseError(ValueError):
+    """Raised when a BIO role-filler string cannot be decoded."""
+
+    def __init__(self, message: str, position: int = None, token: str = None):
+        self.position = position
+        self.token = token
+        if position is not None:
+            message = f"token {position} ({token!r}): {message}"
+        super().__init__(message)
+
+
+def split_token(token: str, position: int = None) -> tuple[str, str]:
+    """Splits a `word@TAG` token into its word and tag. Words may themselves contain '@'."""
+    word, sep, tag = token.rpartition("@")
+    if not sep:
+        raise RFBParseError("missing '@TAG' suffix", position, token)
+    if not word:
+        raise RFBParseError("empty word before '@'", position, token)
+    return word, tag
+
+
+def tokenize(anno: str) -> list[tuple[str, str]]:
+    """Splits an annotation string into (word, tag) pairs without validating the tags."""
+    return [split_token(token, i) for i, token in enumerate(anno.split())]
+
+
+def strip_tags(anno: str) -> list[str]:
+    """Returns the words of an annotation string with their tags removed."""
+    return [word for word, _ in tokenize(anno)]
+
+
+def decode_phrases(anno: str) -> list[tuple[str, int, str]]:
+    """
+    Decodes an annotation string into (kind, index, text) phrases in a single pass,
+    where kind is "R" (role) or "F" (filler). "O" tokens are skipped without closing
+    the current phrase, matching how the adjudicator has always rendered annotations.
+    """
+    phrases = []
+    current = None  # [kind, index, words]
+    for i, token in enumerate(anno.split()):
+        word, tag = split_token(token, i)
+        match = TAG_PATTERN.match(tag)
+        if match is None:
+            raise RFBParseError(f"malformed tag {tag!r}, expected O, BR:i, IR:i, BF:i or IF:i", i, token)
+        b_i, kind, index = match.groups()
+        if b_i is None:
+            continue
+        index = int(index)
+        if b_i == "B":
+            if current is not None:
+                phrases.append((current[0], current[1], " ".join(current[2])))
+            current = [kind, index, [word]]
+        else:
+            if current is None:
+                raise RFBParseError(f"I{kind}:{index} does not continue any phrase", i, token)
+            if current[0] != kind or current[1] != index:
+                raise RFBParseError(f"I{kind}:{index} cannot continue B{current[0]}:{current[1]} phrase", i, token)
+            current[2].append(word)
+    if current is not None:
+        phrases.append((current[0], current[1], " ".join(current[2])))
+    return phrases
+
+
+def decode(anno: str) -> dict[str, list[str]]:
+    """
+    Decodes an annotation string into a role -> fillers map. Fillers whose index has
+    no role are collected under the empty-string role.
+    """
+    if not isinstance(anno, str):
+        raise RFBParseError(f"expected a string, got {type(anno).__name__}")
+    roles = []
+    fillers_by_index = defaultdict(list)
+    for kind, index, text in decode_phrases(anno):
+        if kind == "R":
+            roles.append((index, text))
+        else:
+            fillers_by_index[index].append(text)
+
+    rfb_dict = {}
+    role_indices = set()
+    for index, text in roles:
+        rfb_dict[text] = list(fillers_by_index.get(index, []))
+        role_indices.add(index)
+    leftovers = [text for index, fillers in fillers_by_index.items() if index not in role_indices for text in fillers]
+    if leftovers:
+        rfb_dict.setdefault("", []).extend(leftovers)
+    return rfb_dict
+
+
+def safe_decode(anno) -> tuple[dict, str]:
+    """Returns (rfb_dict, None) on success or (None, error message) on failure."""
+    try:
+        return decode(anno), None
+    except RFBParseError as e:
+        return None, str(e)
+
+
+def parse_silver_standard(anno) -> dict:
+    """The adjudicator's view of an annotation: the decoded dict, or {"error": ...} if it can't be decoded."""
+    try:
+        return decode(anno)
+    except RFBParseError as e:
+        return {"error": f"Unparsable string: {e}"}
+
+
+def decode_many(annos, processes: int = None, chunksize: int = 2000) -> list[tuple[dict, str]]:
+    """
+    Decodes a sequence of annotation strings with `safe_decode`. With processes=None,
+    inputs of PARALLEL_THRESHOLD rows or more are spread over one worker per CPU;
+    pass an explicit count to choose the pool size (1 disables multiprocessing).
+    """
+    annos = list(annos)
+    if processes == 1 or (processes is None and len(annos) < PARALLEL_THRESHOLD):
+        return [safe_decode(anno) for anno in annos]
+    with Pool(processes) as pool:
+        return pool.map(safe_decode, annos, chunksize=chunksize)
+
+
+def decode_column(series: pd.Series, processes: int = None) -> pd.DataFrame:
+    """
+    Decodes a column of annotation strings. Returns a frame with the same index holding
+    `rfb` (role -> fillers dict, or None) and `rfb_error` (error message, or None).
+    """
+    results = decode_many(series.tolist(), processes=processes)
+    return pd.DataFrame(results, index=series.index, columns=["rfb", "rfb_error"])
+
+
+def main(input_file, output_file, column, processes):
+    df = pd.read_csv(input_file)
+    decoded = decode_column(df[column], processes=processes)
+    df["rfb"] = decoded["rfb"].map(lambda rfb: json.dumps(rfb) if rfb is not None else None)
+    df["rfb_error"] = decoded["rfb_error"]
+    df.to_csv(output_file, index=False)
+    print(f"Decoded {decoded['rfb_error'].isna().sum()}/{len(df)} rows, {decoded['rfb_error'].notna().sum()} errors.")
+
+
+if __name__ == "__main__":
+    # To run standalone on a CSV file, run e.g.:
+    # python utils/rfb_decoder.py input.csv output.csv --column labels
+
+    parser = argparse.ArgumentParser(description="Decode BIO role-filler annotations into role -> fillers JSON")
+    parser.add_argument("input_file", type=str, help="Input CSV file path")
+    parser.add_argument("output_file", type=str, help="Output CSV file path")
+    parser.add_argument("--column", default="silver_standard_annotation", help="Column holding the annotations")
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes (default: one per CPU)")
+    args = parser.parse_args()
+
+    main(args.input_file, args.output_file, args.column, args.processes)
@@ -0,0 +1,111 @@
+import argparse
+import os
+import sqlite3
+import time
+
+
+class ConversionState:
+    """
+    What earlier swt_to_csv.py runs did, kept in SQLite so a run over a growing MMIF
+    archive only parses new files and only writes rows no earlier batch had: a manifest
+    of processed files (path, size, mtime) and the dedupe index of written rows, by
+    (guid, scene label, normalized text) and by exact text. Runs without a state file use
+    `InMemoryState` instead.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, rows INTEGER, processed REAL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS texts (guid TEXT, scene_label TEXT, text TEXT, PRIMARY KEY (guid, scene_label, text))")
+        self.db.execute("CREATE TABLE IF NOT EXISTS documents (text TEXT PRIMARY KEY)")
+        self.db.commit()
+
+    def is_processed(self, path: str) -> bool:
+        """Whether the file was processed before and hasn't changed (same size and mtime) since."""
+        row = self.db.execute("SELECT size, mtime FROM files WHERE path=?", (os.path.abspath(path),)).fetchone()
+        if row is None:
+            return False
+        stat = os.stat(path)
+        return row == (stat.st_size, stat.st_mtime)
+
+    def mark_processed(self, path: str, rows: int):
+        stat = os.stat(path)
+        self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                        (os.path.abspath(path), stat.st_size, stat.st_mtime, rows, time.time()))
+
+    def add_text(self, guid: str, scene_label: str, normalized_text: str) -> bool:
+        """Records a (guid, scene label, normalized text); returns False if it was seen before."""
+        return self.db.execute("INSERT OR IGNORE INTO texts VALUES (?, ?, ?)",
+                               (guid, scene_label, normalized_text)).rowcount == 1
+
+    def add_document(self, text: str) -> bool:
+        """Records an exact OCR text; returns False if it was seen before."""
+        return self.db.execute("INSERT OR IGNORE INTO documents VALUES (?)", (text,)).rowcount == 1
+
+    def commit(self):
+        self.db.commit()
+
+    def stats(self) -> dict:
+        return {table: self.db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("files", "texts", "documents")}
+
+    def close(self):
+        self.db.close()
+
+
+class InMemoryState:
+    """
+    The dedupe index of a single run without a state file, kept in Python sets. Nothing
+    counts as processed before the run, and nothing outlives it.
+    """
+
+    def __init__(self):
+        self.texts = set()
+        self.documents = set()
+
+    def is_processed(self, path: str) -> bool:
+        return False
+
+    def mark_processed(self, path: str, rows: int):
+        pass
+
+    def add_text(self, guid: str, scene_label: str, normalized_text: str) -> bool:
+        key = (guid, scene_label, normalized_text)
+        if key in self.texts:
+            return False
+        self.texts.add(key)
+        return True
+
+    def add_document(self, text: str) -> bool:
+        if text in self.documents:
+            return False
+        self.documents.add(text)
+        return True
+
+    def commit(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"files": 0, "texts": len(self.texts), "documents": len(self.documents)}
+
+    def close(self):
+        pass
+
+
+if __name__ == "__main__":
+    # To inspect the state of incremental swt_to_csv.py runs, run e.g.:
+    # python utils/swt_state.py swt_state.sqlite
+
+    parser = argparse.ArgumentParser(description="Inspect the state of incremental MMIF -> CSV runs")
+    parser.add_argument("state_file", help="State file path")
+    args = parser.parse_args()
+
+    state = ConversionState(args.state_file)
+    stats = state.stats()
+    print(f"{stats['files']} MMIF files processed, {stats['texts']} normalized texts and "
+          f"{stats['documents']} OCR texts in the dedupe index")
+    for path, rows, processed in state.db.execute("SELECT path, rows, processed FROM files ORDER BY processed DESC LIMIT 10"):
+        print(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(processed))}\t{rows}\t{path}")
+    state.close()
@@ -1,99 +1,253 @@
 import argparse
+import csv
+from collections import Counter
+from functools import partial
+from multiprocessing import Pool
+import json
 from mmif import Mmif
-import pandas as pd
 from tqdm import tqdm
 import os
 import re
+import sys
 from clams_utils.aapb import guidhandler
 from mmif.vocabulary.annotation_types import AnnotationTypes
 
+# Allow `python utils/swt_to_csv.py` as well as `import utils.swt_to_csv`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.swt_state import ConversionState, InMemoryState
 
-def dir_to_csv(in_dir: str, out_file: str, dedupe=False):
+COLUMNS = ["guid", "timepoint", "scene_label", "confidence", "textdocument"]
+# SWT labels we annotate; rows with any other scene label are dropped
+SCENE_LABELS = {"I": "chyron", "N": "chyron", "Y": "chyron", "C": "credits"}
+# Any version of the Alignment type, for the raw-JSON path
+ALIGNMENT_TYPE = re.compile(r"/Alignment(?:/v\d+)?$")
+
+
+def index_annotations(mmif: Mmif) -> dict:
     """
-    Gathers annotations from all SWT/OCR MMIF files in a directory
-    and writes them to a single CSV file.
+    Maps every annotation in every view, by long ("v_1:td_2") and short ("td_2") id, and
+    every top-level document to its object, in one pass over the MMIF, so alignments
+    resolve in constant time. If several views share a short id, the last view wins.
+    """
+    index = {}
+    for view in mmif.views:
+        for anno in view.annotations:
+            short_id = anno.id.rsplit(view.id_delimiter, 1)[-1]
+            index[f"{view.id}{view.id_delimiter}{short_id}"] = anno
+            index[short_id] = anno
+    for doc in mmif.documents:
+        index[doc.id] = doc
+    return index
+
+
+def resolve(index: dict, ref: str, view_id: str, delimiter: str = ":"):
     """
-    data = []
-    seen_text = set()
-    for file in tqdm(os.listdir(in_dir)):
-        full_path = os.path.join(in_dir, file)
-        try:
-            with open(full_path, "r") as f:
-                mmif = Mmif(f.read())
-
-            for doc in mmif.documents:
-                if doc.properties["mime"] == "video":
-                    video_path = doc.location
-
-            guid = guidhandler.get_aapb_guid_from(video_path)
-
-            for view in mmif.views:
-                alignments = view.get_annotations(AnnotationTypes.Alignment)
-                for alignment in alignments:
-                    if "tp" not in alignment.properties["source"] or "td" not in alignment.properties["target"]:
-                        continue
-                    source_timepoint = alignment.properties["source"]
-                    target_td = alignment.properties["target"]
-
-                    if target_td in mmif:
-                        td_anno = mmif[target_td]
-                    else:
-                        for view in mmif.views:
-                            if target_td in view:
-                                td_anno = view[target_td]
-                    ocr_text = td_anno.properties["text"].value.strip()
-                    ocr_text_normalized = re.sub(r'[^\w]', '', ocr_text.lower())
-
-                    if source_timepoint in mmif:
-                        timepoint_anno = mmif[source_timepoint]
-                    else:
-                        for view in mmif.views:
-                            if source_timepoint in view:
-                                timepoint_anno = view[source_timepoint]
-                    timepoint = timepoint_anno.properties["timePoint"]
-                    scene_label, confidence = max(timepoint_anno.properties["classification"].items(),
-                                                  key=lambda x: x[1])
-
-                    if scene_label in ["I", "N", "Y"]:
-                        scene_label = "chyron"
-                    elif scene_label == "C":
-                        scene_label = "credits"
-                    # If scene label isn't one of those two, we aren't interested in it
-                    else:
-                        continue
-
-                    if not dedupe or (guid, scene_label, ocr_text_normalized) not in seen_text:
-                        data.append({
-                            "guid": guid,
-                            "timepoint": timepoint,
-                            "scene_label": scene_label,
-                            "confidence": confidence,
-                            "textdocument": ocr_text
-                        })
-                    seen_text.add((guid, scene_label, ocr_text_normalized))
-
-            # print(f"Total {len(data)} annotations.")
-
-        except Exception as e:
-            print(f"Error processing {full_path}: {e}")
+    Looks up an alignment's source or target id. A short id refers to the alignment's
+    own view when it has such an annotation; a long id that names the wrong view (as
+    upgraded pre-1.0 files can) falls back to its short id. Returns None if not found.
+    """
+    if delimiter not in ref:
+        return index.get(f"{view_id}{delimiter}{ref}", index.get(ref))
+    return index.get(ref, index.get(ref.rsplit(delimiter, 1)[-1]))
+
+
+def make_row(guid, ocr_text, timepoint, classification):
+    """A CSV row for one OCR'd TimePoint, or None if its scene label isn't a chyron or credit."""
+    scene_label, confidence = max(classification.items(), key=lambda x: x[1])
+    if scene_label not in SCENE_LABELS:
+        return None
+    return {
+        "guid": guid,
+        "timepoint": timepoint,
+        "scene_label": SCENE_LABELS[scene_label],
+        "confidence": confidence,
+        "textdocument": ocr_text.strip(),
+    }
+
+
+def mmif_rows(mmif: Mmif) -> list[dict]:
+    """Rows for every TimePoint -> TextDocument alignment in a MMIF, before any dedupe."""
+    video_path = None
+    for doc in mmif.documents:
+        if doc.properties["mime"] == "video":
+            video_path = doc.location
+    if video_path is None:
+        raise ValueError("no video document")
+    guid = guidhandler.get_aapb_guid_from(video_path)
+    index = index_annotations(mmif)
+
+    rows = []
+    for view in mmif.views:
+        for alignment in view.get_annotations(AnnotationTypes.Alignment):
+            if "tp" not in alignment.properties["source"] or "td" not in alignment.properties["target"]:
+                continue
+            td_anno = resolve(index, alignment.properties["target"], view.id, view.id_delimiter)
+            timepoint_anno = resolve(index, alignment.properties["source"], view.id, view.id_delimiter)
+            if td_anno is None or timepoint_anno is None:
+                continue
+            row = make_row(guid, td_anno.properties["text"].value, timepoint_anno.properties["timePoint"],
+                           timepoint_anno.properties["classification"])
+            if row is not None:
+                rows.append(row)
+    return rows
+
+
+def raw_mmif_rows(data: dict) -> list[dict]:
+    """
+    Same as `mmif_rows`, but reads the parsed MMIF JSON directly instead of building (and
+    validating) the full mmif-python object model, which is most of the cost per file.
+    """
+    video_path = None
+    for doc in data["documents"]:
+        if doc["properties"].get("mime") == "video":
+            video_path = doc["properties"]["location"]
+    if video_path is None:
+        raise ValueError("no video document")
+    guid = guidhandler.get_aapb_guid_from(video_path)
+
+    # The raw equivalent of index_annotations
+    index = {}
+    alignments = []
+    for view in data["views"]:
+        for anno in view.get("annotations", []):
+            short_id = anno["properties"]["id"].rsplit(":", 1)[-1]
+            index[f"{view['id']}:{short_id}"] = anno
+            index[short_id] = anno
+            if ALIGNMENT_TYPE.search(anno["@type"]):
+                alignments.append((view["id"], anno))
+    for doc in data["documents"]:
+        index[doc["properties"]["id"]] = doc
+
+    rows = []
+    for view_id, alignment in alignments:
+        source, target = alignment["properties"]["source"], alignment["properties"]["target"]
+        if "tp" not in source or "td" not in target:
             continue
+        td_anno = resolve(index, target, view_id)
+        timepoint_anno = resolve(index, source, view_id)
+        if td_anno is None or timepoint_anno is None:
+            continue
+        text = td_anno["properties"]["text"]
+        row = make_row(guid, text["@value"] if isinstance(text, dict) else text,
+                       timepoint_anno["properties"]["timePoint"], timepoint_anno["properties"]["classification"])
+        if row is not None:
+            rows.append(row)
+    return rows
+
 
-    df = pd.DataFrame.from_dict(data)
+def file_rows(full_path: str, raw: bool = False):
+    """Extracts one MMIF file's rows; returns (path, rows, error) so a bad file doesn't stop a worker pool."""
+    try:
+        with open(full_path, "r") as f:
+            rows = raw_mmif_rows(json.load(f)) if raw else mmif_rows(Mmif(f.read()))
+        return full_path, rows, None
+    except Exception as e:
+        return full_path, [], e
 
-    print(f"Found {len(df)} annotations.")
 
-    df = df.drop_duplicates(subset=["textdocument"])
+def normalize(text: str) -> str:
+    return re.sub(r'[^\w]', '', text.lower())
 
-    print(f"Saving {len(df)} unique annotations to {out_file}.")
-    print(f"Total: {len(df[df['scene_label'] == 'chyron'])} chyrons, {len(df[df['scene_label'] == 'credits'])} credits")
-    df.to_csv(out_file, index=False)
+
+def convert_files(paths: list, dedupe=False, processes: int = 1, raw=False, state=None):
+    """
+    Parses MMIF files in `processes` worker processes (None: one per CPU), optionally
+    through the lighter raw-JSON path, and yields (path, found, rows) per file in the
+    given order as it finishes. The dedupe is applied while merging: with `dedupe`,
+    repeats of a (guid, scene label, normalized text) are dropped (`found` counts the
+    rows left), and rows repeating an earlier row's exact text always are. Files that
+    can't be parsed are reported and skipped.
+    """
+    if state is None:
+        state = InMemoryState()
+    extract = partial(file_rows, raw=raw)
+    pool = Pool(processes) if processes != 1 else None
+    try:
+        # imap keeps the directory order, so the output doesn't depend on the worker count
+        results = pool.imap(extract, paths, chunksize=4) if pool is not None else map(extract, paths)
+        for full_path, rows, error in tqdm(results, total=len(paths)):
+            if error is not None:
+                print(f"Error processing {full_path}: {error}")
+                continue
+            found = 0
+            kept = []
+            for row in rows:
+                if dedupe and not state.add_text(row["guid"], row["scene_label"], normalize(row["textdocument"])):
+                    continue
+                found += 1
+                if state.add_document(row["textdocument"]):
+                    kept.append(row)
+            yield full_path, found, kept
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+def dir_to_csv(in_dir: str, out_file: str, dedupe=False, processes: int = 1, raw=False, state_file: str = None):
+    """
+    Gathers annotations from all SWT/OCR MMIF files in a directory
+    and writes them to a single CSV file.
+
+    Files are parsed and deduplicated by `convert_files`, and their rows are written out
+    as each file finishes rather than collected in memory.
+
+    With a `state_file` (see `ConversionState`), files processed by earlier runs are
+    skipped unless they changed, and the dedupe also drops rows written by earlier runs,
+    so each run's CSV holds only the new rows. The CSV is written to a temporary file and
+    the state is only committed once it has replaced `out_file`, so a run that fails
+    leaves the state as it was.
+    """
+    state = ConversionState(state_file) if state_file is not None else InMemoryState()
+    if os.path.exists(out_file) and state.stats()["files"] > 0:
+        state.close()
+        # Overwriting it would lose the rows of the files the state lists as done
+        raise FileExistsError(f"{out_file} exists and {state_file} lists files converted by an earlier run; "
+                              f"write this run's rows to a new output file")
+    paths = [os.path.join(in_dir, file) for file in os.listdir(in_dir)]
+    new_paths = [path for path in paths if not state.is_processed(path)]
+    if len(new_paths) < len(paths):
+        print(f"Skipping {len(paths) - len(new_paths)} files processed by earlier runs.")
+    paths = new_paths
+
+    found = 0
+    counts = Counter()
+    tmp_file = f"{out_file}.tmp"
+    try:
+        with open(tmp_file, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            for full_path, file_found, rows in convert_files(paths, dedupe, processes, raw, state):
+                found += file_found
+                writer.writerows(rows)
+                counts.update(row["scene_label"] for row in rows)
+                state.mark_processed(full_path, len(rows))
+        os.replace(tmp_file, out_file)
+        # Files only count as processed once their rows are in the output
+        state.commit()
+    finally:
+        state.close()
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+    print(f"Found {found} annotations.")
+    print(f"Saved {sum(counts.values())} unique annotations to {out_file}.")
+    print(f"Total: {counts['chyron']} chyrons, {counts['credits']} credits")
 
 
 if __name__ == "__main__":
+    # To convert a directory of MMIF files with one worker per CPU, run e.g.:
+    # python utils/swt_to_csv.py --input mmif/ --output batch.csv --dedupe --processes 0 --raw
+    # or, to only convert files (and rows) that earlier runs haven't:
+    # python utils/swt_to_csv.py --input mmif/ --output batch-2.csv --dedupe --raw --state swt_state.sqlite
+
     parser = argparse.ArgumentParser(description="MMIF -> CSV conversion script for RFB annotations.")
     parser.add_argument("--input", type=str, required=True, help="The directory containing the MMIF files.")
     parser.add_argument("--output", type=str, required=True, help="The output CSV file.")
     parser.add_argument("--dedupe", action='store_true', help="Try to de-dupleicate text document when given")
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes parsing MMIF files (0: one per CPU)")
+    parser.add_argument("--raw", action="store_true", help="Read the MMIF JSON directly instead of through mmif-python (faster)")
+    parser.add_argument("--state", default=None, help="State file for incremental runs: skip processed files and rows written before")
     args = parser.parse_args()
 
-    dir_to_csv(args.input, args.output, args.dedupe)
+    dir_to_csv(args.input, args.output, args.dedupe, args.processes or None, args.raw, args.state)
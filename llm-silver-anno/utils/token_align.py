@@ -0,0 +1,113 @@
+import argparse
+import html
+import json
+from difflib import SequenceMatcher
+
+import pandas as pd
+
+# Columns added by `add_alignment_columns`
+ALIGNMENT_COLUMNS = ["alignment", "tokens_dropped", "tokens_added", "tokens_altered", "mismatch_count"]
+
+
+def llm_tokens(annotation: str) -> list[str]:
+    """Returns the words of an LLM annotation with their '@TAG' suffixes removed."""
+    return [token.rpartition("@")[0] or token for token in annotation.split()]
+
+
+def align_tokens(ocr_tokens: list[str], annotated_tokens: list[str]) -> list[tuple]:
+    """
+    Aligns OCR tokens with the (untagged) LLM tokens. Returns the non-matching spans as
+    (op, ocr_start, ocr_end, llm_start, llm_end) tuples, where op is "delete" (dropped
+    by the LLM), "insert" (added by the LLM) or "replace" (altered by the LLM).
+    """
+    matcher = SequenceMatcher(None, ocr_tokens, annotated_tokens, autojunk=False)
+    return [tuple(opcode) for opcode in matcher.get_opcodes() if opcode[0] != "equal"]
+
+
+def mismatch_counts(spans: list[tuple]) -> dict[str, int]:
+    """Counts dropped, added and altered tokens in a list of alignment spans."""
+    counts = {"tokens_dropped": 0, "tokens_added": 0, "tokens_altered": 0}
+    for op, i1, i2, j1, j2 in spans:
+        if op == "delete":
+            counts["tokens_dropped"] += i2 - i1
+        elif op == "insert":
+            counts["tokens_added"] += j2 - j1
+        else:
+            counts["tokens_altered"] += max(i2 - i1, j2 - j1)
+    counts["mismatch_count"] = sum(counts.values())
+    return counts
+
+
+def align_row(cleaned_text, annotation) -> dict:
+    """Computes the alignment columns for one row. Missing text or annotation aligns as empty."""
+    ocr_tokens = cleaned_text.split() if isinstance(cleaned_text, str) else []
+    annotated_tokens = llm_tokens(annotation) if isinstance(annotation, str) else []
+    spans = align_tokens(ocr_tokens, annotated_tokens)
+    return {"alignment": json.dumps(spans), **mismatch_counts(spans)}
+
+
+def add_alignment_columns(df: pd.DataFrame, text_col="cleaned_text", anno_col="silver_standard_annotation") -> pd.DataFrame:
+    """Adds (or recomputes) the alignment columns for every row of an annotated batch."""
+    aligned = pd.DataFrame(
+        [align_row(text, anno) for text, anno in zip(df[text_col], df[anno_col])],
+        index=df.index,
+        columns=ALIGNMENT_COLUMNS,
+    )
+    for column in ALIGNMENT_COLUMNS:
+        df[column] = aligned[column]
+    return df
+
+
+def highlight_html(cleaned_text: str, annotation: str, alignment: str) -> str:
+    """
+    Renders the OCR text as HTML with the LLM's changes marked: dropped tokens struck
+    through in red, altered tokens as red OCR text followed by the LLM's version, and
+    added tokens in green.
+    """
+    ocr_tokens = [html.escape(token) for token in cleaned_text.split()]
+    annotated_tokens = [html.escape(token) for token in llm_tokens(annotation)]
+    inserts, changes = {}, {}
+    for op, i1, i2, j1, j2 in json.loads(alignment):
+        (inserts if op == "insert" else changes)[i1] = (op, i1, i2, j1, j2)
+
+    out = []
+    i = 0
+    while i <= len(ocr_tokens):
+        if i in inserts:
+            _, _, _, j1, j2 = inserts[i]
+            out.append(f'<span class="added">+{" ".join(annotated_tokens[j1:j2])}</span>')
+        if i == len(ocr_tokens):
+            break
+        if i not in changes:
+            out.append(ocr_tokens[i])
+            i += 1
+            continue
+        op, i1, i2, j1, j2 = changes[i]
+        original = " ".join(ocr_tokens[i1:i2])
+        if op == "delete":
+            out.append(f'<span class="dropped">{original}</span>')
+        else:
+            out.append(f'<span class="altered">{original}</span> <span class="added">→{" ".join(annotated_tokens[j1:j2])}</span>')
+        i = i2
+    return " ".join(out)
+
+
+def main(input_file, output_file):
+    df = pd.read_csv(input_file)
+    df = add_alignment_columns(df)
+    df.to_csv(output_file, index=False)
+    mismatched = df[df["mismatch_count"] > 0]
+    print(f"{len(mismatched)}/{len(df)} rows differ from the OCR text "
+          f"({df['tokens_dropped'].sum()} dropped, {df['tokens_added'].sum()} added, {df['tokens_altered'].sum()} altered tokens).")
+
+
+if __name__ == "__main__":
+    # To run standalone on an annotated CSV file, run e.g.:
+    # python utils/token_align.py annotations/3-llm-in-progress/anno.csv annotations/3-llm-in-progress/anno.csv
+
+    parser = argparse.ArgumentParser(description="Align LLM annotations with their OCR text")
+    parser.add_argument("input_file", type=str, help="Input CSV file path")
+    parser.add_argument("output_file", type=str, help="Output CSV file path")
+    args = parser.parse_args()
+
+    main(args.input_file, args.output_file)
@@ -9,6 +9,8 @@ from pathlib import Path
 import cv2 as cv
 import streamlit as st
 
+from rerun_profile import rerun_profiler
+
 KEY = 'role'
 VALUE = 'fillers'
 DELIM = '\n'
@@ -188,6 +190,37 @@ def copy_prev_annotations(cur_guid):
             st.session_state['annotations'][k] = v
             st.toast(f'"{k}" copied from frame {prev_fnum}')
 
+
+def index_images(image_dir):
+    """
+    Returns {guid: sorted frame numbers} for the `<guid>.<frame>.png` images in a directory,
+    plus {position: (guid, frame)} and its reverse, numbering the frames GUID by GUID.
+    """
+    guids = defaultdict(list)
+    for img_f in Path(image_dir).glob('*.png'):
+        guid, fnum = img_f.name.split('.', 2)[:2]
+        guids[guid].append(int(fnum))
+    for fnums in guids.values():
+        fnums.sort()
+    indexed_images = {}
+    revindex_images = {}
+    idx = 0
+    for guid, fnums in guids.items():
+        for fnum in fnums:
+            indexed_images[idx] = (guid, fnum)
+            revindex_images[(guid, fnum)] = idx
+            idx += 1
+    return guids, indexed_images, revindex_images
+
+
+def first_unannotated(indexed_images):
+    """Position of the first image without an annotation file (len(indexed_images) if there is none)."""
+    img_idx = 0
+    while img_idx < len(indexed_images) and get_progress_guid_fnum(*indexed_images[img_idx]):
+        img_idx += 1
+    return img_idx
+
+
 @st.cache_data
 def load_ocr():
     return OCR(sample_img, results)
@@ -204,24 +237,13 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('dir', type=str, help='<Image Directory>:<Annotation Directory>', default='images')
     args = parser.parse_args()
+    profiler = rerun_profiler('main')
     dirs = args.dir.split(':')
     image_dir = pathlib.Path(dirs[0]).expanduser()
     annotation_dir = pathlib.Path(dirs[1]).expanduser()
     Path(annotation_dir).mkdir(parents=True, exist_ok=True)
-    guids = defaultdict(list)
-    for img_f in Path(image_dir).glob('*.png'):
-        guid, fnum = img_f.name.split('.', 2)[:2]
-        guids[guid].append(int(fnum))
-    for fnums in guids.values():
-        fnums.sort()
-    indexed_images = {}
-    revindex_images = {}
-    idx = 0
-    for guid, fnums in guids.items():
-        for fnum in fnums:
-            indexed_images[idx] = (guid, fnum)
-            revindex_images[(guid, fnum)] = idx
-            idx += 1
+    guids, indexed_images, revindex_images = index_images(image_dir)
+    profiler.lap('index images')
     
     #############################
     # Streamlit
@@ -229,9 +251,7 @@ if __name__ == '__main__':
     st.set_page_config(layout="wide")
     # Load first image
     if 'image_index' not in st.session_state:
-        img_idx = 0
-        while img_idx < len(indexed_images) and get_progress_guid_fnum(*indexed_images[img_idx]):
-            img_idx += 1
+        img_idx = first_unannotated(indexed_images)
         if img_idx == len(indexed_images):
             st.warning('No more images to annotate, showing the last image.')
             st.session_state['image_index'] = img_idx - 1
@@ -254,15 +274,19 @@ if __name__ == '__main__':
         st.session_state[KEY] = ''
     if VALUE not in st.session_state:
         st.session_state[VALUE] = ''
+    profiler.lap('load annotations')
 
 
     # This is the image that will be annotated
     guid, fnum = indexed_images[st.session_state['image_index']]
     sample_img = cv.imread(get_image_fname(guid, fnum))
+    profiler.lap('read image')
     # load results for image
     results = load_results(guid, fnum)
     image_name = get_image_id(guid, fnum)
+    profiler.lap('load OCR results')
     ocr = OCR(sample_img, results)
+    profiler.lap('draw')
     st.subheader(f'Current image: `{guid}` {fnum} ({datetime.timedelta(seconds=fnum // 30)}) [AAPB reading room](https://americanarchive.org/catalog/{guid.replace("cpb-aacip-", "cpb-aacip_")})')
     img_col, skip_col = st.columns((7, 1))
     with img_col:
@@ -270,6 +294,7 @@ if __name__ == '__main__':
         # Drawn Image
         ##############################
         st.image([sample_img, ocr.annotated_image])
+    profiler.lap('image panel')
     # with nav_col:
     with skip_col:
         # Add skip reason text form
@@ -281,13 +306,13 @@ if __name__ == '__main__':
         if st.session_state['skip_reason'] == skip_reason_otherkey:
             st.session_state['skip_reason'] = st.text_area('Reason for skipping', key='skip_reason_free')
         # Skip frame for which key-value annotations are not applicable
-        st.button("Skip image", on_click=cycle_images, args=(indexed_images, guid, fnum, 'skip'),  use_container_width=True,
+        st.button("Skip image", on_click=profiler.timed('skip callback', cycle_images), args=(indexed_images, guid, fnum, 'skip'),  use_container_width=True,
                   disabled='skip_reason' not in st.session_state or st.session_state['skip_reason'] is None or st.session_state['skip_reason'] == '')
-        st.button("Copy prev. annotations", on_click=copy_prev_annotations, args=[guid],
+        st.button("Copy prev. annotations", on_click=profiler.timed('copy callback', copy_prev_annotations), args=[guid],
                   disabled=guids[guid].index(fnum) == 0, use_container_width=True,)
         st.button("Save and proceed to next image", use_container_width=True, key='cont_top',
                   disabled=len(st.session_state[KEY]) + len(st.session_state[VALUE]) + len(st.session_state['annotations']) == 0,
-                  on_click=cycle_images, args=(indexed_images, guid, fnum, 'next'))
+                  on_click=profiler.timed('save and next callback', cycle_images), args=(indexed_images, guid, fnum, 'next'))
     ##############################
     # Add annotation
     ##############################
@@ -296,7 +321,7 @@ if __name__ == '__main__':
         col1, col2 = st.columns(2)
         col1.text_input(KEY, key=KEY, value=st.session_state[KEY] if KEY in st.session_state else '')
         col2.text_area(VALUE, key=VALUE, value=st.session_state[VALUE] if VALUE in st.session_state else '')
-        add_pair_btn = st.button("Add a new pair", use_container_width=True, on_click=add_pair, disabled=st.session_state[KEY] == '' and st.session_state[VALUE] == '')
+        add_pair_btn = st.button("Add a new pair", use_container_width=True, on_click=profiler.timed('add pair callback', add_pair), disabled=st.session_state[KEY] == '' and st.session_state[VALUE] == '')
         st.button(f'Add a delimiter to {VALUE} field (to manually type a delimiter, {delim_str}).', use_container_width=True, key=f'delim', on_click=autofill, args=(DELIM, VALUE))
     single_col_ratio = [2, 1, 1]  # text, to_key btn, to_val btn
     num_cols = 4
@@ -326,6 +351,7 @@ if __name__ == '__main__':
                     st.button(f'{VALUE}', help='Click to annotate', on_click=autofill,
                               args=(result[1], VALUE), key=f"value_{result[1]}_{r_idx}")
             st.button(f'Add a delimiter to {VALUE} field (to manually type a delimiter, {delim_str}).', use_container_width=True, key=f'delim_{i}', on_click=autofill, args=(DELIM, VALUE))
+    profiler.lap('annotation form and OCR boxes')
 
     ##############################
     # Annotation Viewer
@@ -340,7 +366,7 @@ if __name__ == '__main__':
     with next_col:
         st.button("Save and proceed to next image", use_container_width=True, key='cont_bottom',
                   disabled=len(st.session_state[KEY]) + len(st.session_state[VALUE]) + len(st.session_state['annotations']) == 0,
-                  on_click=cycle_images, args=(indexed_images, guid, fnum, 'next'))
+                  on_click=profiler.timed('save and next callback', cycle_images), args=(indexed_images, guid, fnum, 'next'))
     with edit_col:
         ##############################
         # Annotation Editor 
@@ -354,6 +380,7 @@ if __name__ == '__main__':
                 ks = st.multiselect(f'Select {KEY} to delete', options=opts,
                                  format_func=lambda x: f'"{x}"' if x else "EMPTY KEY")
                 st.button(f"Delete {KEY}-{VALUE} Pair", on_click=delete_pairs, args=(ks,))
+    profiler.lap('annotation viewer and editor')
     # with st.expander('Data Navigator', expanded=st.session_state['show_navigator']):
     st.divider()
     with st.container():
@@ -372,6 +399,8 @@ if __name__ == '__main__':
             nav_fnum_picker = st.selectbox('Select frame', options=guids[nav_guid_picker], index=idx,
                                            format_func=lambda x: f'{x} {"✅" if get_progress_guid_fnum(nav_guid_picker, x) else "❌"}')
         with go_btn_col:
-            st.button('Go', help='Go to selected image', on_click=lambda: st.session_state.update(
-                {'image_index': revindex_images[(nav_guid_picker, nav_fnum_picker)], 'annotations': None}))
+            st.button('Go', help='Go to selected image', on_click=profiler.timed('go callback', lambda: st.session_state.update(
+                {'image_index': revindex_images[(nav_guid_picker, nav_fnum_picker)], 'annotations': None})))
+    profiler.lap('navigator')
+    profiler.finish()
 
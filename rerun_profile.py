@@ -0,0 +1,129 @@
+import csv
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import wraps
+
+import streamlit as st
+
+# Set RERUN_PROFILE to a log file path (e.g. RERUN_PROFILE=rerun_profile.csv streamlit run main.py) to time every rerun.
+# The log has the same columns as the one the llm-silver-anno apps write, so one summary covers all of them.
+PROFILE_LOG = os.environ.get('RERUN_PROFILE')
+LOG_COLUMNS = ['time', 'app', 'session', 'rerun', 'section', 'ms']
+# Every session of a Streamlit server runs in the same process
+_log_lock = threading.Lock()
+
+
+class RerunProfiler:
+    """
+    Times named sections of one session's reruns. `lap(name)` records the time since the
+    previous lap, `section(name)` and `timed(name, fn)` time a block or a widget callback.
+    `finish()` adds a "total", shows the breakdown in a sidebar expander and appends one
+    record per section to the log. A rerun cut short by st.stop() or st.rerun() is logged
+    when the next one begins. With no log file every method does nothing.
+    """
+
+    def __init__(self, app, log_file=PROFILE_LOG):
+        self.app = app
+        self.log_file = log_file
+        self.enabled = log_file is not None
+        self.session = uuid.uuid4().hex[:8]
+        self.rerun = 0
+        self.running = False
+        self.started = None
+        self.lap_start = None
+        self.last_end = None
+        self.sections = {}
+        # {section: (reruns, total ms)} over the session, for the mean column
+        self.history = {}
+
+    def begin(self):
+        if not self.enabled:
+            return self
+        if self.running:
+            self._flush(self.last_end)
+        now = time.perf_counter()
+        self.rerun += 1
+        self.running = True
+        if self.started is None:
+            self.started = now
+        self.lap_start = self.last_end = now
+        return self
+
+    def _record(self, name, start):
+        end = time.perf_counter()
+        if self.started is None:
+            self.started = start
+        self.sections[name] = self.sections.get(name, 0.0) + (end - start) * 1000
+        self.last_end = end
+
+    def lap(self, name):
+        if not self.running:
+            return
+        self._record(name, self.lap_start)
+        self.lap_start = self.last_end
+
+    @contextmanager
+    def section(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, start)
+
+    def timed(self, name, fn):
+        """`fn` wrapped in a section, for on_click/on_change callbacks."""
+        if not self.enabled:
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with self.section(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    def _flush(self, end):
+        sections = self.sections
+        sections['total'] = (end - self.started) * 1000
+        for name, ms in sections.items():
+            reruns, total = self.history.get(name, (0, 0.0))
+            self.history[name] = (reruns + 1, total + ms)
+        now = time.strftime('%Y-%m-%dT%H:%M:%S')
+        with _log_lock, open(self.log_file, 'a', newline='') as f:
+            writer = csv.writer(f)
+            if f.tell() == 0:
+                writer.writerow(LOG_COLUMNS)
+            writer.writerows([now, self.app, self.session, self.rerun, name, round(ms, 3)]
+                             for name, ms in sections.items())
+        self.sections = {}
+        self.running = False
+        self.started = None
+        return sections
+
+    def finish(self):
+        """Ends the rerun; call it last in the script (and before st.stop())."""
+        if not self.running:
+            return
+        sections = self._flush(time.perf_counter())
+        with st.sidebar.expander(f'Rerun timings (rerun {self.rerun})'):
+            st.dataframe([{'section': name, 'ms': round(ms, 1),
+                           'session mean ms': round(self.history[name][1] / self.history[name][0], 1)}
+                          for name, ms in sections.items()], hide_index=True, use_container_width=True)
+            st.caption(f'Session {self.session}, logged to {self.log_file}')
+
+
+_disabled = RerunProfiler('', log_file=None)
+
+
+def rerun_profiler(app):
+    """The session's profiler, begun for this rerun (one that does nothing unless RERUN_PROFILE is set)."""
+    if PROFILE_LOG is None:
+        return _disabled
+    if 'rerun_profiler' not in st.session_state:
+        st.session_state['rerun_profiler'] = RerunProfiler(app)
+    return st.session_state['rerun_profiler'].begin()